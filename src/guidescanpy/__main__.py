@@ -1,13 +1,17 @@
+import os
 import sys
 import guidescanpy
 from guidescanpy.flask import create_app
 from guidescanpy.tasks import app as celery_app
+from guidescanpy.flask.core.preload import preload
+from guidescanpy.flask.blueprints.query import start_executor
 from guidescanpy.commands.decode import main as decode  # noqa: F401
 from guidescanpy.commands.generate_kmers import main as generate_kmers  # noqa: F401
 from guidescanpy.commands.add_organism import main as add_organism  # noqa: F401
 from guidescanpy.commands.init_db import main as init_db  # noqa: F401
 from guidescanpy.commands.filter_tag import main as filter_tag  # noqa: F401
 from guidescanpy.commands.add_tag import main as add_tag  # noqa: F401
+from guidescanpy.commands.build_cache import main as build_cache  # noqa: F401
 
 
 commands = (
@@ -19,6 +23,7 @@ commands = (
     "add-organism",
     "filter-tag",
     "add-tag",
+    "build-cache",
 )
 
 
@@ -30,10 +35,15 @@ def print_usage():
 
 def web(args):
     app = create_app()
+    # With debug=True, the app is served from a child process started by the reloader
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        preload()
+        start_executor()
     return app.run(host="0.0.0.0", port=5001, debug=True)
 
 
 def worker(args):
+    # Data is preloaded on worker_init (see guidescanpy.tasks)
     _worker = celery_app.Worker()
     _worker.start()
 
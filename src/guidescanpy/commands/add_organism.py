@@ -1,15 +1,67 @@
 import argparse
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
 import logging
 import gzip
+import os
+import time
 from guidescanpy.flask.db import (
-    insert_chromosome_query,
-    insert_gene_query,
-    insert_exon_query,
+    insert_chromosomes,
+    insert_genes,
+    insert_exons,
+    invalidate_genes,
 )
+from guidescanpy.flask.core.cache import clear_organism_cache
 
 logger = logging.getLogger(__name__)
 
+# Number of rows inserted into a table per transaction
+BATCH_SIZE = 50_000
+# Number of GTF lines parsed per task
+CHUNK_SIZE = 20_000
+# Number of chunks per worker process that can be read and parsed ahead of the writer
+CHUNKS_PER_PROCESS = 2
+
+
+class BulkInserter:
+    """
+    Buffers rows for bulk insertion with `insert_fn`, in batches of `batch_size` rows.
+    Rows whose primary key was seen before are skipped (the first such row is inserted).
+    """
+
+    def __init__(self, name, insert_fn, primary_key, batch_size=BATCH_SIZE):
+        self.name = name
+        self.insert_fn = insert_fn
+        self.primary_key = primary_key
+        self.batch_size = batch_size
+        self.n_rows = 0
+        self._rows = []
+        self._keys = set()
+        self._start = time.perf_counter()
+
+    def add(self, row):
+        key = tuple(row[k] for k in self.primary_key)
+        if key not in self._keys:
+            self._keys.add(key)
+            self._rows.append(row)
+            if len(self._rows) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if self._rows:
+            self.insert_fn(self._rows)
+            self.n_rows += len(self._rows)
+            self._rows = []
+
+    def close(self):
+        self.flush()
+        elapsed = time.perf_counter() - self._start
+        logger.info(
+            f"Inserted {self.n_rows} {self.name} rows in {elapsed:.1f}s ({self.n_rows / max(elapsed, 1e-9):.0f} rows/s)"
+        )
+
 
 def insert_chromosome(organism, file, delim="\t"):
     # Support both chr2acc and chromAlias formats, with the following (lower-cased)
@@ -19,6 +71,7 @@ def insert_chromosome(organism, file, delim="\t"):
     mapping = None  # one of the `mappings` keys
     header = None
     result = []
+    rows = []
 
     for line in open(file).readlines():
         if line.startswith("#"):
@@ -41,13 +94,14 @@ def insert_chromosome(organism, file, delim="\t"):
             ):  # handle blank lines (also, some rows in chromAlias files in the wild have no names/accessions!)
                 continue
 
-            insert_chromosome_query(
-                name=name,
-                accession=accession,
-                organism=organism,
-            )
+            rows.append({"name": name, "accession": accession, "organism": organism})
             result.append(accession)
 
+    inserter = BulkInserter("chromosome", insert_chromosomes, ("accession", "name"))
+    for row in rows:
+        inserter.add(row)
+    inserter.close()
+
     return result
 
 
@@ -106,54 +160,119 @@ def get_attr(result, which, multiple=False, missing_ok=False):
         return attrs[which]
 
 
-def insert_gene(result, accessions):
+def gene_rows(result, accessions):
     gene = get_attr(result, "gene", missing_ok=True)
     if gene is None:
-        return
+        return []
 
     gene_synonyms = get_attr(result, "gene_synonym", multiple=True, missing_ok=True)
     genes = [gene] + gene_synonyms
 
+    rows = []
     db_xrefs = get_attr(result, "db_xref", missing_ok=True, multiple=True)
     for db_xref in db_xrefs:
         if db_xref.startswith("GeneID:"):
             if result["chr"] in accessions:
                 entrez_id = int(db_xref[len("GeneID:") :])
                 for gene in genes:
-                    row = {
-                        "entrez_id": entrez_id,
-                        "chromosome": result["chr"],
-                        "start_pos": result["start"],
-                        "end_pos": result["end"],
-                        "gene_symbol": gene,
-                        "sense": result["sense"],
-                    }
-                    insert_gene_query(**row)
-
-
-def insert_exon(result, accessions):
+                    rows.append(
+                        {
+                            "entrez_id": entrez_id,
+                            "chromosome": result["chr"],
+                            "start_pos": result["start"],
+                            "end_pos": result["end"],
+                            "gene_symbol": gene,
+                            "sense": result["sense"],
+                        }
+                    )
+    return rows
+
+
+def exon_rows(result, accessions):
     product = get_attr(result, "product", multiple=True, missing_ok=True)
     if not product:
-        return
+        return []
     product = product[0]
     exon_number = get_attr(result, "exon_number", multiple=True)[0]
     exon_number = int(exon_number)
 
+    rows = []
     db_xrefs = get_attr(result, "db_xref", missing_ok=True, multiple=True)
     for db_xref in db_xrefs:
         if db_xref.startswith("GeneID:"):
             if result["chr"] in accessions:
                 entrez_id = int(db_xref[len("GeneID:") :])
-                row = {
-                    "entrez_id": entrez_id,
-                    "chromosome": result["chr"],
-                    "start_pos": result["start"],
-                    "end_pos": result["end"],
-                    "product": product,
-                    "exon_number": exon_number,
-                    "sense": result["sense"],
-                }
-                insert_exon_query(**row)
+                rows.append(
+                    {
+                        "entrez_id": entrez_id,
+                        "chromosome": result["chr"],
+                        "start_pos": result["start"],
+                        "end_pos": result["end"],
+                        "product": product,
+                        "exon_number": exon_number,
+                        "sense": result["sense"],
+                    }
+                )
+    return rows
+
+
+def parse_gtf_chunk(chunk, accessions):
+    """
+    Parse a (first line number, lines) `chunk` of a GTF file into a 3-tuple of its number of lines,
+    and lists of (gene rows, exon rows) on chromosomes with the given `accessions`.
+    """
+    first_line_no, lines = chunk
+    genes, exons = [], []
+    for line_no, line in enumerate(lines, start=first_line_no):
+        # Only genes and exons are of interest, so skip other lines before fully parsing them
+        parts = line.split("\t", 3)
+        if len(parts) < 3 or parts[2].strip() not in ("gene", "exon"):
+            continue
+
+        result = parse_gtf_line(line, line_no=line_no)
+        if result is None:
+            continue
+
+        if result["feature_type"] == "gene":
+            genes.extend(gene_rows(result, accessions=accessions))
+        else:
+            exons.extend(exon_rows(result, accessions=accessions))
+    return len(lines), genes, exons
+
+
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+    """
+    Split the lines of an open file `f` into (first line number, lines) chunks of `chunk_size` lines.
+    """
+    line_no = 1
+    while lines := list(islice(f, chunk_size)):
+        yield line_no, lines
+        line_no += len(lines)
+
+
+def parse_gtf(gtf_gz, accessions, processes=1, chunk_size=CHUNK_SIZE):
+    """
+    Generate the (number of lines, gene rows, exon rows) of chunks of a gzipped GTF file, in file order.
+
+    With more than one process, chunks are parsed in a process pool while the file is being
+    read and the rows of earlier chunks are consumed. At most `CHUNKS_PER_PROCESS` chunks per
+    process are in flight, so that reading does not run ahead of a slower consumer.
+    """
+    parse = partial(parse_gtf_chunk, accessions=accessions)
+    with gzip.open(gtf_gz, "rt") as f:
+        chunks = read_chunks(f, chunk_size)
+        if processes <= 1:
+            yield from map(parse, chunks)
+            return
+
+        with ProcessPoolExecutor(processes) as executor:
+            pending = deque()
+            for chunk in chunks:
+                if len(pending) >= processes * CHUNKS_PER_PROCESS:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(parse, chunk))
+            while pending:
+                yield pending.popleft().result()
 
 
 def get_parser(parser):
@@ -164,6 +283,13 @@ def get_parser(parser):
     parser.add_argument("gtf_gz", type=str, help="Raw data: gtf.gz file.")
 
     parser.add_argument("chr2acc", type=str, help="Raw data: chr2acc file.")
+
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of processes used to parse the gtf.gz file (default: number of CPUs).",
+    )
     return parser
 
 
@@ -175,24 +301,37 @@ def main(args):
     gtf_gz = args.gtf_gz
     chr2acc = args.chr2acc
 
-    chromosome_accessions = insert_chromosome(organism, chr2acc)
-
-    # https://stackoverflow.com/questions/845058
-    with gzip.open(gtf_gz, "rt") as f:
-        num_lines = sum(1 for _ in f)
-
-    with gzip.open(gtf_gz, "rt") as f:
-        for i, line in enumerate(f, start=1):
-            result = parse_gtf_line(line, line_no=i)
+    chromosome_accessions = set(insert_chromosome(organism, chr2acc))
 
-            if result is None:
-                continue
+    genes = BulkInserter(
+        "gene", insert_genes, ("entrez_id", "gene_symbol", "chromosome")
+    )
+    exons = BulkInserter(
+        "exon", insert_exons, ("entrez_id", "exon_number", "chromosome")
+    )
 
-            if result["feature_type"] == "gene":
-                insert_gene(result, accessions=chromosome_accessions)
+    start = time.perf_counter()
+    n_lines = 0
+    for chunk_lines, chunk_genes, chunk_exons in parse_gtf(
+        gtf_gz, chromosome_accessions, processes=args.processes
+    ):
+        for row in chunk_genes:
+            genes.add(row)
+        for row in chunk_exons:
+            exons.add(row)
+
+        # Logged every 100,000 lines
+        if (n_lines + chunk_lines) // 100_000 > n_lines // 100_000:
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"Annotations for {organism} - {n_lines + chunk_lines} lines completed "
+                f"({(n_lines + chunk_lines) / elapsed:.0f} lines/s)"
+            )
+        n_lines += chunk_lines
 
-            if result["feature_type"] == "exon":
-                insert_exon(result, accessions=chromosome_accessions)
+    genes.close()
+    exons.close()
 
-            if i % 10_000 == 0:
-                logger.info(f"Annotations for {organism} - {i}/{num_lines} completed")
+    # A previously built cache, and genes cached by running processes, no longer reflect the organism in the database
+    clear_organism_cache(organism)
+    invalidate_genes(organism)
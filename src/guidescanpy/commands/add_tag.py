@@ -63,7 +63,9 @@ def get_tag_value(tag_name, read, genome_structure):
 
 
 def get_tag_value_ce(read, genome_structure):
-    off_targets, off_targets_by_distance = genome_structure.off_targets_from_read(read)
+    off_targets, off_targets_by_distance = genome_structure.off_targets_from_read(
+        read, as_dicts=False
+    )
 
     # TODO: We have all off-targets in the off_targets variable,
     # as well as summary information in off_targets_by_distance
@@ -0,0 +1,69 @@
+import argparse
+import logging
+from collections import OrderedDict
+from guidescanpy.flask.db import get_chromosome_names, get_exons
+from guidescanpy.flask.core.annotation import ExonIndex
+from guidescanpy.flask.core.bam import bam_pool
+from guidescanpy.flask.core.cache import save_organism_cache
+from guidescanpy import config
+
+
+logger = logging.getLogger(__name__)
+
+
+def build_cache(organism):
+    chromosome_names = get_chromosome_names(organism, cached=False)
+    if chromosome_names is None:
+        raise ValueError(f"No chromosomes found for organism {organism}")
+    exon_index = ExonIndex.from_rows(get_exons(organism))
+
+    # Reference lengths are only cached if the bam file of the organism is available
+    reference_lengths = bam_filepath = None
+    try:
+        bam_filepath = bam_pool.filepath(organism, "cas9")
+        with bam_pool.alignment_file(bam_filepath) as bam:
+            reference_lengths = OrderedDict(zip(bam.references, bam.lengths))
+    except (AttributeError, OSError, ValueError) as e:
+        logger.warning(f"Not caching reference lengths for {organism}: {e}")
+
+    save_organism_cache(
+        organism,
+        chromosome_names=chromosome_names,
+        exon_index=exon_index,
+        reference_lengths=reference_lengths,
+        bam_filepath=bam_filepath,
+    )
+
+
+def get_parser(parser):
+    parser.add_argument(
+        "organism",
+        type=str,
+        nargs="*",
+        help="Organism(s) to build the cache for (default: all configured organisms).",
+    )
+    return parser
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description="Build memory-mapped chromosome and annotation caches."
+    )
+    args = get_parser(parser).parse_args(args)
+
+    organisms = args.organism or list(
+        config.json["guidescan"]["grna_database_path_map"]
+    )
+    n_built = 0
+    for organism in organisms:
+        try:
+            build_cache(organism)
+        except ValueError as e:
+            # Configured organisms need not all be in the database
+            if args.organism:
+                raise
+            logger.warning(f"Skipping {organism}: {e}")
+        else:
+            n_built += 1
+
+    logger.info(f"Built cache for {n_built} organism(s).")
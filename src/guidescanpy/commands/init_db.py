@@ -1,14 +1,35 @@
 import argparse
 import logging
-from guidescanpy.flask.db import get_engine
+from sqlalchemy.sql import text
+from guidescanpy.flask.db import get_engine, query_plans
 from guidescanpy.flask.tables import Base
 
 
 logger = logging.getLogger(__name__)
 
 
+def create_indexes(engine):
+    """
+    Create the indexes declared in `guidescanpy.flask.tables` that do not exist yet.
+    `create_all` only creates indexes along with their tables, so existing databases
+    are migrated here.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    # Gather the statistics that query planners use to pick among indexes
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+
 def get_parser(parser):
     parser.add_argument("--force", action="store_true", help="Force drop all tables.")
+    parser.add_argument(
+        "--explain",
+        type=str,
+        metavar="ORGANISM",
+        help="Log the query plans of the queries run for an organism.",
+    )
     return parser
 
 
@@ -21,5 +42,10 @@ def main(args):
         logger.info("Drop all tables.")
         Base.metadata.drop_all(engine)
     Base.metadata.create_all(engine)
+    create_indexes(engine)
 
     logger.info("Initialized database.")
+
+    if args.explain:
+        for name, plan in query_plans(args.explain).items():
+            logger.info(f"Query plan for {name}:\n  " + "\n  ".join(plan))
@@ -0,0 +1,255 @@
+import os
+import time
+import fcntl
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+from guidescanpy.core.guidescan import cmd_enumerate, EnumerateError
+from guidescanpy.core.kmer_cache import kmer_cache
+from guidescanpy import config
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts to take a run slot of an index when all of them are taken
+SLOT_POLL_INTERVAL = 0.05
+
+
+def index_prefix(organism):
+    """
+    The path prefix of the guidescan index files of `organism`.
+    """
+    index_dir = config.guidescan.index_files_path_prefix
+    prefix = getattr(config.guidescan.index_files_path_map, organism)
+    return os.path.join(index_dir, prefix)
+
+
+def slots_dir():
+    return os.path.join(config.guidescan.cachedir, "guidescanpy", "enumerate")
+
+
+class IndexWorker:
+    """
+    Runs `guidescan enumerate` against a single index, at most `concurrency` runs at a time,
+    with `threads` threads each. The runs are bounded across all processes that share the
+    cachedir, through `concurrency` lock files under it.
+    """
+
+    def __init__(self, index_prefix, concurrency=1, threads=1):
+        self.index_prefix = index_prefix
+        self.concurrency = concurrency
+        self.threads = threads
+        self.lock = threading.Lock()
+        self.runs = self.failures = 0
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one of the `concurrency` run slots of the index, waiting for one if all are taken.
+        """
+        os.makedirs(slots_dir(), exist_ok=True)
+        name = hashlib.sha256(self.index_prefix.encode()).hexdigest()[:16]
+        while True:
+            for i in range(self.concurrency):
+                f = open(os.path.join(slots_dir(), f"{name}.{i}.lock"), "a")
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    f.close()
+                    continue
+                # Closing the file releases the lock, also if the process dies
+                with f:
+                    yield
+                return
+            time.sleep(SLOT_POLL_INTERVAL)
+
+    def enumerate(self, kmers, **kwargs):
+        """
+        Run `cmd_enumerate` for `kmers` against the index of this worker.
+        """
+        with self.slot():
+            with self.lock:
+                self.runs += 1
+            try:
+                return cmd_enumerate(
+                    kmers,
+                    index_filepath_prefix=self.index_prefix,
+                    threads=self.threads,
+                    **kwargs,
+                )
+            except EnumerateError:
+                with self.lock:
+                    self.failures += 1
+                raise
+
+    def stats(self):
+        with self.lock:
+            return {"runs": self.runs, "failures": self.failures}
+
+
+class EnumerateManager:
+    """
+    The IndexWorkers of this process, one per index, started on first use.
+    """
+
+    def __init__(self):
+        self.workers = {}
+        self.lock = threading.Lock()
+
+    def worker(self, index_prefix):
+        with self.lock:
+            worker = self.workers.get(index_prefix)
+            if worker is None:
+                worker = IndexWorker(
+                    index_prefix,
+                    concurrency=config.guidescan.enumerate_concurrency,
+                    threads=config.guidescan.enumerate_threads,
+                )
+                self.workers[index_prefix] = worker
+            return worker
+
+    def enumerate(self, kmers, index_filepath_prefix, **kwargs):
+        return self.worker(index_filepath_prefix).enumerate(kmers, **kwargs)
+
+    def stats(self):
+        return {prefix: worker.stats() for prefix, worker in self.workers.items()}
+
+
+def split_rows(data, n):
+    """
+    The rows of each of the `n` kmers of a `cmd_enumerate` run, from its output `data`.
+    """
+    kmer_indices = data["id"].str[len("id_") :].astype(int).to_numpy()
+    order = np.argsort(kmer_indices, kind="stable")
+    bounds = np.searchsorted(kmer_indices[order], np.arange(n + 1))
+    return [data.iloc[order[bounds[i] : bounds[i + 1]]] for i in range(n)]
+
+
+def join_rows(parts):
+    """
+    The output of a `cmd_enumerate` run from the rows of each of its kmers, with ids
+    id_00000000, id_00000001, .. for the kmers, in order (the inverse of `split_rows`).
+    """
+    data = pd.concat(parts, ignore_index=True)
+    data["id"] = np.repeat(
+        [f"id_{i:08}" for i in range(len(parts))], [len(part) for part in parts]
+    )
+    return data[["id"] + [column for column in data.columns if column != "id"]]
+
+
+class _Batch:
+    def __init__(self):
+        self.kmers = {}  # kmer => index in the batch
+        self.callers = []  # (Future, batch indices of the kmers of the caller)
+        self.full = threading.Event()
+
+
+class EnumerateBatcher:
+    """
+    Gathers the kmers of concurrent `enumerate` calls with the same arguments for up to
+    `guidescan.enumerate_batch_window` seconds (or `guidescan.enumerate_batch_size` kmers),
+    and enumerates them in a single run. Calls are only held back for the window while other
+    calls are in progress in this process, so that a call on its own (e.g. in a prefork
+    Celery worker) is run right away.
+
+    The rows of the run are returned to each caller as if its kmers were enumerated on their
+    own, i.e. with ids id_00000000, id_00000001, .. for its kmers, in order.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.lock = threading.Lock()
+        self.batches = {}  # arguments => open _Batch
+        self.active = 0  # calls in progress
+        self.runs = self.calls = 0
+
+    def enumerate(self, kmers, index_filepath_prefix, **kwargs):
+        window = config.guidescan.enumerate_batch_window
+        if not window:
+            return self.manager.enumerate(kmers, index_filepath_prefix, **kwargs)
+
+        key = (index_filepath_prefix, *sorted(kwargs.items()))
+        kmers = list(kmers)
+        future = Future()
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            batch = self.batches.get(key)
+            is_leader = batch is None
+            if is_leader:
+                batch = self.batches[key] = _Batch()
+            indices = [batch.kmers.setdefault(kmer, len(batch.kmers)) for kmer in kmers]
+            batch.callers.append((future, indices))
+            if len(batch.kmers) >= config.guidescan.enumerate_batch_size:
+                # No further kmers are added to a full batch
+                del self.batches[key]
+                batch.full.set()
+            wait = self.active > 1
+
+        try:
+            if is_leader:
+                try:
+                    if wait:
+                        batch.full.wait(timeout=window)
+                finally:
+                    with self.lock:
+                        if self.batches.get(key) is batch:
+                            del self.batches[key]
+                        self.runs += 1
+                self._run(batch, index_filepath_prefix, **kwargs)
+            return future.result()
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def _run(self, batch, index_filepath_prefix, **kwargs):
+        try:
+            data = self.manager.enumerate(
+                list(batch.kmers), index_filepath_prefix, **kwargs
+            )
+            parts = split_rows(data, len(batch.kmers))
+            for future, indices in batch.callers:
+                future.set_result(join_rows([parts[i] for i in indices]))
+        except BaseException as e:
+            # Callers are never left waiting on a failed run
+            for future, _ in batch.callers:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+
+    def stats(self):
+        return {"calls": self.calls, "runs": self.runs}
+
+
+enumerate_manager = EnumerateManager()
+enumerate_batcher = EnumerateBatcher(enumerate_manager)
+
+
+def enumerate_kmers(kmers, index_filepath_prefix, **kwargs):
+    """
+    The `cmd_enumerate` output for `kmers`. The rows of kmers that are in the kmer cache are read from it
+    (unless `guidescan.enumerate_cache_size` is 0), and only the other kmers are enumerated, and cached.
+    """
+    if not config.guidescan.enumerate_cache_size:
+        return enumerate_batcher.enumerate(kmers, index_filepath_prefix, **kwargs)
+
+    try:
+        rows = kmer_cache.get(kmers, index_filepath_prefix, **kwargs)
+    except sqlite3.Error as e:
+        logger.warning(f"Unable to read the kmer cache: {e}")
+        return enumerate_batcher.enumerate(kmers, index_filepath_prefix, **kwargs)
+    missed = [kmer for kmer in dict.fromkeys(kmers) if kmer not in rows]
+    if missed:
+        data = enumerate_batcher.enumerate(missed, index_filepath_prefix, **kwargs)
+        enumerated = dict(zip(missed, split_rows(data, len(missed))))
+        try:
+            kmer_cache.set(enumerated, index_filepath_prefix, **kwargs)
+        except sqlite3.Error as e:
+            logger.warning(f"Unable to write to the kmer cache: {e}")
+        rows.update(enumerated)
+    return join_rows([rows[kmer] for kmer in kmers])
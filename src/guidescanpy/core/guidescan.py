@@ -1,7 +1,10 @@
 import subprocess
 import os
+import io
+import select
 import tempfile
 import logging
+import threading
 import pandas as pd
 from guidescanpy import config
 
@@ -22,6 +25,167 @@ CMD_ENUMERATE_COLUMN_DTYPES = {
     "specificity": float,
 }
 
+# Number of rows of `guidescan enumerate` output parsed at a time, when streamed
+STREAM_CHUNK_SIZE = 10_000
+# Number of bytes read from the output pipe of `guidescan enumerate` at a time
+READ_SIZE = 1 << 16
+
+
+class EnumerateError(RuntimeError):
+    def __init__(self, message, returncode):
+        super().__init__(message)
+        self.returncode = returncode
+
+
+def _input_lines(kmers, pam):
+    # Most of the columns we write here are never looked at by the enumerate command and thus not important!
+    yield "id,sequence,pam,chromosome,position,sense\n"
+    for i, kmer in enumerate(kmers):
+        yield f"id_{i:08},{kmer},{pam},chrI,0,+\n"
+
+
+def _cmd_parts(
+    input_path, output_path, index_filepath_prefix, mismatches, start, alt_pam, threads
+):
+    cmd_parts = [
+        config.guidescan.bin,
+        "enumerate",
+        "-f",
+        input_path,
+        "-o",
+        output_path,
+        "--mismatches",
+        f"{mismatches}",
+        "--format",
+        "csv",
+        "--threads",
+        f"{threads}",
+    ]
+
+    if start:
+        cmd_parts.append("--start")
+    if alt_pam is not None:
+        cmd_parts.extend(["--alt-pam", alt_pam])
+
+    cmd_parts.append(index_filepath_prefix)
+
+    cmd = " ".join(cmd_parts)
+    logger.info(f"Running command: {cmd}")
+    return cmd_parts
+
+
+def _check_returncode(returncode, stdout, stderr):
+    if returncode != 0:
+        logger.error("stdout:\n" + stdout)
+        logger.error("stderr:\n" + stderr)
+        raise EnumerateError(
+            f"Command returned {returncode};\nstdout={stdout};\nstderr={stderr}",
+            returncode=returncode,
+        )
+
+
+def _read_frames(f, chunk_size):
+    """
+    DataFrames of the csv rows read from the (unbuffered) file `f`, as soon as they are available,
+    batching up to about `chunk_size` rows that are available at once.
+    """
+    header, blocks, n_rows, partial = None, [], 0, b""
+    while True:
+        data = f.read(READ_SIZE)
+        # A last row without a line terminator ends with the output
+        partial += data or (partial and b"\n")
+        end = partial.rfind(b"\n") + 1
+        block, partial = partial[:end], partial[end:]
+        if header is None and block:
+            end = block.index(b"\n") + 1
+            header, block = block[:end], block[end:]
+        if block:
+            blocks.append(block)
+            n_rows += block.count(b"\n")
+
+        more = data and (n_rows < chunk_size) and select.select([f], [], [], 0)[0]
+        if blocks and not more:
+            yield pd.read_csv(
+                io.BytesIO(header + b"".join(blocks)),
+                header=0,
+                sep=",",
+                dtype=CMD_ENUMERATE_COLUMN_DTYPES,
+            )
+            blocks, n_rows = [], 0
+        if not data:
+            return
+
+
+def iter_enumerate(
+    kmers: list[str],
+    pam: str,
+    index_filepath_prefix: str,
+    mismatches: int = 4,
+    start: bool = False,
+    alt_pam=None,
+    threads: int = 1,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+):
+    """
+    Run `guidescan enumerate` for `kmers`, yielding DataFrames of its results as soon as they are
+    written (of up to about `chunk_size` rows). The kmers are fed to the process, and its results read, through pipes
+    (as /dev/fd/N paths) rather than through files on disk.
+    """
+    input_r, input_w = os.pipe()
+    output_r, output_w = os.pipe()
+    try:
+        cmd_parts = _cmd_parts(
+            f"/dev/fd/{input_r}",
+            f"/dev/fd/{output_w}",
+            index_filepath_prefix,
+            mismatches,
+            start,
+            alt_pam,
+            threads,
+        )
+        process = subprocess.Popen(
+            cmd_parts,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            pass_fds=(input_r, output_w),
+        )
+    except Exception:
+        os.close(input_w)
+        os.close(output_r)
+        raise
+    finally:
+        # Held by the process only, so that the pipes are closed when it exits
+        os.close(input_r)
+        os.close(output_w)
+
+    def feed():
+        try:
+            with open(input_w, "w") as f:
+                f.writelines(_input_lines(kmers, pam))
+        except BrokenPipeError:
+            pass  # the process exited early, which is reported by its return code
+
+    outputs = {}
+
+    def collect():
+        outputs["stdout"], outputs["stderr"] = process.communicate()
+
+    workers = [threading.Thread(target=feed), threading.Thread(target=collect)]
+    for worker in workers:
+        worker.start()
+    try:
+        with open(output_r, "rb", buffering=0) as f:
+            yield from _read_frames(f, chunk_size)
+    finally:
+        for worker in workers:
+            worker.join()
+
+    _check_returncode(
+        process.returncode,
+        outputs["stdout"].decode("utf-8"),
+        outputs["stderr"].decode("utf-8"),
+    )
+
 
 def cmd_enumerate(
     kmers: list[str],
@@ -30,51 +194,58 @@ def cmd_enumerate(
     mismatches: int = 4,
     start: bool = False,
     alt_pam=None,
+    threads: int = 1,
+    stream: bool = None,
 ) -> dict:
-    # Most of the columns we write here are never looked at by the enumerate command and thus not important!
+    """
+    Run `guidescan enumerate` for `kmers`. Its input and output are streamed through pipes
+    (see `iter_enumerate`) if `stream` (by default, `guidescan.enumerate_stream`), or written to
+    temporary files otherwise.
+    """
+    if stream is None:
+        stream = config.guidescan.enumerate_stream
+    if stream:
+        chunks = list(
+            iter_enumerate(
+                kmers,
+                pam,
+                index_filepath_prefix,
+                mismatches=mismatches,
+                start=start,
+                alt_pam=alt_pam,
+                threads=threads,
+            )
+        )
+        if not chunks:
+            return pd.DataFrame(
+                {
+                    column: pd.Series(dtype=dtype)
+                    for column, dtype in CMD_ENUMERATE_COLUMN_DTYPES.items()
+                }
+            )
+        return pd.concat(chunks, ignore_index=True)
+
     with tempfile.TemporaryDirectory() as tmp:
         with tempfile.NamedTemporaryFile(dir=tmp, mode="w", delete=False) as temp_file:
-            temp_file.write("id,sequence,pam,chromosome,position,sense\n")
-            for i, kmer in enumerate(kmers):
-                temp_file.write(f"id_{i:08},{kmer},{pam},chrI,0,+\n")
+            temp_file.writelines(_input_lines(kmers, pam))
         output_path = os.path.join(tmp, "enumerate_output.txt")
 
-        cmd_parts = [
-            config.guidescan.bin,
-            "enumerate",
-            "-f",
+        cmd_parts = _cmd_parts(
             temp_file.name,
-            "-o",
             output_path,
-            "--mismatches",
-            f"{mismatches}",
-            "--format",
-            "csv",
-            "--threads",
-            "1",
-        ]
-
-        if start:
-            cmd_parts.append("--start")
-        if alt_pam is not None:
-            cmd_parts.extend(["--alt-pam", alt_pam])
-
-        cmd_parts.append(index_filepath_prefix)
-
-        cmd = " ".join(cmd_parts)
-        logger.info(f"Running command: {cmd}")
+            index_filepath_prefix,
+            mismatches,
+            start,
+            alt_pam,
+            threads,
+        )
 
         result = subprocess.run(cmd_parts, capture_output=True)
-        stdout = result.stdout.decode("utf-8")
-        stderr = result.stderr.decode("utf-8")
-
-        returncode = result.returncode
-        if returncode != 0:
-            logger.error("stdout:\n" + stdout)
-            logger.error("stderr:\n" + stderr)
-            raise RuntimeError(
-                f"Command returned {returncode};\nstdout={stdout};\nstderr={stderr}"
-            )
+        _check_returncode(
+            result.returncode,
+            result.stdout.decode("utf-8"),
+            result.stderr.decode("utf-8"),
+        )
 
         data = pd.read_csv(
             output_path, header=0, sep=",", dtype=CMD_ENUMERATE_COLUMN_DTYPES
@@ -0,0 +1,228 @@
+import io
+import os
+import glob
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+import pandas as pd
+from guidescanpy.core.guidescan import CMD_ENUMERATE_COLUMN_DTYPES
+from guidescanpy import config
+
+logger = logging.getLogger(__name__)
+
+# Fraction of `guidescan.enumerate_cache_size` that the cache is reduced to when it is full
+EVICT_TO = 0.9
+# Seconds for which the fingerprint of the index files is reused before they are checked again
+FINGERPRINT_INTERVAL = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kmers (
+    params TEXT NOT NULL,
+    kmer TEXT NOT NULL,
+    index_prefix TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    rows BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (params, kmer)
+);
+CREATE INDEX IF NOT EXISTS ix_kmers_accessed ON kmers (accessed);
+CREATE INDEX IF NOT EXISTS ix_kmers_index_prefix ON kmers (index_prefix, fingerprint);
+"""
+
+
+def index_files(index_prefix):
+    return sorted(
+        f for f in glob.glob(f"{glob.escape(index_prefix)}.*") if os.path.isfile(f)
+    )
+
+
+def index_fingerprint(index_prefix):
+    """
+    (filepath, mtime, size) tuples of the guidescan index files with the path prefix `index_prefix`.
+    """
+    return tuple(
+        (f, os.stat(f).st_mtime_ns, os.stat(f).st_size)
+        for f in index_files(index_prefix)
+    )
+
+
+def kmer_cache_path():
+    return os.path.join(config.guidescan.cachedir, "guidescanpy", "kmers.sqlite3")
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value).encode()).hexdigest()
+
+
+class KmerCache:
+    """
+    A persistent cache of the `guidescan enumerate` rows of each kmer, in an sqlite database
+    under the cachedir that is shared by all processes. Entries are keyed by the index, the
+    (fingerprint of the) index files and the other arguments of the run, so that they are not
+    used once the index files change, and the least recently used ones are removed when the
+    cache grows beyond `guidescan.enumerate_cache_size` bytes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()  # connection of each thread
+        self.schemas = set()  # paths of the databases whose schema has been created
+        self.fingerprints = (
+            {}
+        )  # index prefix => (last fingerprint seen, time it was checked)
+        self.hits = self.misses = 0
+
+    def _connect(self):
+        """
+        The connection of this thread to the cache database, opened on first use.
+        """
+        filepath = kmer_cache_path()
+        key = (filepath, os.getpid())
+        if getattr(self.local, "key", None) != key:
+            # Connections are not used across processes, nor for a changed cachedir
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            conn = sqlite3.connect(filepath, timeout=30)
+            with self.lock:
+                created = filepath in self.schemas
+            if not created:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                with self.lock:
+                    self.schemas.add(filepath)
+            if getattr(self.local, "key", (None, None))[1] == os.getpid():
+                self.local.conn.close()
+            self.local.conn, self.local.key = conn, key
+        return self.local.conn
+
+    def _fingerprint(self, index_prefix):
+        """
+        The fingerprint of the index files, and whether it changed since it was last checked.
+        """
+        now = time.monotonic()
+        with self.lock:
+            fingerprint, checked = self.fingerprints.get(index_prefix, (None, None))
+        if checked is not None and now - checked < FINGERPRINT_INTERVAL:
+            return fingerprint, False
+        new_fingerprint = _digest(index_fingerprint(index_prefix))
+        with self.lock:
+            self.fingerprints[index_prefix] = new_fingerprint, now
+        return new_fingerprint, new_fingerprint != fingerprint
+
+    def _params(self, conn, index_prefix, kwargs):
+        fingerprint, changed = self._fingerprint(index_prefix)
+        if changed:
+            # Entries for previous versions of the index would never be used again
+            with conn:
+                conn.execute(
+                    "DELETE FROM kmers WHERE index_prefix = ? AND fingerprint != ?",
+                    (index_prefix, fingerprint),
+                )
+        params = _digest([index_prefix, fingerprint, sorted(kwargs.items())])
+        return params, fingerprint
+
+    def get(self, kmers, index_prefix, **kwargs):
+        """
+        A dict of kmer => DataFrame of the cached rows (without their id column) of
+        those of `kmers` that are in the cache.
+        """
+        conn = self._connect()
+        params, _ = self._params(conn, index_prefix, kwargs)
+        kmers = list(dict.fromkeys(kmers))
+        found = {}
+        for i in range(0, len(kmers), 500):
+            chunk = kmers[i : i + 500]
+            found.update(
+                conn.execute(
+                    f"SELECT kmer, rows FROM kmers WHERE params = ? "
+                    f"AND kmer IN ({', '.join('?' * len(chunk))})",
+                    (params, *chunk),
+                ).fetchall()
+            )
+        if found:
+            with conn:
+                conn.executemany(
+                    "UPDATE kmers SET accessed = ? WHERE params = ? AND kmer = ?",
+                    [(time.time(), params, kmer) for kmer in found],
+                )
+
+        with self.lock:
+            self.hits += len(found)
+            self.misses += len(kmers) - len(found)
+        return {
+            kmer: pd.read_csv(
+                io.BytesIO(zlib.decompress(rows)),
+                header=0,
+                dtype=CMD_ENUMERATE_COLUMN_DTYPES,
+            )
+            for kmer, rows in found.items()
+        }
+
+    def set(self, data, index_prefix, **kwargs):
+        """
+        Cache the rows of each kmer in `data`, a dict of kmer => DataFrame of its rows.
+        """
+        max_size = config.guidescan.enumerate_cache_size
+        entries = []
+        for kmer, rows in data.items():
+            blob = zlib.compress(
+                rows.drop(columns="id").to_csv(index=False).encode(), 1
+            )
+            entries.append((kmer, blob))
+
+        conn = self._connect()
+        params, fingerprint = self._params(conn, index_prefix, kwargs)
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO kmers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (params, kmer, index_prefix, fingerprint, blob, len(blob), now)
+                    for kmer, blob in entries
+                ],
+            )
+            (size,) = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM kmers"
+            ).fetchone()
+            if size > max_size:
+                # The least recently used entries beyond EVICT_TO of the maximum size
+                conn.execute(
+                    "DELETE FROM kmers WHERE rowid IN ("
+                    "  SELECT rowid FROM ("
+                    "    SELECT rowid, SUM(size) OVER (ORDER BY accessed DESC, rowid DESC) AS total"
+                    "    FROM kmers"
+                    "  ) WHERE total > ?"
+                    ")",
+                    (max_size * EVICT_TO,),
+                )
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM kmers")
+
+    def stats(self):
+        try:
+            entries, size = (
+                self._connect()
+                .execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM kmers")
+                .fetchone()
+            )
+        except sqlite3.Error:
+            entries = size = None
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "entries": entries,
+            "size": size,
+            "maxsize": config.guidescan.enumerate_cache_size,
+            "hits": hits,
+            "misses": misses,
+        }
+
+
+kmer_cache = KmerCache()
@@ -36,5 +36,10 @@ def create_app(debug=False):
     app.register_blueprint(job_sequence.bp, url_prefix="/py/job/sequence")
     app.register_blueprint(job_library.bp, url_prefix="/py/job/library")
 
+    from guidescanpy.flask.db import release_connection
+
+    # Database connections are checked out by request, and returned to the pool afterwards
+    app.teardown_appcontext(release_connection)
+
     app.add_template_global(lambda: __version__, name="app_version")
     return app
@@ -1,6 +1,9 @@
 import subprocess
 from flask import jsonify, Blueprint
 from guidescanpy import config, __version__
+from guidescanpy.flask.db import gene_cache_stats, pool_stats
+from guidescanpy.core.enumerate import enumerate_manager, enumerate_batcher
+from guidescanpy.core.kmer_cache import kmer_cache
 
 bp = Blueprint("info", __name__)
 
@@ -33,3 +36,16 @@ def example_queries():
 @bp.route("/example_sequences", methods=["GET"])
 def example_sequences():
     return jsonify(config.json["guidescan"]["example_sequences"])
+
+
+@bp.route("/stats", methods=["GET"])
+def stats():
+    return jsonify(
+        {
+            "gene-cache": gene_cache_stats(),
+            "db-pool": pool_stats(),
+            "enumerate": enumerate_manager.stats(),
+            "enumerate-batches": enumerate_batcher.stats(),
+            "kmer-cache": kmer_cache.stats(),
+        }
+    )
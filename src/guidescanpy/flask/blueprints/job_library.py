@@ -1,6 +1,7 @@
 import logging
 from flask import Blueprint, jsonify, render_template, abort
 from guidescanpy.tasks import app as tasks_app
+from guidescanpy.flask.core.results import JobResult, load_result
 
 
 bp = Blueprint("job_library", __name__)
@@ -9,7 +10,7 @@ logger = logging.getLogger(__name__)
 
 @bp.route("/<job_id>")
 def job(job_id):
-    result = tasks_app.AsyncResult(job_id)
+    result = JobResult(tasks_app.AsyncResult(job_id))
     return render_template("job_library.html", result=result)
 
 
@@ -23,7 +24,7 @@ def status(job_id):
 def result(format, job_id):
     assert format in ("json",)
     res = tasks_app.AsyncResult(job_id)
-    result = res.result
+    result = load_result(res.result)
 
     match format:
         case "json":
@@ -1,19 +1,44 @@
 import logging
-from flask import Blueprint, jsonify, render_template, make_response, abort, request
-import pandas as pd
+import zlib
+from flask import Blueprint, Response, jsonify, render_template, abort, request
+import numpy as np
 from guidescanpy.tasks import app as tasks_app
+from guidescanpy import config
 from guidescanpy.flask.core.utils import job_result
+from guidescanpy.flask.core.hits import (
+    query_result_records,
+    decode_query_result,
+    decoded_result_nbytes,
+)
+from guidescanpy.flask.core.lru import TTLCache, MISSING
+from guidescanpy.flask.core.results import JobResult, load_result
 
 
 bp = Blueprint("job_query", __name__)
 logger = logging.getLogger(__name__)
 
+# Number of hits for which output lines are generated at a time
+BLOCK_SIZE = 1000
+# Number of output lines sent to the client at a time
+LINES_PER_CHUNK = 1000
+
+# job id => decoded query result, so that pages of results are served without fetching
+# and decoding whole results from the result backend
+result_cache = TTLCache(
+    maxsize=config.guidescan.result_cache_size,
+    ttl=config.guidescan.result_cache_ttl or None,
+    maxbytes=config.guidescan.result_cache_bytes,
+    sizeof=decoded_result_nbytes,
+)
+
 
 @bp.route("/<job_id>")
 @job_result
 def job(job_id):
     result = tasks_app.AsyncResult(job_id)
     if result.status == "SUCCESS":
+        # Decoded, and cached, for the pages of results requested next
+        result = JobResult(result, get_decoded_result(job_id))
         # TODO: Is there a cleaner way to do this?
         first_region = (
             list(result.result["queries"].values())[0]["region"]
@@ -31,11 +56,30 @@ def status(job_id):
     return jsonify({"status": res.status})
 
 
+def get_decoded_result(job_id):
+    """
+    The query result of a job, as decoded by `decode_query_result`.
+    """
+    result = result_cache.get(job_id)
+    if result is MISSING:
+        result = decode_query_result(load_result(tasks_app.AsyncResult(job_id).result))
+        result_cache.set(job_id, result)
+    return result
+
+
 def get_result(job_id, region=None, start=0, end=None, orderby=None, asc=True):
     """
     return a full result dictionary for non-DataTable use, a 'hits' dictionary for DataTable use.
     """
-    result = tasks_app.AsyncResult(job_id).result
+    result = get_decoded_result(job_id)
+    return query_result_records(result, region, start, end, orderby, asc)
+
+
+def get_hits(job_id, region=None, start=0, end=None, orderby=None, asc=True):
+    """
+    An iterator of (region, Hits) tuples for a job, with hits sorted by `orderby` and sliced to [start, end).
+    """
+    result = get_decoded_result(job_id)
 
     if region is None:
         regions = result["queries"].keys()
@@ -43,22 +87,143 @@ def get_result(job_id, region=None, start=0, end=None, orderby=None, asc=True):
         assert region in result["queries"], f"Region {region} not found in results"
         regions = [region]
 
-    for region in regions:
+    def region_hits(region):
         value = result["queries"][region]
-        hits = pd.DataFrame(value["hits"])
-        total_hits = len(hits)
-        if orderby:
-            hits.sort_values(by=orderby, ascending=asc, inplace=True)
-        hits = hits[start:end]
-        hits = hits.to_dict("records")
-
-        result["queries"][region] = {
-            "region": value["region"],
-            "hits": hits,
-            "total_hits": total_hits,
-        }
+        hits = value["hits"]
+        indices = (
+            hits.order(orderby, ascending=asc, orders=value["orders"])
+            if orderby
+            else np.arange(len(hits))
+        )
+        return region, hits.take(indices[start:end])
 
-    return result
+    return map(region_hits, regions)
+
+
+def blocks(hits, block_size=BLOCK_SIZE):
+    """
+    Yield (index of first hit, Hits) tuples for consecutive blocks of at most `block_size` hits.
+    """
+    for start in range(0, len(hits), block_size):
+        yield start, hits.take(np.arange(start, min(start + block_size, len(hits))))
+
+
+def bed_lines(hits_by_region):
+    yield 'track name="guideRNAs"'
+    for _, region_hits in hits_by_region:
+        for _, hits in blocks(region_hits):
+            for coordinate, start, end, strand, region_string in zip(
+                hits.columns["coordinate"],
+                hits.columns["start"].tolist(),
+                hits.columns["end"].tolist(),
+                hits.columns["direction"],
+                hits.columns["region-string"],
+            ):
+                chr = coordinate.split(":")[0]
+                start -= 1  # convert from 1-indexed inclusive to 0-indexed inclusive; end remains unchanged
+                yield f"{chr}\t{start}\t{end}\t{region_string}\t0\t{strand}"
+
+
+def csv_lines(hits_by_region, offtarget=False):
+    if offtarget:
+        yield (
+            "Region-name,gRNA-ID,gRNA-Seq,Number of off-targets,"
+            "Off-target summary,Off-target accession,Off-target chromosome,"
+            "Off-target direction,Off-target distance,Off-target position,"
+            "Off-target region-string,"
+            "Cutting efficiency,Specificity,GC,Rank,Coordinates,Strand,Annotations"
+        )
+    else:
+        yield (
+            "Region-name,gRNA-ID,gRNA-Seq,Number of off-targets,"
+            "Off-target summary,Cutting efficiency,Specificity,GC,Rank,Coordinates,Strand,Annotations"
+        )
+
+    for _, region_hits in hits_by_region:
+        for first, hits in blocks(region_hits):
+            yield from _csv_lines(hits, first, offtarget=offtarget)
+
+
+def _csv_lines(hits, first, offtarget=False):
+    """
+    CSV lines of `hits`, the first of which is hit number `first` (0-indexed) of its region.
+    """
+    # Off-target columns, in the order in which they appear in the output
+    off_target_columns = (
+        "accession",
+        "chromosome",
+        "direction",
+        "distance",
+        "position",
+        "region-string",
+    )
+    no_off_target = ("",) * len(off_target_columns)
+
+    columns = hits.column_lists()
+    if offtarget:
+        off_targets = {k: v.tolist() for k, v in hits.off_targets.items()}
+        off_targets["region-string"] = hits.off_target_region_strings()
+        off_targets = list(zip(*(off_targets[k] for k in off_target_columns)))
+        offsets = hits.off_target_offsets.tolist()
+
+    for i in range(len(hits)):
+        rank = first + i + 1
+        head = (
+            columns["region-string"][i],
+            columns["region-string"][i] + f".{rank}",
+            columns["sequence"][i],
+            columns["n-off-targets"][i],
+            columns["off-target-summary"][i],
+        )
+        tail = (
+            columns["cutting-efficiency"][i],
+            columns["specificity"][i],
+            columns["gc-content"][i],
+            rank,
+            columns["coordinate"][i],
+            columns["direction"][i],
+            columns["annotations"][i],
+        )
+        if offtarget:
+            for off_target in off_targets[offsets[i] : offsets[i + 1]] or [
+                no_off_target
+            ]:
+                yield ",".join(str(x) for x in head + off_target + tail)
+        else:
+            yield ",".join(str(x) for x in head + tail)
+
+
+def stream_response(lines, mimetype):
+    """
+    A streamed response with newline-separated `lines`, sent in chunks of `LINES_PER_CHUNK` lines.
+    With `guidescan.export_gzip`, the response is gzip-compressed for clients that accept it.
+    """
+
+    def chunks():
+        batch = []
+        separator = ""
+        for line in lines:
+            batch.append(line)
+            if len(batch) == LINES_PER_CHUNK:
+                yield separator + "\n".join(batch)
+                batch, separator = [], "\n"
+        if batch:
+            yield separator + "\n".join(batch)
+
+    def gzipped(chunks):
+        compressor = zlib.compressobj(wbits=31)  # gzip format
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode())
+            if data:
+                yield data
+        yield compressor.flush()
+
+    if config.guidescan.export_gzip and "gzip" in request.accept_encodings:
+        response = Response(gzipped(chunks()), mimetype=mimetype)
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+    return Response(chunks(), mimetype=mimetype)
 
 
 @bp.route("/result/<format>/<job_id>", defaults={"offtarget": False})
@@ -73,112 +238,21 @@ def result(format, job_id, offtarget):
         if request.args.get("limit") is not None
         else None
     )
-    result = get_result(job_id, region, start, end, orderby, asc)
 
     match format:
         case "json":
+            result = get_result(job_id, region, start, end, orderby, asc)
             return jsonify(result)
 
         case "bed":
-            lines = ['track name="guideRNAs"']
-
-            for _, v in result["queries"].items():
-                for hit in v["hits"]:
-                    chr = hit["coordinate"].split(":")[0]
-                    start, end = hit["start"], hit["end"]
-                    start -= 1  # convert from 1-indexed inclusive to 0-indexed inclusive; end remains unchanged
-                    strand = hit["direction"]
-                    region_string = hit["region-string"]
-                    lines.append(f"{chr}\t{start}\t{end}\t{region_string}\t0\t{strand}")
-
-            response = "\n".join(lines)
-            response = make_response(response, 200)
-            response.mimetype = "text/plain"
-            return response
+            hits_by_region = get_hits(job_id, region, start, end, orderby, asc)
+            return stream_response(bed_lines(hits_by_region), mimetype="text/plain")
 
         case "csv":
-            if offtarget:
-                lines = [
-                    "Region-name,gRNA-ID,gRNA-Seq,Number of off-targets,"
-                    "Off-target summary,Off-target accession,Off-target chromosome,"
-                    "Off-target direction,Off-target distance,Off-target position,"
-                    "Off-target region-string,"
-                    "Cutting efficiency,Specificity,GC,Rank,Coordinates,Strand,Annotations"
-                ]
-            else:
-                lines = [
-                    "Region-name,gRNA-ID,gRNA-Seq,Number of off-targets,"
-                    "Off-target summary,Cutting efficiency,Specificity,GC,Rank,Coordinates,Strand,Annotations"
-                ]
-
-            for _, v in result["queries"].items():
-                for i, hit in enumerate(v["hits"], start=1):
-                    if offtarget:
-                        n_off_targets = hit["n-off-targets"]
-                        if n_off_targets == 0:
-                            hit["off-targets"].append(
-                                {
-                                    "accession": "",
-                                    "chromosome": "",
-                                    "direction": "",
-                                    "distance": "",
-                                    "position": "",
-                                    "region-string": "",
-                                }
-                            )
-                        for off_target in range(max(1, n_off_targets)):
-                            lines.append(
-                                ",".join(
-                                    str(x)
-                                    for x in [
-                                        hit["region-string"],
-                                        hit["region-string"] + f".{i}",
-                                        hit["sequence"],
-                                        hit["n-off-targets"],
-                                        hit["off-target-summary"],
-                                        hit["off-targets"][off_target]["accession"],
-                                        hit["off-targets"][off_target]["chromosome"],
-                                        hit["off-targets"][off_target]["direction"],
-                                        hit["off-targets"][off_target]["distance"],
-                                        hit["off-targets"][off_target]["position"],
-                                        hit["off-targets"][off_target]["region-string"],
-                                        hit["cutting-efficiency"],
-                                        hit["specificity"],
-                                        hit["gc-content"],
-                                        i,
-                                        hit["coordinate"],
-                                        hit["direction"],
-                                        hit["annotations"],
-                                    ]
-                                )
-                            )
-                        if n_off_targets == 0:
-                            hit["off-targets"] = []
-                    else:
-                        lines.append(
-                            ",".join(
-                                str(x)
-                                for x in [
-                                    hit["region-string"],
-                                    hit["region-string"] + f".{i}",
-                                    hit["sequence"],
-                                    hit["n-off-targets"],
-                                    hit["off-target-summary"],
-                                    hit["cutting-efficiency"],
-                                    hit["specificity"],
-                                    hit["gc-content"],
-                                    i,
-                                    hit["coordinate"],
-                                    hit["direction"],
-                                    hit["annotations"],
-                                ]
-                            )
-                        )
-
-            response = "\n".join(lines)
-            response = make_response(response, 200)
-            response.mimetype = "text/csv"
-            return response
+            hits_by_region = get_hits(job_id, region, start, end, orderby, asc)
+            return stream_response(
+                csv_lines(hits_by_region, offtarget=offtarget), mimetype="text/csv"
+            )
 
         case _:
             abort(415)  # Unsupported Media Type
@@ -2,6 +2,7 @@ import logging
 from flask import Blueprint, jsonify, render_template
 from guidescanpy.tasks import app as tasks_app
 from guidescanpy.flask.core.utils import job_result
+from guidescanpy.flask.core.results import JobResult
 
 
 bp = Blueprint("job_sequence", __name__)
@@ -11,7 +12,7 @@ logger = logging.getLogger(__name__)
 @bp.route("/<job_id>")
 @job_result
 def job(job_id):
-    result = tasks_app.AsyncResult(job_id)
+    result = JobResult(tasks_app.AsyncResult(job_id))
     return render_template("job_sequence.html", result=result)
 
 
@@ -58,17 +58,29 @@ def library(
     # TODO: Why is this \r\n and not just \n?
     genes = genes.splitlines()
 
-    library_info = get_library_info_by_gene(organism, genes, n_guides)
-
     genes_by_pool_index = np.array_split(np.array(genes), n_pools)
+    # TODO: randomize
+    essential_genes_by_pool_index = [
+        get_essential_genes(organism, round(frac_essential * len(pool_genes)))
+        for pool_genes in genes_by_pool_index
+    ]
+
+    # Guides for all genes, including essential ones, are looked up at once
+    library_info = get_library_info_by_gene(
+        organism,
+        list(genes) + [g for pool in essential_genes_by_pool_index for g in pool],
+        n_guides,
+    )
+
+    # Copied, since guides for genes in the library are modified below
+    essential_genes_library_info_by_pool_index = [
+        {gene: [dict(grna) for grna in library_info[gene]] for gene in pool}
+        for pool in essential_genes_by_pool_index
+    ]
+
     results = []
     for i, genes in enumerate(genes_by_pool_index):
-        n_essential_genes = round(frac_essential * len(genes))
-        # TODO: randomize
-        essential_genes = get_essential_genes(organism, n_essential_genes)
-        essential_genes_library_info = get_library_info_by_gene(
-            organism, essential_genes, n_guides
-        )
+        essential_genes_library_info = essential_genes_library_info_by_pool_index[i]
 
         n_control_guides = round(
             frac_control * len(genes)
@@ -1,16 +1,28 @@
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 from flask import Blueprint, redirect, url_for, request
 from guidescanpy.flask.core.genome import get_genome_structure
+from guidescanpy.flask.core.hits import query_result_records
+from guidescanpy.flask.db import dispose_engine
 from guidescanpy.exceptions import GuidescanException
 from guidescanpy import config
 
 bp = Blueprint("query", __name__)
+logger = logging.getLogger(__name__)
+
+# Number of shards of regions per process, when querying regions in parallel
+SHARDS_PER_PROCESS = 4
 
 
 @bp.route("", methods=["GET"])
 def query_endpoint(args={}):
     args = args or request.args
     if config.celery.eager:
-        return query(args)
+        return query_result_records(query(args))
     else:
         from guidescanpy.tasks import query as f
 
@@ -46,22 +58,109 @@ def query(args):
             f"Parsed genomic regions length exceeds {region_limit}, the maximum allowed."
         )
 
-    for region in regions:
-        result = genome_structure.query(
-            region,
-            enzyme=enzyme,
-            topn=topn,
-            min_specificity=min_specificity,
-            min_ce=min_ce,
-            min_gc=min_gc,
-            max_gc=max_gc,
-            pattern_avoid=pattern_avoid,
-            filter_annotated=filter_annotated,
-        )
+    results = query_regions(
+        organism,
+        regions,
+        enzyme=enzyme,
+        topn=topn,
+        min_specificity=min_specificity,
+        min_ce=min_ce,
+        min_gc=min_gc,
+        max_gc=max_gc,
+        pattern_avoid=pattern_avoid,
+        filter_annotated=filter_annotated,
+    )
+
+    for region, result in zip(regions, results):
         if result:
             queries[region["region-name"]] = {
-                "region": result[0]["region-string"],
-                "hits": result,
+                "region": result.columns["region-string"][0],
+                "total_hits": len(result),
+                "hits": result.to_json(),
             }
 
     return {"organism": organism, "enzyme": enzyme, "queries": queries}
+
+
+def query_shard(organism, regions, **kwargs):
+    """
+    Query `regions` of `organism` one after the other, returning a list of Hits (or None).
+    """
+    genome_structure = get_genome_structure(organism)
+    return [
+        genome_structure.query(region, as_columns=True, **kwargs) for region in regions
+    ]
+
+
+def shards(regions, n_shards):
+    """
+    Split `regions` into at most `n_shards` contiguous lists of regions of roughly equal total size.
+    """
+    sizes = [end - start + 1 for _, start, end in (r["coords"] for r in regions)]
+    # Shard i ends with the first region at which the cumulative size reaches (i + 1) / n_shards of the total
+    cumulative = np.cumsum(sizes)
+    ends = np.searchsorted(
+        cumulative, cumulative[-1] * np.arange(1, n_shards + 1) / n_shards, side="left"
+    )
+    ends = np.unique(np.minimum(ends + 1, len(regions)))
+    starts = np.concatenate([[0], ends[:-1]])
+    return [regions[i:j] for i, j in zip(starts.tolist(), ends.tolist())]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def start_executor():
+    """
+    Start the pool of `guidescan.query_parallelism` processes over which the regions of queries are
+    queried, if it is greater than 1. The processes are forked from this process, so this is called
+    when a web or worker process starts, before any requests are handled, and never from request
+    threads. If the pool cannot be started, regions are queried serially in this process.
+    """
+    global _executor
+    parallelism = int(config.guidescan.query_parallelism)
+    with _executor_lock:
+        if _executor is not None or parallelism <= 1:
+            return
+        try:
+            executor = ProcessPoolExecutor(
+                max_workers=parallelism,
+                # Forked processes inherit the genome structures and annotations of this process
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=dispose_engine,
+            )
+            # All processes of the pool are forked on its first task
+            executor.submit(int).result()
+        except (AssertionError, OSError, BrokenProcessPool) as e:
+            # Processes cannot always be started (for example, from a daemonic process)
+            logger.warning(f"Unable to query regions in parallel: {e}")
+        else:
+            _executor = executor
+
+
+def stop_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def query_regions(organism, regions, **kwargs):
+    """
+    Query `regions` of `organism`, returning a list of Hits (or None), in the order of `regions`.
+    With a `guidescan.query_parallelism` greater than 1, shards of regions are queried in parallel
+    on a pool of that many processes, once it is started (see `start_executor`).
+    """
+    parallelism = int(config.guidescan.query_parallelism)
+    executor = _executor
+    if parallelism <= 1 or executor is None or len(regions) <= 1:
+        return query_shard(organism, regions, **kwargs)
+
+    # Several shards per process even out differences in the time taken by each shard
+    _shards = shards(regions, n_shards=parallelism * SHARDS_PER_PROCESS)
+    futures = [
+        executor.submit(query_shard, organism, shard, **kwargs) for shard in _shards
+    ]
+    return [result for future in futures for result in future.result()]
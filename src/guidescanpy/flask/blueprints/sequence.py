@@ -1,8 +1,8 @@
-import os.path
+import numpy as np
 import pandas as pd
 from flask import Blueprint, redirect, url_for, request
 from guidescanpy import config
-from guidescanpy.core.guidescan import cmd_enumerate
+from guidescanpy.core.enumerate import enumerate_kmers, index_prefix
 from guidescanpy.flask.core.genome import GenomeStructure
 from guidescanpy.exceptions import GuidescanException
 
@@ -53,68 +53,116 @@ def sequence(args):
     else:
         raise RuntimeError(f"Unexpected enzyme {enzyme}")
 
-    index_dir = config.guidescan.index_files_path_prefix
-    index_prefix = getattr(config.guidescan.index_files_path_map, organism)
-    index_prefix = os.path.join(index_dir, index_prefix)
-
-    data = cmd_enumerate(
+    data = enumerate_kmers(
         kmers=sequences,
         pam=pam,
-        index_filepath_prefix=index_prefix,
+        index_filepath_prefix=index_prefix(organism),
         start=start,
         alt_pam=alt_pam,
         mismatches=mismatches,
     )
 
     genome_structure = GenomeStructure(organism=organism)
+    matches = sequence_matches(data, genome_structure.acc_to_chr, mismatches)
 
-    matches = {}
-    for kmer_id, kmer_data in data.groupby("id"):
-        first_record = kmer_data.iloc[0]
-        position = first_record["match_position"]
-        specificity = first_record["specificity"]
-        sequence = first_record["sequence"]
-        kmer_length = len(sequence)
+    results = {"organism": organism, "matches": matches}
+    return results
 
+
+def sequence_matches(data, acc_to_chr, mismatches):
+    """
+    The matches (by kmer id) of a sequence search, from the `cmd_enumerate` output `data`.
+
+    The coordinate, specificity and sequence of a kmer are those of its first row, and its off-targets
+    are those of its rows on chromosomes (as opposed to scaffolds etc.), by distance.
+    """
+    id_codes, ids = pd.factorize(data["id"], sort=True)
+    lengths = data["sequence"].str.len().to_numpy()
+    positions = data["match_position"]
+    distances = data["match_distance"].to_numpy()
+
+    # Accessions are mapped to chromosome names once per distinct accession
+    accessions = data["match_chrm"].astype("category")
+    chromosome_names = np.array(
+        [acc_to_chr.get(accession) for accession in accessions.cat.categories]
+        + [None],  # for missing accessions, whose code is -1
+        dtype=object,
+    )
+    chromosomes = chromosome_names[accessions.cat.codes.to_numpy()]
+
+    # Off-targets, sorted by kmer and distance (and otherwise in the order of `data`)
+    rows = np.flatnonzero(pd.notna(chromosomes))
+    rows = rows[np.lexsort((distances[rows], id_codes[rows]))]
+    # Note: The CSV 'position' is always the lower-in-value 1-indexed left position, regardless of strand
+    starts = positions.to_numpy()[rows].astype(np.int64)
+    ends = starts + lengths[rows] - 1
+    strands = data["match_strand"].to_numpy()[rows]
+    coordinates = (
+        pd.Series(chromosomes[rows], dtype=object)
+        + ":"
+        + pd.Series(starts).astype(str)
+        + "-"
+        + pd.Series(ends).astype(str)
+        + ":"
+        + pd.Series(strands, dtype=object)
+    )
+    off_targets = [
+        {
+            "position": start,
+            "direction": strand,
+            "distance": distance,
+            "accession": accession,
+            "coordinate": coordinate,
+        }
+        for start, strand, distance, accession, coordinate in zip(
+            starts.tolist(),
+            strands.tolist(),
+            distances[rows].tolist(),
+            data["match_chrm"].to_numpy()[rows].tolist(),
+            coordinates.tolist(),
+        )
+    ]
+
+    # Off-targets of each (kmer, distance), as slices of `off_targets`
+    counts = np.zeros((len(ids), mismatches + 1), dtype=np.int64)
+    np.add.at(counts, (id_codes[rows], distances[rows]), 1)
+    bounds = np.concatenate([[0], np.cumsum(counts)]).tolist()
+
+    _, first_rows = np.unique(id_codes, return_index=True)
+    first_records = data.iloc[first_rows]
+    matches = {}
+    for i, (
+        kmer_id,
+        position,
+        accession,
+        direction,
+        specificity,
+        sequence,
+    ) in enumerate(
+        zip(
+            ids,
+            first_records["match_position"].tolist(),
+            first_records["match_chrm"].tolist(),
+            first_records["match_strand"].tolist(),
+            first_records["specificity"].tolist(),
+            first_records["sequence"].tolist(),
+        )
+    ):
         if pd.isna(position):  # no matches, no mismatches
             coordinate = "NA"
         else:
-            accession = first_record["match_chrm"]
-            direction = first_record["match_strand"]
-            start = position
-            end = start + kmer_length  # end is always > start regardless of strand
-            coordinate = genome_structure.to_coordinate_string(
-                accession=accession,
-                start=start,
-                end=end,
-                direction=direction,
-                is_one_indexed=True,
-            )
-
-        offtargets = {distance: [] for distance in range(0, mismatches + 1)}
-        num_offtargets = 0
-        for distance, distance_data in kmer_data.groupby("match_distance"):
-            for _, row in distance_data.iterrows():
-                match_accession = row["match_chrm"]
-                match_chromosome = genome_structure.acc_to_chr.get(match_accession)
-                if match_chromosome is None:
-                    continue  # ignore offtargets on scaffolds etc.
-
-                num_offtargets += 1
-                match_strand = row["match_strand"]
-                # Note: The CSV 'position' is always the lower-in-value 1-indexed left position,
-                # regardless of strand
-                match_start = row["match_position"]
-                match_end = match_start + kmer_length - 1
-                off_target = {
-                    "position": match_start,
-                    "direction": match_strand,
-                    "distance": distance,
-                    "accession": match_accession,
-                    "coordinate": f"{match_chromosome}:{match_start}-{match_end}:{match_strand}",
-                }
-                offtargets[distance].append(off_target)
+            # end is always > start regardless of strand
+            coordinate = f"{acc_to_chr[accession]}:{position}-{position + len(sequence) - 1}:{direction}"
 
+        offtargets = {
+            distance: off_targets[bounds[j] : bounds[j + 1]]
+            for distance, j in enumerate(
+                range(i * (mismatches + 1), (i + 1) * (mismatches + 1))
+            )
+        }
+        num_offtargets = (
+            bounds[(i + 1) * (mismatches + 1)] - bounds[i * (mismatches + 1)]
+        )
         matches[kmer_id] = {
             "coordinate": coordinate,
             "specificity": specificity,
@@ -128,5 +176,4 @@ def sequence(args):
             "off-targets": offtargets,
         }
 
-    results = {"organism": organism, "matches": matches}
-    return results
+    return matches
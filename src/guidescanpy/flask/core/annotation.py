@@ -0,0 +1,157 @@
+import os
+import logging
+import numpy as np
+from guidescanpy.flask.core.hits import concatenated_ranges
+
+logger = logging.getLogger(__name__)
+
+
+class ExonIndex:
+    """
+    Sorted-array index of exon annotations, supporting batched overlap queries.
+
+    The exons on each accession are stored as a structured array with 0-indexed, half-open
+    [start, end) coordinates, sorted by start position. Together with the length of the longest
+    exon on the accession, this bounds the range of exons that can overlap any query interval
+    to a contiguous slice, which is found by binary search.
+    """
+
+    def __init__(self, exons):
+        self.exons = exons  # accession => structured array of exons
+        self.max_lengths = {
+            accession: int((a["end"] - a["start"]).max()) if len(a) else 0
+            for accession, a in exons.items()
+        }
+
+    def __contains__(self, accession):
+        return accession in self.exons
+
+    def __len__(self):
+        return sum(len(a) for a in self.exons.values())
+
+    @staticmethod
+    def _array(starts, ends, exon_numbers, products):
+        products = np.array(products, dtype=str)
+        exons = np.empty(
+            len(starts),
+            dtype=[
+                ("start", np.int64),
+                ("end", np.int64),
+                ("exon_number", np.int64),
+                # Fixed-width strings, so that arrays can be memory-mapped
+                ("product", products.dtype if len(products) else "U1"),
+            ],
+        )
+        exons["start"], exons["end"] = starts, ends
+        exons["exon_number"], exons["product"] = exon_numbers, products
+        # Sorted by (start, end, exon_number, product), without duplicates (as in an IntervalTree)
+        return np.unique(exons)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Create an ExonIndex from (accession, start, end, exon_number, product) rows, with
+        1-indexed inclusive [start, end] coordinates (as stored in the exons table).
+        """
+        columns = {}
+        for accession, start, end, exon_number, product in rows:
+            if accession not in columns:
+                columns[accession] = [], [], [], []
+            starts, ends, exon_numbers, products = columns[accession]
+            # Convert 1-indexed [start, end] to 0-indexed [start, end)
+            starts.append(start - 1)
+            ends.append(end)
+            exon_numbers.append(exon_number)
+            products.append(product)
+
+        return cls(
+            {
+                accession: cls._array(*_columns)
+                for accession, _columns in columns.items()
+            }
+        )
+
+    @classmethod
+    def from_interval_trees(cls, interval_trees):
+        """
+        Create an ExonIndex from a dict of accession => intervaltree.IntervalTree, with
+        (exon_number, product) data, as returned by `db.get_chromosome_interval_trees`.
+        """
+        exons = {}
+        for accession, tree in interval_trees.items():
+            intervals = list(tree)
+            exons[accession] = cls._array(
+                [interval.begin for interval in intervals],
+                [interval.end for interval in intervals],
+                [interval.data[0] for interval in intervals],
+                [interval.data[1] for interval in intervals],
+            )
+        return cls(exons)
+
+    @classmethod
+    def load(cls, dirpath, mmap_mode="r"):
+        """
+        Load an ExonIndex saved with `save`, memory-mapping its arrays by default.
+        """
+        exons = {}
+        for filename in sorted(os.listdir(dirpath)):
+            if filename.endswith(".npy"):
+                exons[filename[: -len(".npy")]] = np.load(
+                    os.path.join(dirpath, filename), mmap_mode=mmap_mode
+                )
+        return cls(exons)
+
+    def save(self, dirpath):
+        """
+        Save this ExonIndex as one .npy file per accession in `dirpath`.
+        """
+        os.makedirs(dirpath, exist_ok=True)
+        for accession, exons in self.exons.items():
+            # Write to a temporary file first, so that readers never see a partial array
+            filepath = os.path.join(dirpath, f"{accession}.npy")
+            with open(filepath + ".tmp", "wb") as f:
+                np.save(f, exons)
+            os.replace(filepath + ".tmp", filepath)
+        logger.info(f"Saved {len(self)} exons to {dirpath}")
+
+    def overlaps(self, accession, begins, ends):
+        """
+        All overlaps between the 0-indexed, half-open query intervals [begins, ends) and the
+        exons on `accession`. Returns a 2-tuple of equal-length (query index, exon index) arrays,
+        ordered by query, and then by exon start/end positions.
+        """
+        begins = np.asarray(begins, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        exons = self.exons.get(accession)
+        if exons is None or not len(exons) or not len(begins):
+            return np.array([], dtype=int), np.array([], dtype=int)
+
+        # An exon [start, end) overlaps a query [begin, end) iff start < end and end > begin.
+        # Since no exon is longer than max_length, only exons with start > begin - max_length
+        # can satisfy the latter.
+        starts = exons["start"]
+        lo = np.searchsorted(starts, begins - self.max_lengths[accession], side="right")
+        hi = np.searchsorted(starts, ends, side="left")
+        counts = np.maximum(hi - lo, 0)
+
+        queries = np.repeat(np.arange(len(begins)), counts)
+        rows = concatenated_ranges(lo, counts)
+        keep = exons["end"][rows] > begins[queries]
+        return queries[keep], rows[keep]
+
+    def annotations(self, accession, begins, ends):
+        """
+        Annotation strings ("Exon <exon_number> of <product>", separated by ';') for the
+        0-indexed, half-open query intervals [begins, ends) on `accession`.
+        """
+        results = [[] for _ in range(len(begins))]
+        queries, rows = self.overlaps(accession, begins, ends)
+        if len(rows):
+            exons = self.exons[accession][rows]
+            for query, exon_number, product in zip(
+                queries.tolist(),
+                exons["exon_number"].tolist(),
+                exons["product"].tolist(),
+            ):
+                results[query].append(f"Exon {exon_number} of {product}")
+        return [";".join(annotations) for annotations in results]
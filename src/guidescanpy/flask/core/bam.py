@@ -0,0 +1,105 @@
+import os
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+import pysam
+from guidescanpy import config
+
+logger = logging.getLogger(__name__)
+
+
+class BamPool:
+    """
+    A per-process, thread-safe pool of open pysam.AlignmentFile handles.
+
+    Each handle loads its index once on open and is then reused across regions,
+    requests and Celery tasks. A handle is only ever used by one thread at a time.
+    Handles are re-opened when the modification time of the bam file changes, and
+    are discarded in child processes after a fork. At most `max_idle` (by default,
+    `guidescan.bam_pool_max_idle`) unused handles are kept open per bam file.
+    """
+
+    def __init__(self, max_idle=None):
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._filepaths = {}  # (organism, enzyme) => bam filepath
+        self._mtimes = {}  # bam filepath => mtime of the file when last opened
+        self._idle = defaultdict(list)  # bam filepath => [(mtime, AlignmentFile)]
+
+    def filepath(self, organism, enzyme="cas9"):
+        key = organism, enzyme
+        if key not in self._filepaths:
+            bam_dir = config.guidescan.grna_database_path_prefix
+            bam_filename = getattr(
+                getattr(config.guidescan.grna_database_path_map, organism), enzyme
+            )
+            self._filepaths[key] = os.path.join(bam_dir, bam_filename)
+        return self._filepaths[key]
+
+    def _open(self, filepath):
+        bam = pysam.AlignmentFile(filepath, "r")
+        if not bam.has_index():
+            logger.warning("Index not found! Attempting to create index.")
+            bam.close()
+            pysam.index(filepath)
+            bam = pysam.AlignmentFile(filepath, "r")
+        logger.debug(f"Opened {filepath}")
+        return bam
+
+    def _acquire(self, filepath):
+        mtime = os.stat(filepath).st_mtime_ns
+        with self._lock:
+            if self._mtimes.get(filepath) != mtime:
+                # The file has changed (or was never opened) - stale handles are closed
+                for _, bam in self._idle.pop(filepath, []):
+                    bam.close()
+                self._mtimes[filepath] = mtime
+            idle = self._idle[filepath]
+            if idle:
+                return idle.pop()
+        return mtime, self._open(filepath)
+
+    def _release(self, filepath, handle):
+        mtime, bam = handle
+        max_idle = self.max_idle
+        if max_idle is None:
+            max_idle = config.guidescan.bam_pool_max_idle
+        with self._lock:
+            idle = self._idle[filepath]
+            if self._mtimes.get(filepath) == mtime and len(idle) < max_idle:
+                idle.append(handle)
+                return
+        # Stale, or beyond the handles kept for bursts of concurrent use
+        bam.close()
+
+    @contextmanager
+    def alignment_file(self, filepath=None, organism=None, enzyme="cas9"):
+        """
+        Context manager that checks out an open pysam.AlignmentFile, for either an
+        explicit `filepath` or the configured bam file of an `organism`/`enzyme`.
+        """
+        if filepath is None:
+            filepath = self.filepath(organism, enzyme)
+        handle = self._acquire(filepath)
+        try:
+            yield handle[1]
+        finally:
+            self._release(filepath, handle)
+
+    def clear(self):
+        with self._lock:
+            for handles in self._idle.values():
+                for _, bam in handles:
+                    bam.close()
+            self._idle.clear()
+            self._mtimes.clear()
+
+    def _after_fork(self):
+        # Handles (and a lock possibly held by another thread) are not shared with child processes
+        self._lock = threading.Lock()
+        self.clear()
+
+
+bam_pool = BamPool()
+os.register_at_fork(after_in_child=bam_pool._after_fork)
@@ -0,0 +1,147 @@
+import os
+import json
+import shutil
+import logging
+from collections import OrderedDict
+import numpy as np
+from guidescanpy.flask.core.annotation import ExonIndex
+from guidescanpy import config
+
+logger = logging.getLogger(__name__)
+
+# Files in the cache directory of an organism
+CHROMOSOMES_FILENAME = "chromosomes.npy"
+LENGTHS_FILENAME = "lengths.npy"
+EXONS_DIRNAME = "exons"
+META_FILENAME = "meta.json"
+
+
+def organism_cache_path(organism):
+    return os.path.join(config.guidescan.cachedir, "guidescanpy", organism)
+
+
+def _string_dtype(values):
+    # Fields of (memory-mappable) structured arrays are fixed-width strings
+    return f"U{max([1] + [len(v) for v in values])}"
+
+
+def _file_fingerprint(filepath):
+    stat = os.stat(filepath)
+    return {"path": filepath, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def save_organism_cache(
+    organism, chromosome_names, exon_index, reference_lengths=None, bam_filepath=None
+):
+    """
+    Write the chromosome map, exon index and (optionally) reference lengths of an organism
+    as memory-mappable .npy files in its cache directory, replacing any existing cache.
+
+    chromosome_names: dict of accession => chromosome name (with a 'chr' prefix)
+    exon_index: an ExonIndex
+    reference_lengths: ordered dict of accession => length, as found in the header of `bam_filepath`
+    """
+    dirpath = organism_cache_path(organism)
+    tmp_dirpath = f"{dirpath}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dirpath, ignore_errors=True)
+    os.makedirs(tmp_dirpath)
+
+    chromosomes = np.array(
+        list(chromosome_names.items()),
+        dtype=[
+            ("accession", _string_dtype(chromosome_names.keys())),
+            ("name", _string_dtype(chromosome_names.values())),
+        ],
+    )
+    np.save(os.path.join(tmp_dirpath, CHROMOSOMES_FILENAME), chromosomes)
+
+    meta = {"organism": organism, "bam": None}
+    if reference_lengths is not None:
+        lengths = np.array(
+            list(reference_lengths.items()),
+            dtype=[
+                ("accession", _string_dtype(reference_lengths.keys())),
+                ("length", np.int64),
+            ],
+        )
+        np.save(os.path.join(tmp_dirpath, LENGTHS_FILENAME), lengths)
+        meta["bam"] = _file_fingerprint(bam_filepath)
+
+    exon_index.save(os.path.join(tmp_dirpath, EXONS_DIRNAME))
+
+    with open(os.path.join(tmp_dirpath, META_FILENAME), "w") as f:
+        json.dump(meta, f)
+
+    # Swap in the new cache directory, so that readers never see a partially written cache
+    old_dirpath = f"{dirpath}.old-{os.getpid()}"
+    if os.path.exists(dirpath):
+        os.rename(dirpath, old_dirpath)
+    os.rename(tmp_dirpath, dirpath)
+    shutil.rmtree(old_dirpath, ignore_errors=True)
+    logger.info(f"Saved cache for {organism} to {dirpath}")
+
+
+def genes_version_path(organism):
+    return os.path.join(config.guidescan.cachedir, "guidescanpy", f"{organism}.genes")
+
+
+def genes_version(organism):
+    """
+    A value that changes whenever `touch_genes_version` is called for an organism (in any process).
+    """
+    try:
+        return os.stat(genes_version_path(organism)).st_mtime_ns
+    except OSError:
+        return None
+
+
+def touch_genes_version(organism):
+    filepath = genes_version_path(organism)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, "a"):
+        os.utime(filepath)
+
+
+def clear_organism_cache(organism):
+    shutil.rmtree(organism_cache_path(organism), ignore_errors=True)
+
+
+def load_chromosome_names(organism):
+    """
+    The cached dict of accession => chromosome name for an organism, or None if not cached.
+    """
+    filepath = os.path.join(organism_cache_path(organism), CHROMOSOMES_FILENAME)
+    if not os.path.exists(filepath):
+        return None
+    chromosomes = np.load(filepath, mmap_mode="r")
+    return dict(zip(chromosomes["accession"].tolist(), chromosomes["name"].tolist()))
+
+
+def load_reference_lengths(organism, bam_filepath):
+    """
+    The cached ordered dict of accession => length for an organism, or None if not cached
+    or if `bam_filepath` is not the (unchanged) bam file that the lengths were read from.
+    """
+    dirpath = organism_cache_path(organism)
+    filepath = os.path.join(dirpath, LENGTHS_FILENAME)
+    if not os.path.exists(filepath):
+        return None
+    with open(os.path.join(dirpath, META_FILENAME)) as f:
+        meta = json.load(f)
+    try:
+        if meta["bam"] != _file_fingerprint(bam_filepath):
+            return None
+    except OSError:
+        return None
+    lengths = np.load(filepath, mmap_mode="r")
+    return OrderedDict(zip(lengths["accession"].tolist(), lengths["length"].tolist()))
+
+
+def load_exon_index(organism):
+    """
+    The cached (memory-mapped) ExonIndex of an organism, or None if not cached.
+    """
+    dirpath = os.path.join(organism_cache_path(organism), EXONS_DIRNAME)
+    if not os.path.isdir(dirpath):
+        return None
+    return ExonIndex.load(dirpath)
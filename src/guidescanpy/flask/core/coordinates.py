@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class CoordinateMapper:
+    """
+    Maps the signed absolute genome positions used in guidescan off-target information
+    to (reference, 0-indexed position, strand), for scalars or arrays of positions.
+
+    Absolute positions index into the concatenation of all references, in the order in which
+    they appear in the bam header, and are negative for matches on the - strand. The reference
+    of a position is found by a binary search over the cumulative reference lengths.
+    """
+
+    def __init__(self, names, lengths):
+        self.names = np.array(names, dtype=object)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.absolute_genome = np.insert(np.cumsum(self.lengths), 0, 0)
+
+    @classmethod
+    def from_header(cls, sq):
+        """
+        Create a CoordinateMapper from the "SQ" records of a SAM/BAM header.
+        """
+        return cls([r["SN"] for r in sq], [r["LN"] for r in sq])
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @property
+    def length(self):
+        return int(self.absolute_genome[-1])
+
+    def find_references(self, absolute_positions):
+        """
+        Indices of the references on which (unsigned) `absolute_positions` lie, i.e. the indices
+        of the rightmost elements of `absolute_genome` that are not greater than them.
+        """
+        references = (
+            np.searchsorted(self.absolute_genome, absolute_positions, side="right") - 1
+        )
+        if np.any(references >= len(self)):
+            raise IndexError("Position beyond the end of the genome")
+        return references
+
+    def to_coordinates(self, positions):
+        """
+        Map an array of signed absolute `positions` to a 3-tuple of arrays of
+        (reference indices, 0-indexed positions on the references, whether on the + strand).
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        absolute_positions = np.abs(positions)
+        references = self.find_references(absolute_positions)
+        return (
+            references,
+            absolute_positions - self.absolute_genome[references],
+            positions > 0,
+        )
+
+    def __call__(self, position):
+        """
+        Map a single signed absolute `position` to a (reference name, 0-indexed position, strand) tuple.
+        """
+        references, positions, is_forward = self.to_coordinates([position])
+        return (
+            self.names[references[0]],
+            int(positions[0]),
+            "+" if is_forward[0] else "-",
+        )
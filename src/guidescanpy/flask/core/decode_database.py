@@ -7,6 +7,8 @@ import binascii
 
 from Bio import SeqIO
 
+from guidescanpy.flask.core.coordinates import CoordinateMapper
+
 from functools import reduce
 
 
@@ -42,14 +44,10 @@ def hex_to_offtargetinfo(hexstr, delim):
 
 
 def map_int_to_coord(x, genome, onebased=False):
-    strand = "+" if x > 0 else "-"
-    x = abs(x)
-    i = 0
-    while genome[i]["LN"] <= x:
-        x -= genome[i]["LN"]
-        i += 1
-    chrom = genome[i]["SN"]
-    coord = x
+    # `genome` is either the "SQ" records of a SAM/BAM header, or a CoordinateMapper
+    if not isinstance(genome, CoordinateMapper):
+        genome = CoordinateMapper.from_header(genome)
+    chrom, coord, strand = genome(x)
     if onebased:
         coord += 1
     t = (chrom, coord, strand)
@@ -118,12 +116,21 @@ def decode_off_targets(sam_record, genome, delim, fasta_record_dict):
     if not sam_record.has_tag("of"):
         return
 
+    if not isinstance(genome, CoordinateMapper):
+        genome = CoordinateMapper.from_header(genome)
+
     ots = sam_record.get_tag("of")
     ots = hex_to_offtargetinfo(ots, delim)
+    distances = [distance for distance, _ in ots]
+    references, positions, is_forward = genome.to_coordinates([pos for _, pos in ots])
 
     count = 0
-    for distance, pos in ots:
-        chrm, pos, strand = map_int_to_coord(pos, genome)
+    for distance, chrm, pos, strand in zip(
+        distances,
+        genome.names[references].tolist(),
+        positions.tolist(),
+        np.where(is_forward, "+", "-").tolist(),
+    ):
 
         sgrna = sam_record.query_sequence
         if sam_record.is_reverse:
@@ -275,6 +282,7 @@ if __name__ == "__main__":
     args = parse_args()
 
     sam_db, delim, genome = load_guide_db(args.grna_database)
+    genome = CoordinateMapper.from_header(genome)
     fasta_dict = SeqIO.to_dict(SeqIO.parse(args.fasta_file, "fasta"))
 
     def decode_ot(record):
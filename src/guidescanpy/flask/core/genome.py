@@ -1,18 +1,27 @@
-import os.path
 import re
 from functools import lru_cache
+from itertools import islice
 from collections import OrderedDict, defaultdict
 import numpy as np
 import pandas as pd
-import pysam
 import logging
-from intervaltree import Interval
 from guidescanpy.flask.db import (
     get_chromosome_names,
-    get_chromosome_interval_trees,
+    get_exon_index,
 )
-from guidescanpy.flask.core.utils import hex_to_offtarget_info
+from guidescanpy.flask.core.utils import hex_to_offtarget_arrays
 from guidescanpy.flask.core.parser import region_parser
+from guidescanpy.flask.core.bam import bam_pool
+from guidescanpy.flask.core.coordinates import CoordinateMapper
+from guidescanpy.flask.core.cache import load_reference_lengths
+from guidescanpy.flask.core.hits import (
+    Hits,
+    HIT_COLUMNS,
+    MIN_DISTANCES,
+    TopN,
+    off_target_region_strings,
+    specificity_keys,
+)
 from guidescanpy import config
 
 
@@ -20,9 +29,53 @@ from guidescanpy import config
 #   https://github.com/pritykinlab/guidescan-web/blob/f22066ac15dbb42ad1ee6cad2cfdc553518f6ae9/src/guidescan_web/query/process.clj#L58
 ANNOTATION_MAGIC = True
 
+# Scalar hit columns that are cheap to read from each alignment in a query, and on which
+# filters are applied before any off-targets or annotations are decoded
+READ_COLUMNS = (
+    "id",
+    "query-sequence",
+    "gc-content",
+    "sequence",
+    "start",
+    "end",
+    "direction",
+    "cutting-efficiency",
+    "specificity",
+)
+
+# Number of alignments read from a bam file at a time in a query
+FETCH_CHUNK_SIZE = 4096
+
 logger = logging.getLogger(__name__)
 
 
+def pattern_avoid_regex(pattern_avoid):
+    """
+    A compiled regular expression that matches `pattern_avoid` (which may contain N/V wildcards)
+    or its reverse complement.
+    """
+    wildcard_to_nuc = {"N": "ACTG", "V": "ACG"}
+    nuc_map = {"A": "T", "T": "A", "C": "G", "G": "C"}
+    patterns_avoid = [pattern_avoid]
+
+    # Replace the two wildcards with all possible representations of nucleotides and store them in patterns_avoid
+    for wildcard in wildcard_to_nuc:
+        if any(wildcard in pattern for pattern in patterns_avoid):
+            patterns_avoid = [
+                pattern.replace(wildcard, x)
+                for x in wildcard_to_nuc[wildcard]
+                for pattern in patterns_avoid
+                if wildcard in pattern
+            ]
+
+    # Also add the reverse complemented patterns to patterns_avoid
+    patterns_avoid.extend(
+        ["".join(list(map(lambda n: nuc_map[n], dna))[::-1]) for dna in patterns_avoid]
+    )
+
+    return re.compile("|".join(re.escape(pattern) for pattern in patterns_avoid))
+
+
 @lru_cache(maxsize=32)
 def get_genome_structure(organism, bam_filepath=None):
     return GenomeStructure(organism=organism, bam_filepath=bam_filepath)
@@ -47,18 +100,35 @@ class GenomeStructure:
         self.chr_to_acc = {v: k for k, v in self.acc_to_chr.items()}
 
         if bam_filepath is None:
-            bam_dir = config.guidescan.grna_database_path_prefix
-            bam_filename = getattr(
-                getattr(config.guidescan.grna_database_path_map, organism), "cas9"
-            )
-            bam_filepath = os.path.join(bam_dir, bam_filename)
-
-        with pysam.AlignmentFile(bam_filepath, "r") as bam:
-            self.acc_to_length = OrderedDict(zip(bam.references, bam.lengths))
-            # TODO: The following 2 attributes are not required if we have self.acc_to_length, and can be obsoleted
-            self.genome = bam.lengths, bam.references
-            self.absolute_genome = np.insert(np.cumsum(bam.lengths), 0, 0)
-            self.off_target_delim = -(self.absolute_genome[-1] + 1)
+            bam_filepath = bam_pool.filepath(organism, "cas9")
+
+        # Reference lengths are read from the organism cache if it was built from this bam file
+        self.acc_to_length = None
+        if organism is not None:
+            self.acc_to_length = load_reference_lengths(organism, bam_filepath)
+        if self.acc_to_length is None:
+            with bam_pool.alignment_file(bam_filepath) as bam:
+                self.acc_to_length = OrderedDict(zip(bam.references, bam.lengths))
+
+        # TODO: The following 2 attributes are not required if we have self.acc_to_length, and can be obsoleted
+        self.genome = tuple(self.acc_to_length.values()), tuple(self.acc_to_length)
+        self.coordinate_mapper = CoordinateMapper(self.genome[1], self.genome[0])
+        self.absolute_genome = self.coordinate_mapper.absolute_genome
+        self.off_target_delim = -(self.absolute_genome[-1] + 1)
+
+        # Per-reference lookup tables, indexed by the position of each reference in the bam header.
+        # Chromosome names (without the 'chr' prefix) are None for contigs/scaffolds.
+        self.reference_accessions = np.array(self.genome[1], dtype=object)
+        self.reference_chromosomes = np.array(
+            [
+                self.acc_to_chr[acc][3:] if acc in self.acc_to_chr else None
+                for acc in self.genome[1]
+            ],
+            dtype=object,
+        )
+        self.reference_is_chromosome = np.array(
+            [acc in self.acc_to_chr for acc in self.genome[1]], dtype=bool
+        )
 
     def _all_regions(self):
         regions = []
@@ -124,21 +194,10 @@ class GenomeStructure:
         Find the index of the value in `self.absolute_genome` sorted array using binary search.
         If the value is not found, return the index of the rightmost element whose value is less than the search value.
         """
-        # to_genomic_coordinates works well enough for now
-        raise NotImplementedError
+        return self.coordinate_mapper.find_references(absolute_coords)
 
     def to_genomic_coordinates(self, pos):
-        strand = "+" if pos > 0 else "-"
-        x = abs(pos)
-        i = 0
-        while self.genome[0][i] <= x:
-            x -= self.genome[0][i]
-            i += 1
-
-        chrom = self.genome[1][i]
-        coord = x
-
-        return chrom, coord, strand
+        return self.coordinate_mapper(pos)
 
     def to_coordinate_string(
         self,
@@ -194,53 +253,91 @@ class GenomeStructure:
             end = start + reference_length - 1
         return f"{chromosome}:{start}-{end}"
 
-    def off_targets_from_read(self, read):
-        offtarget_hex = read.get_tag("of")
-        off_target_tuples = hex_to_offtarget_info(
-            offtarget_hex, delim=self.off_target_delim
+    def off_target_arrays(self, read):
+        """
+        Decode the off-targets of a read into columnar arrays.
+        Returns a 2-tuple of (off_targets, off_targets_by_distance), where `off_targets` is a dict
+        of equal-length arrays with the keys position/chromosome/direction/distance/accession.
+        """
+        distances, positions = hex_to_offtarget_arrays(
+            read.get_tag("of"), delim=self.off_target_delim
         )
-        total_off_target_tuples = len(
-            off_target_tuples
-        )  # This will be used to get the number of 0-off-target
 
+        off_targets_by_distance = defaultdict(int)
         # Remove off-target entries with distance = 0 (should be just the first, but we go through all anyway)
-        off_target_tuples = tuple(t for t in off_target_tuples if t[0] != 0)
+        is_exact = distances == 0
+        off_targets_by_distance[0] = int(np.count_nonzero(is_exact))
+        distances, positions = distances[~is_exact], positions[~is_exact]
 
-        off_targets = []
-        off_targets_by_distance = defaultdict(int)
-        off_targets_by_distance[0] = total_off_target_tuples - len(off_target_tuples)
-        for dist, pos in off_target_tuples:
-            dist = int(dist)
-            (
-                genomic_chrom,
-                genomic_coord,
-                genomic_strand,
-            ) = self.to_genomic_coordinates(pos)
-
-            # If the off-target is on a contig/scaffold, ignore it
-            if genomic_chrom not in self.acc_to_chr:
-                continue
-
-            # remove 'chr' prefix
-            chr = (
-                self.acc_to_chr[genomic_chrom][3:]
-                if genomic_chrom in self.acc_to_chr
-                else None
-            )
+        # Map absolute positions to (reference, 0-indexed position on reference)
+        references, positions, is_forward = self.coordinate_mapper.to_coordinates(
+            positions
+        )
+
+        # If the off-target is on a contig/scaffold, ignore it
+        keep = self.reference_is_chromosome[references]
+        references = references[keep]
+
+        off_targets = {
+            "position": positions[keep],
+            "chromosome": self.reference_chromosomes[references],
+            "direction": np.where(is_forward[keep], "+", "-"),
+            "distance": distances[keep],
+            "accession": self.reference_accessions[references],
+        }
+
+        for distance, count in zip(
+            *np.unique(off_targets["distance"], return_counts=True)
+        ):
+            off_targets_by_distance[int(distance)] += int(count)
+
+        return off_targets, off_targets_by_distance
+
+    def n_off_targets(self, read):
+        """
+        The number of off-targets of a read, as in the "n-off-targets" column of its hit.
+        """
+        off_targets, _ = self.off_target_arrays(read)
+        return len(off_targets["position"])
+
+    def off_target_region_strings(self, off_targets, reference_length):
+        """
+        Vectorized counterpart of `off_target_region_string`, for columnar `off_targets`.
+        """
+        return off_target_region_strings(
+            off_targets["chromosome"],
+            off_targets["position"],
+            off_targets["direction"],
+            reference_length,
+        )
 
-            off_target = {
-                "position": int(genomic_coord),
-                "chromosome": chr,
-                "direction": genomic_strand,
-                "distance": dist,
-                "accession": genomic_chrom,
+    def off_target_dicts(self, off_targets, reference_length):
+        """
+        Convert columnar `off_targets` (as returned by `off_target_arrays`) into a list of dicts.
+        """
+        return [
+            {
+                "position": position,
+                "chromosome": chromosome,
+                "direction": direction,
+                "distance": distance,
+                "accession": accession,
+                "region-string": region_string,
             }
-            off_target["region-string"] = self.off_target_region_string(
-                off_target, read.reference_length
+            for position, chromosome, direction, distance, accession, region_string in zip(
+                off_targets["position"].tolist(),
+                off_targets["chromosome"].tolist(),
+                off_targets["direction"].tolist(),
+                off_targets["distance"].tolist(),
+                off_targets["accession"].tolist(),
+                self.off_target_region_strings(off_targets, reference_length),
             )
-            off_targets.append(off_target)
-            off_targets_by_distance[dist] += 1
+        ]
 
+    def off_targets_from_read(self, read, as_dicts=True):
+        off_targets, off_targets_by_distance = self.off_target_arrays(read)
+        if as_dicts:
+            off_targets = self.off_target_dicts(off_targets, read.reference_length)
         return off_targets, off_targets_by_distance
 
     def query(
@@ -257,6 +354,7 @@ class GenomeStructure:
         as_dataframe=False,
         bam_filepath=None,
         reorder=True,
+        as_columns=False,
     ):
         chromosome, start_pos, end_pos = region["coords"]
         if chromosome not in self.chr_to_acc:
@@ -264,11 +362,7 @@ class GenomeStructure:
         chromosome = self.chr_to_acc[chromosome]
 
         if bam_filepath is None:
-            bam_dir = config.guidescan.grna_database_path_prefix
-            bam_filename = getattr(
-                getattr(config.guidescan.grna_database_path_map, self.organism), enzyme
-            )
-            bam_filepath = os.path.join(bam_dir, bam_filename)
+            bam_filepath = bam_pool.filepath(self.organism, enzyme)
 
         # Certain legacy .bam files have incorrect POS fields. We maintain an offset
         # to add to any alignment read we get from the .bam file
@@ -279,141 +373,230 @@ class GenomeStructure:
         else:
             read_offset = 0
 
-        results = []
-
-        with pysam.AlignmentFile(bam_filepath, "r") as bam:
-            if not bam.has_index():
-                logger.warning("Index not found! Attempting to create index.")
-                pysam.index(bam_filepath)
-
-        with pysam.AlignmentFile(bam_filepath, "r") as bam:
-            for i, read in enumerate(bam.fetch(chromosome, start_pos, end_pos)):
-                annotations = []
-                interval_tree = get_chromosome_interval_trees().get(chromosome)
-
-                this_interval = Interval(read.reference_start - 1, read.reference_end)
-                if ANNOTATION_MAGIC:
-                    cut_offset = 6
-                    if read.is_forward:
-                        this_interval = Interval(
-                            read.reference_end - cut_offset - 1,
-                            read.reference_end - cut_offset,
-                        )
-                    else:
-                        this_interval = Interval(
-                            read.reference_start + cut_offset,
-                            read.reference_start + cut_offset + 1,
-                        )
-
-                if interval_tree is not None and interval_tree.overlap(this_interval):
-                    overlaps = interval_tree[this_interval.begin : this_interval.end]
-                    for overlap in overlaps:
-                        exon, product = overlap.data
-                        annotations.append(f"Exon {exon} of {product}")
-
-                off_targets, off_targets_by_distance = self.off_targets_from_read(read)
-
-                cutting_efficiency = specificity = None
-                if read.has_tag("ce"):  # new guidescan BAM format
-                    cutting_efficiency = read.get_tag("ce")
-                elif read.has_tag("ds"):  # old guidescan BAM format
-                    cutting_efficiency = read.get_tag("ds")
-                if read.has_tag("sp"):  # new guidescan BAM format
-                    specificity = read.get_tag("sp")
-                elif read.has_tag("cs"):  # old guidescan BAM format
-                    specificity = read.get_tag("cs")
-
-                sequence = read.get_forward_sequence()
-                if enzyme == "cas9":
-                    sequence_no_pam = sequence[:-3]
-                else:
-                    sequence_no_pam = sequence[4:]
-                gc_content = (
-                    sequence_no_pam.count("G") + sequence_no_pam.count("C")
-                ) / 20
-
-                result = {
-                    "id": read.query_name,
-                    "query-sequence": read.query_sequence,
-                    "gc-content": gc_content,
-                    "reference-name": read.reference_name,
-                    "offtargets-by-distance": off_targets_by_distance,
-                    "coordinate": self.to_coordinate_string(read, offset=read_offset),
-                    "sequence": sequence,
-                    "start": read.reference_start
-                    + 1
-                    + read_offset,  # 0-indexed inclusive -> 1-indexed inclusive
-                    "end": read.reference_end
-                    + read_offset,  # 0-indexed exclusive -> 1-indexed inclusive
-                    "direction": "+" if read.is_forward else "-",
-                    "cutting-efficiency": cutting_efficiency,
-                    "specificity": specificity,
-                    "off-targets": off_targets,
-                    "off-target-summary": f"2:{off_targets_by_distance[2]}|3:{off_targets_by_distance[3]}",
-                    "n-off-targets": len(off_targets),
-                    "annotations": ";".join(annotations),
-                }
-
-                if result["start"] >= start_pos and result["end"] <= end_pos:
-                    results.append(result)
-
-        results = pd.DataFrame(results)
-        results[
-            "region-string"
-        ] = f"{self.acc_to_chr[chromosome]}:{start_pos}-{end_pos}"
-
-        if not results.empty:
-            # Only filter on specificity when enzyme is cas9, since specificity values are NA otherwise
-            if min_specificity is not None and enzyme == "cas9":
-                results = results[results["specificity"] >= min_specificity]
-
-            # Only filter on cutting efficiency when enzyme is cas9, since specificity values are NA otherwise
-            if min_ce is not None and enzyme == "cas9":
-                results = results[results["cutting-efficiency"] >= min_ce]
-
-            if min_gc is not None:
-                results = results[results["gc-content"] >= min_gc]
-            if max_gc is not None:
-                results = results[results["gc-content"] <= max_gc]
-
-            if pattern_avoid is not None:
-                wildcard_to_nuc = {"N": "ACTG", "V": "ACG"}
-                nuc_map = {"A": "T", "T": "A", "C": "G", "G": "C"}
-                patterns_avoid = [pattern_avoid]
-
-                # Replace the two wildcards with all possible representations of nucleotides and store them in patterns_avoid
-                for wildcard in wildcard_to_nuc:
-                    if any(wildcard in pattern for pattern in patterns_avoid):
-                        patterns_avoid = [
-                            pattern.replace(wildcard, x)
-                            for x in wildcard_to_nuc[wildcard]
-                            for pattern in patterns_avoid
-                            if wildcard in pattern
-                        ]
-
-                # Also add the reverse complemented patterns to patterns_avoid
-                patterns_avoid.extend(
-                    [
-                        "".join(list(map(lambda n: nuc_map[n], dna))[::-1])
-                        for dna in patterns_avoid
-                    ]
+        if pattern_avoid is not None:
+            exclude_reg = pattern_avoid_regex(pattern_avoid)
+
+        # Hits surviving all filters are collected as (read, scalar column values, annotation) items.
+        # When only the top-n hits are required, at most n of them (plus any that tie on specificity
+        # and number of off-targets with the n-th best) are held at any time. Off-targets are only
+        # counted for hits whose specificity ties with, or is better than, that of the n-th best.
+        select_top = reorder and topn is not None
+        items = (
+            TopN(topn, tiebreak=lambda item: self.n_off_targets(item[0]))
+            if select_top
+            else []
+        )
+
+        with bam_pool.alignment_file(bam_filepath) as bam:
+            fetch = bam.fetch(chromosome, start_pos, end_pos)
+            while reads := list(islice(fetch, FETCH_CHUNK_SIZE)):
+                # Cheap filters, applied as masks on the scalar columns of each chunk of reads.
+                # Off-targets and annotations are not decoded yet.
+                columns = self.read_columns(
+                    reads, enzyme=enzyme, read_offset=read_offset
                 )
+                mask = (columns["start"] >= start_pos) & (columns["end"] <= end_pos)
+
+                # Only filter on specificity when enzyme is cas9, since specificity values are NA otherwise
+                if min_specificity is not None and enzyme == "cas9":
+                    mask &= columns["specificity"] >= min_specificity
+
+                # Only filter on cutting efficiency when enzyme is cas9, since specificity values are NA otherwise
+                if min_ce is not None and enzyme == "cas9":
+                    mask &= columns["cutting-efficiency"] >= min_ce
 
-                exclude_reg = "|".join(re.escape(pattern) for pattern in patterns_avoid)
-                results = results[~results["sequence"].str.contains(exclude_reg)]
+                if min_gc is not None:
+                    mask &= columns["gc-content"] >= min_gc
+                if max_gc is not None:
+                    mask &= columns["gc-content"] <= max_gc
 
-            if filter_annotated:
-                results = results[results["annotations"] != ""]
+                indices = np.flatnonzero(mask)
 
-            if reorder:
-                results = results.sort_values(
-                    by=["specificity", "n-off-targets"], ascending=[False, True]
+                if pattern_avoid is not None:
+                    keep = [
+                        exclude_reg.search(seq) is None
+                        for seq in columns["sequence"][indices]
+                    ]
+                    indices = indices[np.array(keep, dtype=bool)]
+
+                # Annotations are looked up for survivors only when filtering on them
+                # (otherwise they are only looked up for the final hits)
+                annotations = [None] * len(indices)
+                if filter_annotated:
+                    annotations = self.read_annotations(
+                        chromosome, [reads[i] for i in indices]
+                    )
+                    keep = [annotation != "" for annotation in annotations]
+                    indices = indices[np.array(keep, dtype=bool)]
+                    annotations = [a for a, _keep in zip(annotations, keep) if _keep]
+
+                chunk_items = zip(
+                    [reads[i] for i in indices],
+                    zip(*(columns[k][indices].tolist() for k in READ_COLUMNS)),
+                    annotations,
                 )
+                if select_top:
+                    for key, item in zip(
+                        specificity_keys(columns["specificity"][indices]).tolist(),
+                        chunk_items,
+                    ):
+                        items.add(key, item)
+                else:
+                    items.extend(chunk_items)
+                    # Without reordering, the first n hits are the top-n hits
+                    if topn is not None and len(items) >= topn:
+                        break
+
+        if select_top:
+            items = items.items()
+        else:
+            items = items[:topn]
+
+        reads = [read for read, _, _ in items]
+        columns = {
+            k: np.array([values[j] for _, values, _ in items], dtype=HIT_COLUMNS[k])
+            for j, k in enumerate(READ_COLUMNS)
+        }
+
+        # Off-targets are only decoded for the remaining hits
+        off_targets, off_targets_by_distance = [], []
+        for read in reads:
+            read_off_targets, read_off_targets_by_distance = self.off_target_arrays(
+                read
+            )
+            off_targets.append(read_off_targets)
+            off_targets_by_distance.append(read_off_targets_by_distance)
+        columns["n-off-targets"] = np.array(
+            [len(o["position"]) for o in off_targets],
+            dtype=HIT_COLUMNS["n-off-targets"],
+        )
 
-            results = results[:topn]
-            results.reset_index(inplace=True, drop=True)
+        order = np.arange(len(items))
+        if reorder:
+            # Descending specificity (missing values last), then ascending number of off-targets
+            order = np.lexsort(
+                (columns["n-off-targets"], specificity_keys(columns["specificity"]))
+            )[:topn]
+        columns = {k: v[order] for k, v in columns.items()}
+
+        annotations = [items[i][2] for i in order.tolist()]
+        unannotated = [
+            i for i, annotation in enumerate(annotations) if annotation is None
+        ]
+        for i, annotation in zip(
+            unannotated,
+            self.read_annotations(chromosome, [reads[order[i]] for i in unannotated]),
+        ):
+            annotations[i] = annotation
+        columns["annotations"] = np.array(annotations, dtype=HIT_COLUMNS["annotations"])
+
+        hits = self.hits(
+            accession=chromosome,
+            region_string=f"{self.acc_to_chr[chromosome]}:{start_pos}-{end_pos}",
+            columns=columns,
+            off_targets=[off_targets[i] for i in order.tolist()],
+            off_targets_by_distance=[
+                off_targets_by_distance[i] for i in order.tolist()
+            ],
+        )
 
-        if as_dataframe:
-            return results
+        if as_columns:
+            return hits
+        elif as_dataframe:
+            return hits.to_dataframe()
         else:
-            return results.to_dict("records")
+            return hits.to_records()
+
+    def read_columns(self, reads, enzyme="cas9", read_offset=0):
+        """
+        Scalar columns (READ_COLUMNS) of `reads`, as arrays.
+        """
+        columns = {k: [] for k in READ_COLUMNS}
+        for read in reads:
+            cutting_efficiency = specificity = None
+            if read.has_tag("ce"):  # new guidescan BAM format
+                cutting_efficiency = read.get_tag("ce")
+            elif read.has_tag("ds"):  # old guidescan BAM format
+                cutting_efficiency = read.get_tag("ds")
+            if read.has_tag("sp"):  # new guidescan BAM format
+                specificity = read.get_tag("sp")
+            elif read.has_tag("cs"):  # old guidescan BAM format
+                specificity = read.get_tag("cs")
+
+            sequence = read.get_forward_sequence()
+            if enzyme == "cas9":
+                sequence_no_pam = sequence[:-3]
+            else:
+                sequence_no_pam = sequence[4:]
+            gc_content = (sequence_no_pam.count("G") + sequence_no_pam.count("C")) / 20
+
+            columns["id"].append(read.query_name)
+            columns["query-sequence"].append(read.query_sequence)
+            columns["gc-content"].append(gc_content)
+            columns["sequence"].append(sequence)
+            # 0-indexed inclusive -> 1-indexed inclusive
+            columns["start"].append(read.reference_start + 1 + read_offset)
+            # 0-indexed exclusive -> 1-indexed inclusive
+            columns["end"].append(read.reference_end + read_offset)
+            columns["direction"].append("+" if read.is_forward else "-")
+            columns["cutting-efficiency"].append(cutting_efficiency)
+            columns["specificity"].append(specificity)
+
+        return {k: np.array(v, dtype=HIT_COLUMNS[k]) for k, v in columns.items()}
+
+    def read_annotations(self, accession, reads):
+        """
+        Exon annotation strings of `reads` on `accession`, based on their cut sites.
+        """
+        is_forward = np.array([read.is_forward for read in reads], dtype=bool)
+        reference_start = np.array([read.reference_start for read in reads], dtype=int)
+        reference_end = np.array([read.reference_end for read in reads], dtype=int)
+
+        if ANNOTATION_MAGIC:
+            cut_offset = 6
+            begin = np.where(
+                is_forward,
+                reference_end - cut_offset - 1,
+                reference_start + cut_offset,
+            )
+            end = begin + 1
+        else:
+            begin, end = reference_start - 1, reference_end
+
+        return get_exon_index(self.organism).annotations(accession, begin, end)
+
+    def hits(
+        self, accession, region_string, columns, off_targets, off_targets_by_distance
+    ):
+        """
+        Create a Hits object for reads on `accession`, given their (filtered) scalar columns,
+        off-targets (as returned by `off_target_arrays`), and off-target counts by distance.
+        """
+        n_distances = max(
+            [MIN_DISTANCES]
+            + [max(_counts) + 1 for _counts in off_targets_by_distance if _counts]
+        )
+        counts = np.zeros((len(off_targets), n_distances), dtype=int)
+        for i, _counts in enumerate(off_targets_by_distance):
+            for distance, count in _counts.items():
+                counts[i, distance] = count
+
+        chr = self.acc_to_chr[accession]
+        columns = {
+            **columns,
+            "reference-name": np.full(len(off_targets), accession, dtype=object),
+            "offtargets-by-distance": counts,
+            "coordinate": [
+                f"{chr}:{start}-{end}:{direction}"
+                for start, end, direction in zip(
+                    columns["start"].tolist(),
+                    columns["end"].tolist(),
+                    columns["direction"],
+                )
+            ],
+            "off-target-summary": [
+                f"2:{n2}|3:{n3}" for n2, n3 in zip(counts[:, 2], counts[:, 3])
+            ],
+            "region-string": np.full(len(off_targets), region_string, dtype=object),
+        }
+        return Hits.from_off_target_arrays(columns=columns, off_targets=off_targets)
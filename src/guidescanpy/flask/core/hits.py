@@ -0,0 +1,458 @@
+import sys
+import heapq
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+
+# Scalar columns of a Hits object, and their types, in the order in which they appear in hit records.
+# The "offtargets-by-distance" column is a 2D array of off-target counts, indexed by distance.
+HIT_COLUMNS = {
+    "id": object,
+    "query-sequence": object,
+    "gc-content": float,
+    "reference-name": object,
+    "offtargets-by-distance": int,
+    "coordinate": object,
+    "sequence": object,
+    "start": int,
+    "end": int,
+    "direction": object,
+    "cutting-efficiency": float,
+    "specificity": float,
+    "off-target-summary": object,
+    "n-off-targets": int,
+    "annotations": object,
+    "region-string": object,
+}
+
+# Columns of the flattened off-target table of a Hits object, and their types
+OFF_TARGET_COLUMNS = {
+    "position": int,
+    "chromosome": object,
+    "direction": object,
+    "distance": int,
+    "accession": object,
+}
+
+# Minimum number of distances for which off-target counts are reported
+MIN_DISTANCES = 4
+
+# Columns by which hits can be sorted in the web interface, and for which decoded query results keep sort orders
+SORTABLE_COLUMNS = (
+    "coordinate",
+    "sequence",
+    "n-off-targets",
+    "off-target-summary",
+    "cutting-efficiency",
+    "specificity",
+    "gc-content",
+)
+
+# Scores that are missing for some hits (e.g. cutting efficiencies of cpf1 guides); these are
+# NaN in the columns of a Hits object, and None in its lists/records
+SCORE_COLUMNS = ("cutting-efficiency", "specificity")
+
+
+def off_target_region_strings(chromosome, position, direction, reference_length):
+    """
+    Region strings of off-targets, given equal-length arrays of off-target chromosomes (with or without
+    a 'chr' prefix), positions, directions and reference lengths (or a single reference length).
+    """
+    # For + strand, position denotes the (0-indexed, inclusive) end of the match,
+    # for - strand, position denotes the (0-indexed, inclusive) start of the match.
+    # Convert these to (1-indexed, inclusive) start/end
+    start = np.where(
+        np.asarray(direction) == "+",
+        position - reference_length + 2,
+        position + 1,
+    )
+    end = start + reference_length - 1
+    return [
+        f"{_chromosome if _chromosome.startswith('chr') else 'chr' + _chromosome}:{_start}-{_end}"
+        for _chromosome, _start, _end in zip(chromosome, start.tolist(), end.tolist())
+    ]
+
+
+def isna(values):
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        return np.isnan(values)
+    elif values.dtype == object:
+        return np.array([v is None or v != v for v in values], dtype=bool)
+    else:
+        return np.zeros(len(values), dtype=bool)
+
+
+def argsort(values, ascending=True):
+    """
+    Stable argsort of `values`, with ties kept in their original order and missing values placed last
+    regardless of sort direction (the ordering that pandas.DataFrame.sort_values produces).
+    """
+    values = np.asarray(values)
+    missing = isna(values)
+    index = np.flatnonzero(~missing)
+    if ascending:
+        order = index[np.argsort(values[index], kind="stable")]
+    else:
+        index = index[::-1]
+        order = index[np.argsort(values[index], kind="stable")][::-1]
+    return np.concatenate([order, np.flatnonzero(missing)])
+
+
+def descending(values, ascending_order):
+    """
+    The order in which `argsort(values, ascending=False)` sorts `values`, derived in linear time
+    from the order `ascending_order` in which `argsort(values)` sorts them.
+    """
+    values = np.asarray(values)
+    n_missing = np.count_nonzero(isna(values))
+    order = ascending_order[: len(values) - n_missing]
+    # Runs of equal values are reversed, keeping ties in their original order
+    sorted_values = values[order]
+    run_starts = np.flatnonzero(
+        np.concatenate([[True], sorted_values[1:] != sorted_values[:-1]])
+    )
+    run_lengths = np.diff(np.append(run_starts, len(order)))
+    runs = concatenated_ranges(run_starts[::-1], run_lengths[::-1])
+    return np.concatenate([order[runs], ascending_order[len(order) :]])
+
+
+def specificity_keys(specificity):
+    """
+    Sort keys for hit specificities - ascending keys correspond to descending specificity,
+    with missing values last.
+    """
+    keys = -np.asarray(specificity, dtype=float)
+    keys[np.isnan(keys)] = np.inf
+    return keys
+
+
+def concatenated_ranges(starts, counts):
+    """
+    The concatenation of ranges [start, start + count) for all `starts` and `counts`.
+    """
+    starts, counts = np.asarray(starts, dtype=int), np.asarray(counts, dtype=int)
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+
+class TopN:
+    """
+    Bounded selection of the items with the n smallest keys from a stream of (key, item) pairs.
+
+    If `tiebreak` is given, it is called for the items that are not rejected by their key alone,
+    and the items are selected by (key, tiebreak(item)), so that ties with the n-th smallest key
+    are resolved as items are added. Items that tie with the n-th smallest key (including its
+    tiebreak) are retained as well, so that they can be broken later by other criteria. Selected
+    items are returned in the order in which they were added.
+    """
+
+    def __init__(self, n, tiebreak=None):
+        self.n = n
+        self.tiebreak = tiebreak
+        self._count = 0
+        self._heap = (
+            []
+        )  # (negated key, -index, item) tuples, with the largest key at the top
+        # (index, item) tuples with keys equal to the largest key in the heap
+        self._ties = []
+
+    def __len__(self):
+        return len(self._heap) + len(self._ties)
+
+    def _largest(self):
+        return _negate(self._heap[0][0])
+
+    def add(self, key, item):
+        index = self._count
+        self._count += 1
+        if self.n <= 0:
+            return
+
+        if self.tiebreak is not None:
+            if len(self._heap) == self.n and key > self._largest()[0]:
+                return
+            key = (key, self.tiebreak(item))
+
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, (_negate(key), -index, item))
+        else:
+            largest = self._largest()
+            if key == largest:
+                self._ties.append((index, item))
+            elif key < largest:
+                _, _index, _item = heapq.heappushpop(
+                    self._heap, (_negate(key), -index, item)
+                )
+                if self._largest() == largest:
+                    self._ties.append((-_index, _item))
+                else:
+                    self._ties = []
+
+    def items(self):
+        selected = [(-_index, item) for _, _index, item in self._heap] + self._ties
+        return [item for _, item in sorted(selected, key=lambda x: x[0])]
+
+
+def _negate(key):
+    return tuple(-k for k in key) if isinstance(key, tuple) else -key
+
+
+class Hits:
+    """
+    Columnar representation of the gRNA hits in a region.
+
+    Scalar attributes of hits are stored as arrays in `columns`. Off-targets of all hits
+    are flattened into a single table of arrays in `off_targets`, where the off-targets of
+    hit i are rows off_target_offsets[i] through off_target_offsets[i + 1].
+    """
+
+    def __init__(self, columns, off_targets, off_target_offsets):
+        self.columns = columns
+        self.off_targets = off_targets
+        self.off_target_offsets = off_target_offsets
+
+    def __len__(self):
+        return len(self.off_target_offsets) - 1
+
+    @classmethod
+    def empty(cls):
+        return cls.from_lists(
+            columns={k: [] for k in HIT_COLUMNS},
+            off_targets={k: [] for k in OFF_TARGET_COLUMNS},
+            off_target_offsets=[0],
+        )
+
+    @classmethod
+    def from_lists(cls, columns, off_targets, off_target_offsets):
+        columns = {k: np.array(columns[k], dtype=v) for k, v in HIT_COLUMNS.items()}
+        if len(off_target_offsets) == 1:
+            columns["offtargets-by-distance"] = np.zeros((0, MIN_DISTANCES), dtype=int)
+        off_targets = {
+            k: np.array(off_targets[k], dtype=v) for k, v in OFF_TARGET_COLUMNS.items()
+        }
+        return cls(columns, off_targets, np.array(off_target_offsets, dtype=int))
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Create a Hits object from a list of hit records, as returned by `to_records`
+        (and stored in query results by earlier versions).
+        """
+        columns = {
+            k: [record[k] for record in records]
+            for k in HIT_COLUMNS
+            if k != "offtargets-by-distance"
+        }
+        # Counts by distance are dicts, with string keys once serialized as JSON
+        counts = [
+            {int(k): v for k, v in record["offtargets-by-distance"].items()}
+            for record in records
+        ]
+        n_distances = max([MIN_DISTANCES] + [max(c, default=0) + 1 for c in counts])
+        columns["offtargets-by-distance"] = [
+            [c.get(distance, 0) for distance in range(n_distances)] for c in counts
+        ]
+        off_targets = {
+            k: [o[k] for record in records for o in record["off-targets"]]
+            for k in OFF_TARGET_COLUMNS
+        }
+        off_target_offsets = np.concatenate(
+            [[0], np.cumsum([len(r["off-targets"]) for r in records], dtype=int)]
+        )
+        return cls.from_lists(columns, off_targets, off_target_offsets)
+
+    @classmethod
+    def from_off_target_arrays(cls, columns, off_targets):
+        """
+        Create a Hits object from a dict of (array-like) hit columns, and a list of
+        per-hit off-targets, each a dict of arrays keyed by OFF_TARGET_COLUMNS.
+        """
+        counts = [len(o["position"]) for o in off_targets]
+        off_target_offsets = np.concatenate([[0], np.cumsum(counts, dtype=int)])
+        if off_targets:
+            off_targets = {
+                k: np.concatenate([o[k] for o in off_targets]).astype(v, copy=False)
+                for k, v in OFF_TARGET_COLUMNS.items()
+            }
+        else:
+            off_targets = {
+                k: np.array([], dtype=v) for k, v in OFF_TARGET_COLUMNS.items()
+            }
+        columns = {k: np.asarray(columns[k], dtype=v) for k, v in HIT_COLUMNS.items()}
+        return cls(columns, off_targets, off_target_offsets)
+
+    @classmethod
+    def from_json(cls, data):
+        return cls.from_lists(
+            columns=data["columns"],
+            off_targets=data["off-targets"],
+            off_target_offsets=data["off-target-offsets"],
+        )
+
+    def to_json(self):
+        """
+        A JSON-serializable representation of this object, suitable for storing in a result backend.
+        """
+        return {
+            "columns": self.column_lists(),
+            "off-targets": {k: v.tolist() for k, v in self.off_targets.items()},
+            "off-target-offsets": self.off_target_offsets.tolist(),
+        }
+
+    def take(self, indices):
+        """
+        A new Hits object with the hits at `indices`, in that order.
+        """
+        indices = np.asarray(indices, dtype=int)
+        starts = self.off_target_offsets[indices]
+        counts = self.off_target_offsets[indices + 1] - starts
+        rows = concatenated_ranges(starts, counts)
+        return Hits(
+            columns={k: v[indices] for k, v in self.columns.items()},
+            off_targets={k: v[rows] for k, v in self.off_targets.items()},
+            off_target_offsets=np.concatenate([[0], np.cumsum(counts, dtype=int)]),
+        )
+
+    def order(self, by, ascending=True, orders=None):
+        """
+        Indices that sort the hits by column `by`. Hits are left in their current order
+        if `by` is not a sortable column. Ascending orders that were computed before
+        (by `orders`) can be given as a dict `orders`.
+        """
+        values = self.columns.get(by)
+        if values is None or values.ndim != 1:
+            return np.arange(len(self))
+        if orders is not None and by in orders:
+            order = np.asarray(orders[by], dtype=int)
+            return order if ascending else descending(values, order)
+        return argsort(values, ascending=ascending)
+
+    def orders(self, columns=SORTABLE_COLUMNS):
+        """
+        A dict of the ascending orders of the hits by each of `columns`.
+        """
+        return {k: self.order(k) for k in columns}
+
+    def off_target_region_strings(self):
+        reference_length = self.columns["end"] - self.columns["start"] + 1
+        return off_target_region_strings(
+            self.off_targets["chromosome"],
+            self.off_targets["position"],
+            self.off_targets["direction"],
+            np.repeat(reference_length, np.diff(self.off_target_offsets)),
+        )
+
+    def off_target_records(self):
+        """
+        A list (one entry per hit) of lists of off-target dicts.
+        """
+        columns = {k: v.tolist() for k, v in self.off_targets.items()}
+        columns["region-string"] = self.off_target_region_strings()
+        records = [dict(zip(columns, row)) for row in zip(*columns.values())]
+        offsets = self.off_target_offsets.tolist()
+        return [records[i:j] for i, j in zip(offsets[:-1], offsets[1:])]
+
+    def column_lists(self):
+        """
+        A dict of the columns of the hits as lists, with missing scores as None.
+        """
+        columns = {k: v.tolist() for k, v in self.columns.items()}
+        for k in SCORE_COLUMNS:
+            columns[k] = [None if v != v else v for v in columns[k]]
+        return columns
+
+    def to_records(self):
+        columns = self.column_lists()
+        columns["offtargets-by-distance"] = [
+            defaultdict(int, enumerate(counts))
+            for counts in columns["offtargets-by-distance"]
+        ]
+        columns["off-targets"] = self.off_target_records()
+        names = list(HIT_COLUMNS)
+        names.insert(names.index("off-target-summary"), "off-targets")
+        return [dict(zip(names, row)) for row in zip(*(columns[k] for k in names))]
+
+    def to_dataframe(self):
+        names = list(HIT_COLUMNS)
+        names.insert(names.index("off-target-summary"), "off-targets")
+        return pd.DataFrame(self.to_records(), columns=names)
+
+
+def decode_hits(hits):
+    """
+    A Hits object from the hits of a region in a query result, as stored by the query task
+    (or as a list of hit records, by earlier versions).
+    """
+    if isinstance(hits, Hits):
+        return hits
+    elif isinstance(hits, list):
+        return Hits.from_records(hits)
+    else:
+        return Hits.from_json(hits)
+
+
+def decode_query_result(result):
+    """
+    A (columnar) query result, as returned by the query task, with Hits objects for
+    the hits of each region, and their sort orders as arrays. The orders are computed
+    here rather than stored, since decoded results are cached for paging.
+    """
+    queries = {}
+    for region, value in result["queries"].items():
+        hits = decode_hits(value["hits"])
+        queries[region] = {**value, "hits": hits, "orders": hits.orders()}
+    return {**result, "queries": queries}
+
+
+def _array_nbytes(values):
+    nbytes = values.nbytes
+    if values.dtype == object:
+        # Object arrays hold references to (mostly string) objects
+        nbytes += sum(sys.getsizeof(v) for v in values.ravel())
+    return nbytes
+
+
+def decoded_result_nbytes(result):
+    """
+    An estimate of the memory (in bytes) taken by the arrays of a result decoded by `decode_query_result`.
+    """
+    nbytes = 0
+    for value in result["queries"].values():
+        hits = value["hits"]
+        arrays = [*hits.columns.values(), *hits.off_targets.values()]
+        arrays += [hits.off_target_offsets, *value["orders"].values()]
+        nbytes += sum(_array_nbytes(np.asarray(a)) for a in arrays)
+    return nbytes
+
+
+def query_result_records(
+    result, region=None, start=0, end=None, orderby=None, asc=True
+):
+    """
+    Convert a (columnar) query result, as returned by the query task or decoded by `decode_query_result`,
+    into one with hit records, optionally for a single `region`, sorted by `orderby` and sliced to [start, end).
+    """
+    if region is None:
+        regions = result["queries"].keys()
+    else:
+        assert region in result["queries"], f"Region {region} not found in results"
+        regions = [region]
+
+    queries = {}
+    for region in regions:
+        value = result["queries"][region]
+        hits, orders = decode_hits(value["hits"]), value.get("orders")
+        indices = (
+            hits.order(orderby, ascending=asc, orders=orders)
+            if orderby
+            else np.arange(len(hits))
+        )
+        queries[region] = {
+            "region": value["region"],
+            "hits": hits.take(indices[start:end]).to_records(),
+            "total_hits": len(hits),
+        }
+
+    return {**result, "queries": queries}
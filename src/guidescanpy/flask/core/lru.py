@@ -0,0 +1,75 @@
+import time
+import threading
+from collections import OrderedDict
+
+# Returned by TTLCache.get for keys that are not cached (None is a valid cached value)
+MISSING = object()
+
+
+class TTLCache:
+    """
+    A thread-safe, size-bounded LRU cache whose entries expire `ttl` seconds after they were added.
+    If `maxbytes` is given, the cache is also bounded by the total size of its values, as given by
+    the function `sizeof`; values larger than `maxbytes` are not cached at all.
+    Hits and misses are counted, for monitoring.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        # key => (expiry time, value, size of value), least recently used first
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._pop(key)
+            self.misses += 1
+            return MISSING
+
+    def _pop(self, key):
+        self.nbytes -= self._data.pop(key)[2]
+
+    def set(self, key, value):
+        expiry = None if self.ttl is None else time.monotonic() + self.ttl
+        nbytes = 0 if self.maxbytes is None else self.sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            if self.maxbytes is not None and nbytes > self.maxbytes:
+                return
+            self._data[key] = expiry, value, nbytes
+            self.nbytes += nbytes
+            while len(self._data) > self.maxsize or (
+                self.maxbytes is not None and self.nbytes > self.maxbytes
+            ):
+                self._pop(next(iter(self._data)))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        stats = {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+        if self.maxbytes is not None:
+            stats.update({"bytes": self.nbytes, "maxbytes": self.maxbytes})
+        return stats
@@ -1,7 +1,7 @@
 import io
 import os.path
 import re
-from guidescanpy.flask.db import create_region_query
+from guidescanpy.flask.db import create_region_query, create_region_queries
 
 
 def region_parser(filepath_or_str, organism):
@@ -31,14 +31,17 @@ class RegionFileParser:
         self.filepath = filepath
         self.organism = organism
 
-    def __iter__(self):
+    def iter_lines(self):
         file = self.lines or open(self.filepath, encoding="utf8")
         with file:
             for line in file:
-                line = line.strip()
-                region = self.parse_line(line)
-                if region is not None:
-                    yield region
+                yield line.strip()
+
+    def __iter__(self):
+        for line in self.iter_lines():
+            region = self.parse_line(line)
+            if region is not None:
+                yield region
 
     def parse_line(self, line: str) -> dict | None:
         # Return a 4-tuple
@@ -49,15 +52,50 @@ class RegionFileParser:
 
 
 class TxtRegionFileParser(RegionFileParser):
-    def parse_line(self, line):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.regions = (
+            None  # gene symbol/Entrez ID => region dict, when resolved in bulk
+        )
+
+    @staticmethod
+    def match_line(line):
         # line is <chr>:<start>-<end> where start and end are 1-indexed and inclusive
         line = line.replace(",", "")  # start/end positions may have commas
-        match = re.match(r"^(\S+):(\d+)-(\d+)", line)
+        return line, re.match(r"^(\S+):(\d+)-(\d+)", line)
+
+    def __iter__(self):
+        # Gene symbols and Entrez IDs on all lines are resolved together, before any regions are returned
+        lines = list(self.iter_lines())
+        self.regions = create_region_queries(
+            self.organism,
+            list(
+                dict.fromkeys(
+                    line
+                    for line, match in map(self.match_line, lines)
+                    if match is None and line
+                )
+            ),
+        )
+        try:
+            for line in lines:
+                region = self.parse_line(line)
+                if region is not None:
+                    yield region
+        finally:
+            self.regions = None
+
+    def parse_line(self, line):
+        line, match = self.match_line(line)
         if match is not None:
             chr, start, end = match.group(1), int(match.group(2)), int(match.group(3))
             return line, chr, start, end
         else:
-            if region := create_region_query(self.organism, line):
+            if self.regions is not None:
+                region = self.regions.get(line)
+            else:
+                region = create_region_query(self.organism, line)
+            if region:
                 return (
                     region["region_name"],
                     region["chromosome_name"],
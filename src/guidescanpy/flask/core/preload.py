@@ -0,0 +1,72 @@
+import time
+import logging
+from contextlib import contextmanager
+from guidescanpy.flask.core.genome import get_genome_structure
+from guidescanpy.flask.core.bam import bam_pool
+from guidescanpy.flask.core.parser import region_parser
+from guidescanpy.flask.db import get_exon_index
+from guidescanpy import config
+
+logger = logging.getLogger(__name__)
+
+
+def preload_targets(preload=None):
+    """
+    (organism, enzyme) tuples from a comma-separated string of <organism>:<enzyme> entries,
+    by default the `guidescan.preload` config value.
+    """
+    if preload is None:
+        preload = config.guidescan.preload
+    targets = []
+    for entry in preload.split(","):
+        entry = entry.strip()
+        if entry:
+            organism, _, enzyme = entry.partition(":")
+            targets.append((organism, enzyme or "cas9"))
+    return targets
+
+
+@contextmanager
+def timed(what):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:  # noqa
+        logger.warning(f"Unable to preload {what}: {e}")
+    else:
+        logger.info(f"Preloaded {what} in {time.perf_counter() - start:.2f}s")
+
+
+def preload_bam_handles(preload=None):
+    """
+    Open (and index) the bam files of preloaded organisms/enzymes in this process.
+    """
+    for organism, enzyme in preload_targets(preload):
+        with timed(f"bam file for {organism}:{enzyme}"):
+            with bam_pool.alignment_file(organism=organism, enzyme=enzyme):
+                pass
+
+
+def preload(preload=None):
+    """
+    Build the genome structures and exon indices, resolve the example queries,
+    and open the bam files, of preloaded organisms/enzymes, so that the first queries for them do not pay for this.
+    """
+    targets = preload_targets(preload)
+    start = time.perf_counter()
+    for organism in dict.fromkeys(organism for organism, _ in targets):
+        with timed(f"genome structure for {organism}"):
+            get_genome_structure(organism)
+        with timed(f"exon index for {organism}"):
+            get_exon_index(organism)
+    for organism, enzyme in targets:
+        example_queries = (
+            config.json["guidescan"]["example_queries"].get(organism, {}).get(enzyme)
+        )
+        if example_queries:
+            # Fills the gene cache with the genes that are most likely to be queried
+            with timed(f"example queries for {organism}:{enzyme}"):
+                list(region_parser(example_queries, organism=organism))
+    preload_bam_handles(preload)
+    if targets:
+        logger.info(f"Preloading completed in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,128 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+from guidescanpy import config
+
+logger = logging.getLogger(__name__)
+
+# Key of handles to results in the result store, as returned by tasks instead of large results
+HANDLE_KEY = "result-store"
+# Minimum number of seconds between removals of expired results by a process
+PRUNE_INTERVAL = 3600
+
+_last_pruned = 0
+
+
+def result_store_path():
+    return config.guidescan.result_store_path or None
+
+
+def _result_filepath(digest):
+    return os.path.join(result_store_path(), digest[:2], f"{digest}.json.gz")
+
+
+def is_handle(value):
+    return isinstance(value, dict) and HANDLE_KEY in value
+
+
+def store_result(value):
+    """
+    Write a (JSON-serializable) task result to the result store, under the sha256 digest of its
+    contents, and return a small handle to it. Results smaller than
+    `guidescan.result_store_threshold` bytes (as JSON), or all results if no
+    `guidescan.result_store_path` is configured, are returned unchanged.
+    """
+    if result_store_path() is None:
+        return value
+    data = json.dumps(value).encode()
+    if len(data) < config.guidescan.result_store_threshold:
+        return value
+
+    digest = hashlib.sha256(data).hexdigest()
+    filepath = _result_filepath(digest)
+    if os.path.exists(filepath):
+        # Stored by an identical job - refreshed so that it is not pruned early
+        os.utime(filepath)
+    else:
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        tmp_filepath = f"{filepath}.tmp-{os.getpid()}"
+        with open(tmp_filepath, "wb") as f:
+            f.write(gzip.compress(data, compresslevel=6))
+        os.replace(tmp_filepath, filepath)
+
+    prune_results()
+    return {HANDLE_KEY: digest, "size": len(data)}
+
+
+def load_result(value):
+    """
+    The task result that `value` is a handle to, or `value` itself if it is not a handle.
+    """
+    if not is_handle(value):
+        return value
+    if result_store_path() is None:
+        raise FileNotFoundError(
+            f"Result {value[HANDLE_KEY]} is in a result store, but none is configured"
+        )
+    filepath = _result_filepath(value[HANDLE_KEY])
+    try:
+        with gzip.open(filepath, "rb") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Result {value[HANDLE_KEY]} is no longer available in the result store"
+        ) from None
+
+
+def prune_results(max_age=None, force=False):
+    """
+    Remove results that were stored more than `max_age` seconds ago (by default,
+    `guidescan.result_store_max_age`). Unless `force`d, this is done at most once
+    every `PRUNE_INTERVAL` seconds.
+    """
+    global _last_pruned
+    now = time.time()
+    if not force and now - _last_pruned < PRUNE_INTERVAL:
+        return
+    _last_pruned = now
+
+    if max_age is None:
+        max_age = config.guidescan.result_store_max_age
+    if (
+        not max_age
+        or result_store_path() is None
+        or not os.path.isdir(result_store_path())
+    ):
+        return
+
+    for dirpath, _, filenames in os.walk(result_store_path()):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            try:
+                if now - os.path.getmtime(filepath) > max_age:
+                    os.remove(filepath)
+            except FileNotFoundError:
+                pass  # removed by another process
+
+
+class JobResult:
+    """
+    A Celery AsyncResult whose `result` is read from the result store if the task returned a handle,
+    unless the (loaded) `result` is given.
+    """
+
+    def __init__(self, async_result, result=None):
+        self._async_result = async_result
+        self._result = result
+
+    def __getattr__(self, name):
+        return getattr(self._async_result, name)
+
+    @property
+    def result(self):
+        if self._result is None:
+            self._result = load_result(self._async_result.result)
+        return self._result
@@ -4,6 +4,7 @@ import functools
 from flask import render_template
 from guidescanpy.tasks import app as tasks_app
 from guidescanpy.exceptions import GuidescanException
+from guidescanpy.flask.core.coordinates import CoordinateMapper
 
 
 def repeat(item):
@@ -37,17 +38,36 @@ def hex_to_offtarget_info(hexstr, delim):
     return out
 
 
+def hex_to_offtarget_arrays(hexstr, delim):
+    """
+    Vectorized counterpart of `hex_to_offtarget_info`.
+    Returns a 2-tuple of (distances, positions) arrays, in the same order as
+    the (distance, position) tuples returned by `hex_to_offtarget_info`.
+    """
+    mainarr = hex_to_array(hexstr)
+    is_delim = mainarr == delim
+    index = np.flatnonzero(is_delim)
+
+    # Entries are laid out in groups of <position>..<position><distance><delim>
+    # The group of each entry is the number of delimiters that precede it.
+    group = np.cumsum(is_delim) - is_delim
+    is_position = ~is_delim & (group < len(index))
+    is_position[index - 1] = False
+
+    distances = mainarr[index - 1][group[is_position]]
+    positions = mainarr[is_position]
+    return distances, positions
+
+
 def map_int_to_coord(x, genome):
-    strand = "+" if x > 0 else "-"
-    x = abs(x)
-    i = 0
-    while genome[i]["LN"] <= x:
-        x -= genome[i]["LN"]
-        i += 1
-    chrom = genome[i]["SN"]
-    coord = x
-
-    return chrom, coord, strand
+    """
+    Map a signed absolute position `x` to a (chromosome, 0-indexed position, strand) tuple.
+    `genome` is either the "SQ" records of a SAM/BAM header, or a CoordinateMapper created from
+    them (which avoids re-computing cumulative lengths on every call).
+    """
+    if not isinstance(genome, CoordinateMapper):
+        genome = CoordinateMapper.from_header(genome)
+    return genome(x)
 
 
 def job_result(view):
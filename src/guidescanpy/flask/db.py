@@ -1,34 +1,172 @@
 import logging
+import threading
 from intervaltree import IntervalTree
 from functools import cache
 from sqlalchemy import create_engine
-from sqlalchemy.sql import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import text, bindparam
 from sqlalchemy.exc import IntegrityError
+from guidescanpy.flask.tables import Chromosomes, Genes, Exons
+from guidescanpy.flask.core.annotation import ExonIndex
+from guidescanpy.flask.core.cache import (
+    load_chromosome_names,
+    load_exon_index,
+    genes_version,
+    touch_genes_version,
+)
+from guidescanpy.flask.core.lru import TTLCache, MISSING
 from guidescanpy import config
 
 engine = None
-conn = None
+engine_lock = threading.Lock()
+local = threading.local()  # .conn: connection checked out by this thread
+gene_caches = {}  # organism => (genes version, TTLCache)
+gene_caches_lock = threading.Lock()
 logger = logging.getLogger(__name__)
 
+# Genes of an organism, to be further filtered by gene symbol or entrez ID
+REGION_QUERY = (
+    "SELECT genes.entrez_id, genes.gene_symbol AS region_name, genes.start_pos AS start_pos, genes.end_pos AS end_pos, "
+    "genes.sense, 'chr' || chromosomes.name AS chromosome_name, chromosomes.accession AS chromosome_accession FROM genes, chromosomes "
+    "WHERE genes.chromosome=chromosomes.accession AND chromosomes.organism = :organism"
+)
+
+# Exons on the chromosomes of an organism
+EXONS_QUERY = (
+    "SELECT exons.chromosome, exons.start_pos, exons.end_pos, exons.exon_number, exons.product "
+    "FROM exons, chromosomes WHERE exons.chromosome=chromosomes.accession AND chromosomes.organism = :organism"
+)
+
+# Up to :n_guides library guides of an organism for each of the :genes, ranked in a deterministic order.
+# Guides for gene symbols that share an entrez ID with a gene are included.
+LIBRARY_INFO_BY_GENES_QUERY = (
+    "WITH gene_symbols AS ("
+    "SELECT DISTINCT genes.gene_symbol AS query_gene, synonyms.gene_symbol AS gene_symbol "
+    "FROM genes JOIN genes AS synonyms ON synonyms.entrez_id = genes.entrez_id "
+    "WHERE genes.gene_symbol IN :genes"
+    "), ranked AS ("
+    "SELECT gene_symbols.query_gene, libraries.*, ROW_NUMBER() OVER ("
+    "PARTITION BY gene_symbols.query_gene "
+    "ORDER BY libraries.gene_symbol, libraries.grna, libraries.grna_type"
+    ") AS guide_rank "
+    "FROM gene_symbols JOIN libraries ON libraries.gene_symbol = gene_symbols.gene_symbol "
+    "WHERE libraries.organism = :organism"
+    ") "
+    "SELECT * FROM ranked WHERE guide_rank <= :n_guides ORDER BY query_gene, guide_rank"
+)
+
 
 def get_engine():
     global engine
-    if engine is None:
-        db = config.guidescan.db
-        engine = create_engine(db)
+    with engine_lock:
+        if engine is None:
+            db = config.guidescan.db
+            kwargs = {
+                "pool_pre_ping": config.guidescan.db_pool_pre_ping,
+                "pool_recycle": config.guidescan.db_pool_recycle,
+            }
+            url = make_url(db)
+            # In-memory sqlite databases are specific to a connection, and not pooled
+            if not (
+                url.get_backend_name() == "sqlite"
+                and url.database in (None, "", ":memory:")
+            ):
+                kwargs["pool_size"] = config.guidescan.db_pool_size
+                kwargs["max_overflow"] = config.guidescan.db_pool_max_overflow
+            engine = create_engine(db, **kwargs)
     return engine
 
 
+def dispose_engine():
+    """
+    Drop the pooled connections inherited from a parent process, without closing them for the parent.
+    """
+    local.__dict__.clear()
+    if engine is not None:
+        engine.dispose(close=False)
+
+
 def get_connection():
-    global conn
+    """
+    The connection of the current thread, checked out from the pool of connections on first use,
+    and returned to it by `release_connection`. None if no connection could be made.
+    """
+    conn = getattr(local, "conn", None)
     if conn is None:
         try:
-            conn = get_engine().connect()
+            conn = local.conn = get_engine().connect()
         except Exception as e:  # noqa
             logger.error(str(e))
     return conn
 
 
+def release_connection(*args, **kwargs):
+    """
+    Return the connection of the current thread, if any, to the pool, rolling back uncommitted work.
+    Called at the end of every request and task.
+    """
+    conn = getattr(local, "conn", None)
+    if conn is not None:
+        local.conn = None
+        conn.close()
+
+
+def pool_stats():
+    """
+    Utilization of the pool of database connections of this process.
+    """
+    if engine is None:
+        return {}
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return {"status": pool.status()}
+    return {
+        "size": pool.size(),
+        "checked-in": pool.checkedin(),
+        "checked-out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
+def explain(query, params=None):
+    """
+    Lines of the query plan of the SQL `query` with bind parameters `params`.
+    """
+    conn = get_connection()
+    params = params or {}
+    # List parameters are expanded, for IN clauses
+    expanding = [
+        bindparam(k, expanding=True)
+        for k, v in params.items()
+        if isinstance(v, list) and f":{k}" in query
+    ]
+    if conn.dialect.name == "postgresql":
+        statement = text("EXPLAIN " + query).bindparams(*expanding)
+        return [row[0] for row in conn.execute(statement, params)]
+    else:
+        statement = text("EXPLAIN QUERY PLAN " + query).bindparams(*expanding)
+        return [row[-1] for row in conn.execute(statement, params)]
+
+
+def query_plans(organism):
+    """
+    A dictionary of query plans of the queries run (in bulk) to serve requests for `organism`.
+    """
+    return {
+        "region by gene symbol": explain(
+            regions_query("gene_symbol"), {"organism": organism, "values": [""]}
+        ),
+        "region by entrez id": explain(
+            regions_query("entrez_id"), {"organism": organism, "values": [0]}
+        ),
+        "library info by genes": explain(
+            LIBRARY_INFO_BY_GENES_QUERY,
+            {"organism": organism, "genes": [""], "n_guides": 1},
+        ),
+        "exons": explain(EXONS_QUERY, {"organism": organism}),
+    }
+
+
 def insert_chromosome_query(**kwargs):
     conn = get_connection()
     query = text(
@@ -71,7 +209,38 @@ def insert_exon_query(**kwargs):
         conn.rollback()
 
 
-def create_region_query(organism, region):
+def insert_rows(table, rows):
+    """
+    Insert `rows` (a list of dicts) into `table` in a single transaction, using multi-row
+    INSERT statements. Rows that conflict with existing rows are skipped.
+    """
+    conn = get_connection()
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    try:
+        conn.execute(insert(table).on_conflict_do_nothing(), rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def insert_chromosomes(rows):
+    insert_rows(Chromosomes.__table__, rows)
+
+
+def insert_genes(rows):
+    insert_rows(Genes.__table__, rows)
+
+
+def insert_exons(rows):
+    insert_rows(Exons.__table__, rows)
+
+
+def _create_region_query(organism, region):
     conn = get_connection()
     try:
         int(region)
@@ -80,11 +249,7 @@ def create_region_query(organism, region):
     else:
         is_entrez_id = True
 
-    query = (
-        "SELECT genes.entrez_id, genes.gene_symbol AS region_name, genes.start_pos AS start_pos, genes.end_pos AS end_pos, "
-        "genes.sense, 'chr' || chromosomes.name AS chromosome_name, chromosomes.accession AS chromosome_accession FROM genes, chromosomes "
-        "WHERE genes.chromosome=chromosomes.accession AND chromosomes.organism = :organism"
-    )
+    query = REGION_QUERY
 
     if is_entrez_id:
         query += " AND genes.entrez_id=:entrez_id"
@@ -100,7 +265,125 @@ def create_region_query(organism, region):
         return return_value
 
 
-def get_chromosome_names(organism):
+def regions_query(column):
+    """
+    The query for the regions of the genes of an organism whose `column` (entrez_id or
+    gene_symbol) is in the (expanding) :values.
+    """
+    return REGION_QUERY + f" AND genes.{column} IN :values"
+
+
+def _create_region_queries(organism, regions, chunk_size=500):
+    conn = get_connection()
+    entrez_ids, gene_symbols = {}, set()
+    for region in regions:
+        try:
+            entrez_ids[region] = int(region)
+        except ValueError:
+            gene_symbols.add(region)
+
+    by_entrez_id, by_gene_symbol = {}, {}
+    for column, values, found in (
+        ("entrez_id", sorted(set(entrez_ids.values())), by_entrez_id),
+        ("gene_symbol", sorted(gene_symbols), by_gene_symbol),
+    ):
+        statement = text(regions_query(column)).bindparams(
+            bindparam("values", expanding=True)
+        )
+        for i in range(0, len(values), chunk_size):
+            results = conn.execute(
+                statement, {"organism": organism, "values": values[i : i + chunk_size]}
+            )
+            for row in results.mappings():
+                return_value = dict(row)
+                # TODO: sqlite backend seems to return boolean as int
+                return_value["sense"] = bool(return_value["sense"])
+                key = row["entrez_id"] if column == "entrez_id" else row["region_name"]
+                # As in `create_region_query`, the first matching row is used
+                found.setdefault(key, return_value)
+
+    return_value = {}
+    for region in regions:
+        if region in entrez_ids:
+            result = by_entrez_id.get(entrez_ids[region])
+        else:
+            result = by_gene_symbol.get(region)
+        if result is not None:
+            return_value[region] = result
+    return return_value
+
+
+def get_gene_cache(organism):
+    """
+    The cache of gene symbol/Entrez ID => region dict (or None, for unknown genes) for an organism.
+    The cache is emptied when the genes of the organism are updated by any process.
+    """
+    version = genes_version(organism)
+    with gene_caches_lock:
+        if organism not in gene_caches or gene_caches[organism][0] != version:
+            gene_caches[organism] = version, TTLCache(
+                maxsize=int(config.guidescan.gene_cache_size),
+                ttl=float(config.guidescan.gene_cache_ttl) or None,
+            )
+        return gene_caches[organism][1]
+
+
+def gene_cache_stats():
+    return {organism: cache.stats() for organism, (_, cache) in gene_caches.items()}
+
+
+def invalidate_genes(organism):
+    """
+    Discard cached genes of an organism, in this and (through a marker file) all other processes.
+    """
+    with gene_caches_lock:
+        gene_caches.pop(organism, None)
+    touch_genes_version(organism)
+
+
+def create_region_query(organism, region):
+    gene_cache = get_gene_cache(organism)
+    return_value = gene_cache.get(region)
+    if return_value is MISSING:
+        return_value = _create_region_query(organism, region)
+        gene_cache.set(region, return_value)
+    return None if return_value is None else dict(return_value)
+
+
+def create_region_queries(organism, regions, chunk_size=500):
+    """
+    Bulk counterpart of `create_region_query`. Returns a dict of region => region dict for all
+    (gene symbol or Entrez ID) `regions` that were found. Regions that are not cached are resolved
+    using one query per `chunk_size` gene symbols or Entrez IDs.
+    """
+    gene_cache = get_gene_cache(organism)
+    found, missing = {}, []
+    for region in dict.fromkeys(regions):
+        return_value = gene_cache.get(region)
+        if return_value is MISSING:
+            missing.append(region)
+        else:
+            found[region] = return_value
+
+    if missing:
+        resolved = _create_region_queries(organism, missing, chunk_size=chunk_size)
+        for region in missing:
+            found[region] = resolved.get(region)
+            gene_cache.set(region, found[region])
+
+    return {
+        region: dict(found[region])
+        for region in dict.fromkeys(regions)
+        if found[region] is not None
+    }
+
+
+def get_chromosome_names(organism, cached=True):
+    if cached:
+        chromosome_names = load_chromosome_names(organism)
+        if chromosome_names is not None:
+            return chromosome_names
+
     conn = get_connection()
     query = text(
         "SELECT accession, CONCAT('chr', name) FROM chromosomes WHERE organism = :organism"
@@ -109,22 +392,30 @@ def get_chromosome_names(organism):
     return dict([row for row in results]) or None
 
 
-def get_library_info_by_gene(organism, genes, n_guides=6):
+def get_library_info_by_gene(organism, genes, n_guides=6, chunk_size=500):
     conn = get_connection()
-    # TODO: Do we need an ORDER BY here?
+    # Guides are ordered by gene symbol and sequence, so that libraries are reproducible
     #   See https://github.com/pritykinlab/guidescan-web/blob/master/src/guidescan_web/query/library_design.clj#L150
-    query = text(
-        "SELECT * FROM libraries WHERE organism = :organism AND gene_symbol IN (SELECT gene_symbol FROM genes WHERE entrez_id IN (SELECT entrez_id FROM genes WHERE gene_symbol = :gene)) LIMIT :n_guides"
+    query = text(LIBRARY_INFO_BY_GENES_QUERY).bindparams(
+        bindparam("genes", expanding=True)
     )
 
-    return_value = {}
-    for gene in genes:
-        return_value[gene] = []
+    return_value = {gene: [] for gene in genes}
+    unique_genes = sorted(return_value)
+    for i in range(0, len(unique_genes), chunk_size):
         results = conn.execute(
-            query, {"organism": organism, "gene": gene, "n_guides": n_guides}
+            query,
+            {
+                "organism": organism,
+                "genes": unique_genes[i : i + chunk_size],
+                "n_guides": n_guides,
+            },
         )
         for row in results.mappings():
-            return_value[gene].append(dict(row))
+            row = dict(row)
+            gene = row.pop("query_gene")
+            del row["guide_rank"]
+            return_value[gene].append(row)
 
     return return_value
 
@@ -166,3 +457,33 @@ def get_chromosome_interval_trees():
         chromosomes[chr][start - 1 : end] = exon_number, product
 
     return chromosomes
+
+
+def get_exons(organism=None):
+    """
+    (accession, start, end, exon_number, product) rows of all exons, or of those on
+    the chromosomes of `organism`.
+    """
+    conn = get_connection()
+    if conn is None:
+        return []
+    if organism is None:
+        query = text(
+            "SELECT chromosome, start_pos, end_pos, exon_number, product FROM exons"
+        )
+    else:
+        query = text(EXONS_QUERY)
+    return conn.execute(query, {"organism": organism}).fetchall()
+
+
+@cache
+def get_exon_index(organism=None):
+    """
+    An ExonIndex of all exons, or of those on the chromosomes of `organism`.
+    The (memory-mapped) index in the cache of the organism is used if available.
+    """
+    if organism is not None:
+        exon_index = load_exon_index(organism)
+        if exon_index is not None:
+            return exon_index
+    return ExonIndex.from_rows(get_exons(organism))
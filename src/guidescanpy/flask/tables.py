@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean
+from sqlalchemy import Column, String, Integer, Float, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -25,6 +25,10 @@ class Libraries(Base):
     specificity_5pg = Column(Float)
     cutting_efficiency = Column(Float)
 
+    __table_args__ = (
+        Index("ix_libraries_organism_gene_symbol", "organism", "gene_symbol"),
+    )
+
 
 class Chromosomes(Base):
     __tablename__ = "chromosomes"
@@ -33,6 +37,8 @@ class Chromosomes(Base):
     name = Column(String(1023), nullable=False, primary_key=True)
     organism = Column(String(1023), nullable=False, primary_key=True)
 
+    __table_args__ = (Index("ix_chromosomes_organism", "organism"),)
+
 
 class Genes(Base):
     __tablename__ = "genes"
@@ -44,6 +50,11 @@ class Genes(Base):
     start_pos = Column(Integer, nullable=False)
     end_pos = Column(Integer, nullable=False)
 
+    __table_args__ = (
+        Index("ix_genes_gene_symbol", "gene_symbol"),
+        Index("ix_genes_entrez_id", "entrez_id"),
+    )
+
 
 class Exons(Base):
     __tablename__ = "exons"
@@ -56,6 +67,10 @@ class Exons(Base):
     start_pos = Column(Integer, nullable=False)
     end_pos = Column(Integer, nullable=False)
 
+    __table_args__ = (
+        Index("ix_exons_chromosome_start_pos", "chromosome", "start_pos"),
+    )
+
 
 class EssentialGenes(Base):
     __tablename__ = "essential_genes"
@@ -1,25 +1,60 @@
 from celery import Celery
+from celery.signals import worker_init, worker_process_init, task_postrun
 from guidescanpy import config
 
 app = Celery("tasks", broker=config.celery.broker, backend=config.celery.backend)
 
 
+@worker_init.connect
+def preload_worker(**kwargs):
+    # Run in the main worker process before the pool is forked, so that genome structures
+    # and annotations are inherited by the pool processes, however the worker is started
+    from guidescanpy.flask.core.preload import preload
+
+    preload()
+
+
+@worker_process_init.connect
+def preload_worker_process(**kwargs):
+    # Open bam files are not shared with forked pool processes
+    from guidescanpy.flask.core.preload import preload_bam_handles
+
+    from guidescanpy.flask.db import dispose_engine
+    from guidescanpy.flask.blueprints.query import start_executor
+
+    preload_bam_handles()
+    # Nor are database connections
+    dispose_engine()
+    # Processes for parallel queries are forked before any task is run
+    start_executor()
+
+
+@task_postrun.connect
+def release_connection(**kwargs):
+    from guidescanpy.flask.db import release_connection
+
+    release_connection()
+
+
 @app.task
 def query(*args, **kwargs):
     from guidescanpy.flask.blueprints.query import query
+    from guidescanpy.flask.core.results import store_result
 
-    return query(*args, **kwargs)
+    return store_result(query(*args, **kwargs))
 
 
 @app.task
 def sequence(*args, **kwargs):
     from guidescanpy.flask.blueprints.sequence import sequence
+    from guidescanpy.flask.core.results import store_result
 
-    return sequence(*args, **kwargs)
+    return store_result(sequence(*args, **kwargs))
 
 
 @app.task
 def library(*args, **kwargs):
     from guidescanpy.flask.blueprints.library import library
+    from guidescanpy.flask.core.results import store_result
 
-    return library(*args, **kwargs)
+    return store_result(library(*args, **kwargs))
@@ -57,6 +57,25 @@ def index_prefix():
     return index_prefix
 
 
+@pytest.fixture
+def empty_db(tmp_path, monkeypatch):
+    """
+    An engine for a temporary sqlite database with all tables, used by `guidescanpy.flask.db`.
+    """
+    from sqlalchemy import create_engine
+    from guidescanpy.flask import db
+    from guidescanpy.flask.tables import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'guidescan.db'}")
+    Base.metadata.create_all(engine)
+    db.release_connection()
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(db, "gene_caches", {})
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_CACHEDIR", str(tmp_path))
+    yield engine
+    db.release_connection()
+
+
 @pytest.fixture(scope="session")
 def data_folder():
     return os.path.join(os.path.dirname(__file__), "data")
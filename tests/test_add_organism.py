@@ -1,9 +1,11 @@
+import gzip
 import os.path
 from unittest.mock import patch
-from guidescanpy.commands.add_organism import insert_chromosome
+import pytest
+from guidescanpy.commands.add_organism import insert_chromosome, parse_gtf
 
 
-@patch("guidescanpy.commands.add_organism.insert_chromosome_query")
+@patch("guidescanpy.commands.add_organism.insert_chromosomes")
 def test_insert_chromosome_chr2acc_format(_):
     file = os.path.join(os.path.dirname(__file__), "data", "sacCer3_chr2acc.txt")
     accessions = insert_chromosome("sacCer3", file)
@@ -28,7 +30,7 @@ def test_insert_chromosome_chr2acc_format(_):
     ]
 
 
-@patch("guidescanpy.commands.add_organism.insert_chromosome_query")
+@patch("guidescanpy.commands.add_organism.insert_chromosomes")
 def test_insert_chromosome_chromAlias_format(_):
     file = os.path.join(os.path.dirname(__file__), "data", "hs1.chromAlias.txt")
     accessions = insert_chromosome("t2t_chm13", file)
@@ -59,3 +61,58 @@ def test_insert_chromosome_chromAlias_format(_):
         "NC_060947.1",
         "NC_060948.1",
     ]
+
+
+@pytest.fixture
+def gtf_gz(tmp_path):
+    gtf_gz = tmp_path / "sacCer3.gtf.gz"
+    attrs = 'gene_id "RAD51"; db_xref "GeneID:851357"; gene "RAD51";'
+    exon_attrs = attrs + ' product "recombinase RAD51"; exon_number "1";'
+    with gzip.open(gtf_gz, "wt") as f:
+        f.write("#gtf-version 2.2\n")
+        f.write(f"NC_001137.3\tRefSeq\tgene\t349980\t351182\t.\t-\t.\t{attrs}\n")
+        # Duplicate rows are only inserted once
+        f.write(f"NC_001137.3\tRefSeq\tgene\t349980\t351182\t.\t-\t.\t{attrs}\n")
+        f.write(f"NC_001137.3\tRefSeq\tCDS\t349980\t351182\t.\t-\t0\t{attrs}\n")
+        f.write(f"NC_001137.3\tRefSeq\texon\t349980\t351182\t.\t-\t.\t{exon_attrs}\n")
+        # Annotations on unknown chromosomes are skipped
+        f.write(f"NC_999999.1\tRefSeq\tgene\t1\t100\t.\t+\t.\t{attrs}\n")
+    return gtf_gz
+
+
+def test_parse_gtf_parallel(gtf_gz):
+    accessions = {"NC_001137.3"}
+    chunks = list(parse_gtf(gtf_gz, accessions, processes=1))
+    assert len(chunks) == 1
+    n_lines, genes, exons = chunks[0]
+    assert n_lines == 6
+    assert len(genes) == 2 and len(exons) == 1
+
+    # Chunks parsed in parallel are generated in file order
+    parallel_chunks = list(parse_gtf(gtf_gz, accessions, processes=2, chunk_size=1))
+    assert [chunk[0] for chunk in parallel_chunks] == [1] * 6
+    assert [row for chunk in parallel_chunks for row in chunk[1]] == genes
+    assert [row for chunk in parallel_chunks for row in chunk[2]] == exons
+
+
+def test_add_organism(empty_db, gtf_gz):
+    from sqlalchemy import text
+    from guidescanpy.commands.add_organism import main
+
+    chr2acc = os.path.join(os.path.dirname(__file__), "data", "sacCer3_chr2acc.txt")
+
+    main(["sacCer3", str(gtf_gz), chr2acc, "--processes", "2"])
+    # Adding an organism again is a no-op
+    main(["sacCer3", str(gtf_gz), chr2acc])
+
+    with empty_db.connect() as conn:
+        n_chromosomes = conn.execute(text("SELECT COUNT(*) FROM chromosomes")).scalar()
+        genes = conn.execute(
+            text("SELECT entrez_id, gene_symbol, chromosome, sense FROM genes")
+        ).fetchall()
+        exons = conn.execute(
+            text("SELECT entrez_id, exon_number, product FROM exons")
+        ).fetchall()
+    assert n_chromosomes == 16
+    assert genes == [(851357, "RAD51", "NC_001137.3", False)]
+    assert exons == [(851357, 1, "recombinase RAD51")]
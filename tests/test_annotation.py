@@ -0,0 +1,47 @@
+import os.path
+import pickle
+import numpy as np
+import pytest
+from guidescanpy.flask.core.annotation import ExonIndex
+
+
+@pytest.fixture(scope="module")
+def interval_trees(data_folder):
+    return pickle.load(
+        open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+    )
+
+
+def interval_tree_annotations(interval_tree, begin, end):
+    overlaps = sorted(interval_tree[begin:end])
+    return ";".join(f"Exon {o.data[0]} of {o.data[1]}" for o in overlaps)
+
+
+def test_exon_index_matches_interval_trees(interval_trees):
+    exon_index = ExonIndex.from_interval_trees(interval_trees)
+    rng = np.random.default_rng(42)
+    for accession, interval_tree in interval_trees.items():
+        begins = rng.integers(0, interval_tree.end(), size=500)
+        ends = begins + rng.choice([1, 1, 20, 500], size=500)
+        annotations = exon_index.annotations(accession, begins, ends)
+        for begin, end, annotation in zip(begins, ends, annotations):
+            assert annotation == interval_tree_annotations(interval_tree, begin, end)
+
+
+def test_exon_index_unknown_accession(interval_trees):
+    exon_index = ExonIndex.from_interval_trees(interval_trees)
+    assert exon_index.annotations("NC_000000.0", [10, 20], [11, 21]) == ["", ""]
+    assert exon_index.annotations("NC_001134.8", [], []) == []
+
+
+def test_exon_index_save_load(interval_trees, tmp_path):
+    exon_index = ExonIndex.from_interval_trees(interval_trees)
+    exon_index.save(tmp_path)
+    loaded = ExonIndex.load(tmp_path)
+    assert len(loaded) == len(exon_index)
+    for accession in interval_trees:
+        assert accession in loaded
+        assert isinstance(loaded.exons[accession], np.memmap)
+        np.testing.assert_array_equal(
+            loaded.exons[accession], exon_index.exons[accession]
+        )
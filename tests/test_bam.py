@@ -1,5 +1,9 @@
+import os
+import binascii
+import numpy as np
 import pysam
-from guidescanpy.flask.core.utils import hex_to_offtarget_info
+from guidescanpy.flask.core.utils import hex_to_offtarget_info, hex_to_offtarget_arrays
+from guidescanpy.flask.core.bam import BamPool
 
 
 def test_bam_header(bam_file):
@@ -17,3 +21,57 @@ def test_bam_view(bam_file):
         _ = hex_to_offtarget_info(offtarget, delim=-12157106)
         n_reads += 1
     assert n_reads == 59757
+
+
+def test_hex_to_offtarget_arrays():
+    delim = -12157106
+    mainarr = np.array(
+        [1000, 0, delim, -2000, 3000, 2, delim, 4000, 3, delim], dtype=int
+    )
+    offtarget = binascii.hexlify(mainarr.tobytes())
+    distances, positions = hex_to_offtarget_arrays(offtarget, delim=delim)
+    assert list(zip(distances, positions)) == hex_to_offtarget_info(
+        offtarget, delim=delim
+    )
+    assert distances.tolist() == [0, 2, 2, 3]
+    assert positions.tolist() == [1000, -2000, 3000, 4000]
+
+
+def test_bam_pool(tmp_path):
+    filepath = str(tmp_path / "test.bam")
+    header = {"HD": {"VN": "1.0", "SO": "coordinate"}, "SQ": [{"SN": "ref", "LN": 100}]}
+    with pysam.AlignmentFile(filepath, "wb", header=header) as bam:
+        read = pysam.AlignedSegment()
+        read.query_name = "read"
+        read.query_sequence = "ACGTACGTACGTACGTACGTAGG"
+        read.reference_id = 0
+        read.reference_start = 10
+        read.cigarstring = "23M"
+        bam.write(read)
+
+    pool = BamPool()
+    with pool.alignment_file(filepath) as bam:
+        # Index is created on first use
+        assert bam.has_index()
+        assert len(list(bam.fetch("ref", 0, 100))) == 1
+        first = bam
+
+    with pool.alignment_file(filepath) as bam:
+        assert bam is first  # Handle is reused
+        with pool.alignment_file(filepath) as other:
+            assert other is not bam  # A handle is never shared while in use
+
+    stat = os.stat(filepath)
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    with pool.alignment_file(filepath) as bam:
+        assert bam is not first  # Handle is re-opened when the file changes
+        assert len(list(bam.fetch("ref", 0, 100))) == 1
+
+    # Handles beyond `max_idle` are closed when they are released
+    pool = BamPool(max_idle=1)
+    with pool.alignment_file(filepath) as bam:
+        with pool.alignment_file(filepath) as other:
+            pass
+        assert other.is_open  # Kept, as the only idle handle
+    assert other.is_open and not bam.is_open
+    assert pool._idle[filepath][0][1] is other
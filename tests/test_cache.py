@@ -0,0 +1,71 @@
+import os.path
+import pickle
+from collections import OrderedDict
+import numpy as np
+import pytest
+from guidescanpy.commands import build_cache as build_cache_command
+from guidescanpy.flask.core.annotation import ExonIndex
+from guidescanpy.flask.core.cache import (
+    save_organism_cache,
+    clear_organism_cache,
+    load_chromosome_names,
+    load_reference_lengths,
+    load_exon_index,
+)
+
+
+@pytest.fixture
+def cachedir(tmp_path, monkeypatch):
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_CACHEDIR", str(tmp_path))
+    return tmp_path
+
+
+def test_organism_cache(cachedir, data_folder, sacCer3_chromosome_names):
+    exon_index = ExonIndex.from_interval_trees(
+        pickle.load(
+            open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+        )
+    )
+    bam_filepath = cachedir / "sacCer3.bam"
+    bam_filepath.write_bytes(b"not really a bam file")
+    reference_lengths = OrderedDict([("NC_001133.9", 230218), ("NC_001134.8", 813184)])
+
+    assert load_chromosome_names("sacCer3") is None
+    save_organism_cache(
+        "sacCer3",
+        chromosome_names=sacCer3_chromosome_names,
+        exon_index=exon_index,
+        reference_lengths=reference_lengths,
+        bam_filepath=str(bam_filepath),
+    )
+
+    assert load_chromosome_names("sacCer3") == sacCer3_chromosome_names
+    assert load_reference_lengths("sacCer3", str(bam_filepath)) == reference_lengths
+    cached_exon_index = load_exon_index("sacCer3")
+    for accession, exons in exon_index.exons.items():
+        np.testing.assert_array_equal(cached_exon_index.exons[accession], exons)
+
+    # Cached lengths are not used for a different (or modified) bam file
+    assert load_reference_lengths("sacCer3", str(cachedir / "other.bam")) is None
+    bam_filepath.write_bytes(b"a modified bam file")
+    assert load_reference_lengths("sacCer3", str(bam_filepath)) is None
+
+    clear_organism_cache("sacCer3")
+    assert load_chromosome_names("sacCer3") is None
+    assert load_exon_index("sacCer3") is None
+
+
+def test_build_cache_main(monkeypatch):
+    built = []
+
+    def build_cache(organism):
+        if organism == "mm10":
+            raise ValueError(f"No chromosomes found for organism {organism}")
+        built.append(organism)
+
+    monkeypatch.setattr(build_cache_command, "build_cache", build_cache)
+    # Organisms missing from the database are skipped, unless they were named
+    build_cache_command.main([])
+    assert "mm10" not in built and "sacCer3" in built
+    with pytest.raises(ValueError):
+        build_cache_command.main(["sacCer3", "mm10"])
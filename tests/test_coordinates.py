@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from guidescanpy.flask.core.coordinates import CoordinateMapper
+from guidescanpy.flask.core.utils import map_int_to_coord
+
+SQ = [
+    {"SN": "NC_001133.9", "LN": 230218},
+    {"SN": "NC_001134.8", "LN": 813184},
+    {"SN": "NC_001135.5", "LN": 316620},
+]
+
+
+def test_coordinate_mapper_scalar():
+    mapper = CoordinateMapper.from_header(SQ)
+    assert mapper.length == 230218 + 813184 + 316620
+    assert mapper(5) == ("NC_001133.9", 5, "+")
+    assert mapper(-230217) == ("NC_001133.9", 230217, "-")
+    assert mapper(230218) == ("NC_001134.8", 0, "+")
+    assert mapper(-(230218 + 813184 + 10)) == ("NC_001135.5", 10, "-")
+    # Map from header records directly
+    assert map_int_to_coord(230218 + 100, SQ) == ("NC_001134.8", 100, "+")
+    with pytest.raises(IndexError):
+        mapper(mapper.length)
+
+
+def test_coordinate_mapper_array():
+    mapper = CoordinateMapper.from_header(SQ)
+    references, positions, is_forward = mapper.to_coordinates(
+        [5, -230218, 230218 + 813184 + 7, -1]
+    )
+    assert references.tolist() == [0, 1, 2, 0]
+    assert positions.tolist() == [5, 0, 7, 1]
+    assert is_forward.tolist() == [True, False, True, False]
+    assert mapper.find_references(np.array([0, 230217, 230218])).tolist() == [0, 0, 1]
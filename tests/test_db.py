@@ -1,4 +1,48 @@
+import pytest
+from sqlalchemy import inspect, text
+from guidescanpy.flask import db
 from guidescanpy.flask.db import create_region_query, get_chromosome_names
+from guidescanpy.flask.tables import Base
+from guidescanpy.commands.init_db import create_indexes
+
+
+@pytest.fixture
+def library_db(empty_db):
+    db.insert_genes(
+        [
+            {
+                "entrez_id": entrez_id,
+                "gene_symbol": gene_symbol,
+                "chromosome": "NC_001146.8",
+                "sense": True,
+                "start_pos": 196426,
+                "end_pos": 197943,
+            }
+            for entrez_id, gene_symbol in (
+                (855480, "ZWF1"),
+                (855480, "MET19"),
+                (851357, "RAD51"),
+            )
+        ]
+    )
+    for i, (organism, gene_symbol) in enumerate(
+        (
+            ("sacCer3", "ZWF1"),
+            ("sacCer3", "MET19"),
+            ("sacCer3", "RAD51"),
+            ("hg38", "ZWF1"),
+        )
+    ):
+        db.get_connection().execute(
+            text(
+                "INSERT INTO libraries (grna, organism, source, gene_symbol, grna_type, "
+                "offtarget0, offtarget1, offtarget2, offtarget3) "
+                "VALUES (:grna, :organism, 'test', :gene_symbol, 'targeting', 0, 0, 0, 0)"
+            ),
+            {"grna": f"GUIDE{i}", "organism": organism, "gene_symbol": gene_symbol},
+        )
+    db.get_connection().commit()
+    yield empty_db
 
 
 def test_create_region_query_CNE1():
@@ -37,3 +81,73 @@ def test_get_chromosome_names():
     assert len(results) == 16
     assert results["NC_001140.6"] == "chrVIII"
     assert results["NC_001147.6"] == "chrXV"
+
+
+def test_get_library_info_by_gene(library_db):
+    genes = ["MET19", "RAD51", "NOPE", "MET19"]
+    results = db.get_library_info_by_gene("sacCer3", genes)
+    assert list(results) == ["MET19", "RAD51", "NOPE"]
+    # Guides for all symbols of a gene are found, each only once, in a deterministic order
+    assert [r["grna"] for r in results["MET19"]] == ["GUIDE1", "GUIDE0"]
+    assert [r["grna"] for r in results["RAD51"]] == ["GUIDE2"]
+    assert results["NOPE"] == []
+    assert set(results["RAD51"][0]) == {
+        c.name for c in Base.metadata.tables["libraries"].columns
+    }
+
+    # Genes are looked up in chunks
+    assert db.get_library_info_by_gene("sacCer3", genes, chunk_size=1) == results
+
+    results = db.get_library_info_by_gene("sacCer3", genes, n_guides=1)
+    assert [r["grna"] for r in results["MET19"]] == ["GUIDE1"]
+    assert [r["grna"] for r in results["RAD51"]] == ["GUIDE2"]
+
+
+def test_create_indexes(library_db):
+    # A database created before indexes were declared
+    with library_db.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(text(f"DROP INDEX {index.name}"))
+    assert inspect(library_db).get_indexes("genes") == []
+
+    create_indexes(library_db)
+    create_indexes(library_db)  # no-op
+    assert {index["name"] for index in inspect(library_db).get_indexes("genes")} == {
+        "ix_genes_gene_symbol",
+        "ix_genes_entrez_id",
+    }
+
+    plans = db.query_plans("sacCer3")
+    assert any(
+        "ix_genes_gene_symbol" in line for line in plans["region by gene symbol"]
+    )
+    assert any("ix_genes_entrez_id" in line for line in plans["region by entrez id"])
+    assert any(
+        "ix_libraries_organism_gene_symbol" in line
+        for line in plans["library info by genes"]
+    )
+
+
+def test_pooled_connections(empty_db, app):
+    from concurrent.futures import ThreadPoolExecutor
+
+    conn = db.get_connection()
+    assert db.get_connection() is conn
+
+    def check_out():
+        return db.get_connection() is not conn and db.pool_stats()["checked-out"]
+
+    # Threads check out connections of their own
+    with ThreadPoolExecutor(1) as executor:
+        assert executor.submit(check_out).result() == 2
+
+    db.release_connection()
+    assert db.get_connection() is not conn
+
+    # Connections are returned to the pool at the end of requests
+    stats = app.test_client().get("py/info/stats").json["db-pool"]
+    assert stats["checked-out"] == 1
+    with app.app_context():
+        db.get_connection()
+    assert db.pool_stats()["checked-out"] == 0
@@ -0,0 +1,260 @@
+import sqlite3
+import threading
+import time
+from unittest.mock import patch
+import pandas as pd
+import pytest
+from guidescanpy.core import enumerate as enumerate_module
+from guidescanpy.core.enumerate import IndexWorker, EnumerateBatcher, enumerate_kmers
+from guidescanpy.core import kmer_cache as kmer_cache_module
+from guidescanpy.core.kmer_cache import KmerCache
+from guidescanpy.core.guidescan import EnumerateError
+
+
+@pytest.fixture
+def index(tmp_path):
+    prefix = str(tmp_path / "sacCer3.index")
+    for suffix, content in (
+        ("forward", b"ACGT" * 1024),
+        ("reverse", b"TGCA"),
+        ("gs", b""),
+    ):
+        with open(f"{prefix}.{suffix}", "wb") as f:
+            f.write(content)
+    return prefix
+
+
+@pytest.fixture
+def cachedir(tmp_path, monkeypatch):
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_CACHEDIR", str(tmp_path))
+    return tmp_path
+
+
+def test_index_worker(index, cachedir):
+    worker = IndexWorker(index, threads=4)
+    with patch("guidescanpy.core.enumerate.cmd_enumerate") as cmd_enumerate:
+        cmd_enumerate.side_effect = ["data", EnumerateError("failed", returncode=1)]
+        assert worker.enumerate(["ACGT"], pam="NGG") == "data"
+        with pytest.raises(EnumerateError):
+            worker.enumerate(["ACGT"], pam="NGG")
+    cmd_enumerate.assert_called_with(
+        ["ACGT"], index_filepath_prefix=index, threads=4, pam="NGG"
+    )
+    assert worker.stats() == {"runs": 2, "failures": 1}
+
+
+def max_concurrent_runs(workers, n=6):
+    """
+    The maximum number of `cmd_enumerate` runs in progress at once when `n` threads each
+    enumerate through one of `workers` in turn.
+    """
+    running, max_running = [0], [0]
+    lock = threading.Lock()
+
+    def cmd_enumerate(*args, **kwargs):
+        with lock:
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    with patch("guidescanpy.core.enumerate.cmd_enumerate", cmd_enumerate):
+        threads = [
+            threading.Thread(
+                target=workers[i % len(workers)].enumerate,
+                args=(["ACGT"],),
+                kwargs={"pam": "NGG"},
+            )
+            for i in range(n)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return max_running[0]
+
+
+def test_index_worker_concurrency(index, cachedir):
+    assert max_concurrent_runs([IndexWorker(index, concurrency=2)]) == 2
+
+
+def test_index_worker_concurrency_shared(index, cachedir):
+    # Workers of separate processes share the run slots of an index
+    workers = [IndexWorker(index, concurrency=2) for _ in range(3)]
+    assert max_concurrent_runs(workers) == 2
+    assert sum(worker.stats()["runs"] for worker in workers) == 6
+
+
+class FakeManager:
+    def __init__(self):
+        self.calls = []
+        self.unblock = threading.Event()
+
+    def enumerate(self, kmers, index_filepath_prefix, **kwargs):
+        if "BLOCK" in kmers:
+            self.unblock.wait(timeout=10)
+        else:
+            self.calls.append(kmers)
+        time.sleep(0.05)
+        if "FAIL" in kmers:
+            raise EnumerateError("failed", returncode=1)
+        # Two matches per kmer, in the order of the kmers
+        return pd.DataFrame(
+            {
+                "id": [f"id_{i:08}" for i, _ in enumerate(kmers) for _ in range(2)],
+                "sequence": [kmer for kmer in kmers for _ in range(2)],
+                "match_position": [p for i, _ in enumerate(kmers) for p in (i, -i)],
+            }
+        )
+
+
+def run_concurrently(batcher, calls):
+    """
+    Results (or errors) of `batcher.enumerate` for each (kmers, kwargs) of `calls`, made
+    concurrently while another call is in progress (so that they are held back to be batched).
+    """
+    calls = [(["BLOCK"], {"pam": "BLOCK"})] + calls
+    results = [None] * len(calls)
+
+    def run(i):
+        kmers, kwargs = calls[i]
+        try:
+            results[i] = batcher.enumerate(kmers, "index", **kwargs)
+        except Exception as e:  # noqa
+            results[i] = e
+
+    batcher.manager.unblock.clear()
+    blocker = threading.Thread(target=run, args=(0,))
+    blocker.start()
+    while not batcher.active:
+        time.sleep(0.001)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(1, len(calls))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.manager.unblock.set()
+    blocker.join()
+    return results[1:]
+
+
+def test_enumerate_batcher(monkeypatch):
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_ENUMERATE_BATCH_WINDOW", "0.5")
+    manager = FakeManager()
+    batcher = EnumerateBatcher(manager)
+    requests = [["AAAA", "CCCC"], ["CCCC", "GGGG", "CCCC"], ["TTTT"]]
+    kwargs = {"pam": "NGG", "mismatches": 1}
+    results = run_concurrently(batcher, [(kmers, kwargs) for kmers in requests])
+
+    # A single run, with each kmer enumerated once
+    assert manager.calls == [["AAAA", "CCCC", "GGGG", "TTTT"]]
+    assert batcher.stats() == {"calls": 4, "runs": 2}
+    for kmers, result in zip(requests, results):
+        expected = FakeManager().enumerate(kmers, "index")
+        assert result["id"].tolist() == expected["id"].tolist()
+        assert result["sequence"].tolist() == expected["sequence"].tolist()
+
+    # Calls with different arguments are not batched together
+    run_concurrently(
+        batcher, [(["AAAA"], {"pam": "NGG", "mismatches": m}) for m in (1, 2)]
+    )
+    assert batcher.stats() == {"calls": 7, "runs": 5}
+
+    # Calls on their own are not held back
+    start = time.perf_counter()
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_ENUMERATE_BATCH_WINDOW", "5")
+    batcher.enumerate(["AAAA"], "index", pam="NGG")
+    assert time.perf_counter() - start < 1
+
+
+def test_enumerate_batcher_error(monkeypatch):
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_ENUMERATE_BATCH_WINDOW", "0.5")
+    batcher = EnumerateBatcher(FakeManager())
+    kwargs = {"pam": "NGG"}
+
+    # All callers of a failed run get its error
+    results = run_concurrently(batcher, [(["AAAA"], kwargs), (["FAIL"], kwargs)])
+    assert all(isinstance(result, EnumerateError) for result in results)
+
+    # Including when the results of the run cannot be split between them
+    def split_rows(data, n):
+        raise ValueError("unexpected output")
+
+    monkeypatch.setattr(enumerate_module, "split_rows", split_rows)
+    results = run_concurrently(batcher, [(["AAAA"], kwargs), (["CCCC"], kwargs)])
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_enumerate_kmers(index, tmp_path, monkeypatch):
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_CACHEDIR", str(tmp_path))
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_ENUMERATE_BATCH_WINDOW", "0")
+    manager = FakeManager()
+    monkeypatch.setattr(
+        enumerate_module, "enumerate_batcher", EnumerateBatcher(manager)
+    )
+    monkeypatch.setattr(enumerate_module, "kmer_cache", KmerCache())
+
+    expected = FakeManager().enumerate(["AAAA", "CCCC", "AAAA"], index)
+    result = enumerate_kmers(["AAAA", "CCCC", "AAAA"], index, pam="NGG")
+    assert manager.calls == [["AAAA", "CCCC"]]
+    assert result["id"].tolist() == expected["id"].tolist()
+    assert result["sequence"].tolist() == expected["sequence"].tolist()
+
+    # Only kmers that are not cached are enumerated
+    result = enumerate_kmers(["GGGG", "CCCC"], index, pam="NGG")
+    assert manager.calls[1:] == [["GGGG"]]
+    assert result["sequence"].tolist() == ["GGGG"] * 2 + ["CCCC"] * 2
+    assert result["match_position"].tolist() == [0, 0, 1, -1]  # as first enumerated
+    result = enumerate_kmers(["CCCC"], index, pam="NAG")
+    assert manager.calls[2:] == [["CCCC"]]
+    assert enumerate_module.kmer_cache.stats()["entries"] == 4
+
+    # Cached rows are not used once the index files change (when they are checked again)
+    monkeypatch.setattr(kmer_cache_module, "FINGERPRINT_INTERVAL", 0)
+    with open(f"{index}.reverse", "ab") as f:
+        f.write(b"TGCA")
+    enumerate_kmers(["CCCC"], index, pam="NGG")
+    assert manager.calls[3:] == [["CCCC"]]
+    assert enumerate_module.kmer_cache.stats()["entries"] == 1
+
+
+def test_enumerate_kmers_fingerprint(index, tmp_path, monkeypatch):
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_CACHEDIR", str(tmp_path))
+    cache = KmerCache()
+    rows = FakeManager().enumerate(["AAAA"], index)
+    with patch(
+        "guidescanpy.core.kmer_cache.index_fingerprint",
+        wraps=kmer_cache_module.index_fingerprint,
+    ) as index_fingerprint:
+        cache.set({"AAAA": rows}, index, pam="NGG")
+        assert list(cache.get(["AAAA", "CCCC"], index, pam="NGG")) == ["AAAA"]
+        # The index files are only checked again after FINGERPRINT_INTERVAL seconds
+        assert index_fingerprint.call_count == 1
+        monkeypatch.setattr(kmer_cache_module, "FINGERPRINT_INTERVAL", 0)
+        cache.get(["AAAA"], index, pam="NGG")
+        assert index_fingerprint.call_count == 2
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_enumerate_kmers_cache_error(index, tmp_path, monkeypatch):
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_CACHEDIR", str(tmp_path))
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_ENUMERATE_BATCH_WINDOW", "0")
+    manager = FakeManager()
+    monkeypatch.setattr(
+        enumerate_module, "enumerate_batcher", EnumerateBatcher(manager)
+    )
+    cache = KmerCache()
+    monkeypatch.setattr(enumerate_module, "kmer_cache", cache)
+    expected = FakeManager().enumerate(["AAAA", "CCCC"], index)
+
+    # Kmers are enumerated without the cache if it cannot be read or written
+    for method in ("get", "set"):
+        with patch.object(
+            cache, method, side_effect=sqlite3.OperationalError("database is locked")
+        ):
+            result = enumerate_kmers(["AAAA", "CCCC"], index, pam="NGG")
+        assert result["sequence"].tolist() == expected["sequence"].tolist()
+    assert manager.calls == [["AAAA", "CCCC"]] * 2
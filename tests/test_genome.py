@@ -5,6 +5,7 @@ import os.path
 from unittest.mock import patch
 import pickle
 from guidescanpy.flask.core.genome import get_genome_structure
+from guidescanpy.flask.core.annotation import ExonIndex
 
 
 def assert_equal_offtargets(legacy, new):
@@ -39,13 +40,13 @@ def test_genome_structure(patched_fn, bam_file, sacCer3_chromosome_names):
     assert genome_structure.off_target_delim == -12157106
 
 
-@patch("guidescanpy.flask.core.parser.create_region_query")
+@patch("guidescanpy.flask.core.parser.create_region_queries")
 @patch("guidescanpy.flask.core.genome.get_chromosome_names")
 def test_genome_structure_parse_CNE1(
     patched_fn1, patched_fn2, bam_file, sacCer3_chromosome_names, sacCer3_region_CNE1
 ):
     patched_fn1.return_value = sacCer3_chromosome_names
-    patched_fn2.return_value = sacCer3_region_CNE1
+    patched_fn2.return_value = {"CNE1": sacCer3_region_CNE1}
     genome_structure = get_genome_structure(organism="sacCer3", bam_filepath=bam_file)
     region = genome_structure.parse_regions("CNE1")[0]
     assert region["region-name"] == "CNE1"
@@ -53,14 +54,16 @@ def test_genome_structure_parse_CNE1(
     assert region["coords"] == ("chrI", 37464, 38972)
 
 
-@patch("guidescanpy.flask.core.genome.get_chromosome_interval_trees")
+@patch("guidescanpy.flask.core.genome.get_exon_index")
 @patch("guidescanpy.flask.core.genome.get_chromosome_names")
 def test_genome_structure_query_manual(
     patched_fn1, patched_fn2, data_folder, bam_file, sacCer3_chromosome_names
 ):
     patched_fn1.return_value = sacCer3_chromosome_names
-    patched_fn2.return_value = pickle.load(
-        open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+    patched_fn2.return_value = ExonIndex.from_interval_trees(
+        pickle.load(
+            open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+        )
     )
     genome_structure = get_genome_structure(organism="sacCer3", bam_filepath=bam_file)
     # manually selected region on chrI for CNE1 gene
@@ -69,8 +72,8 @@ def test_genome_structure_query_manual(
     assert len(results) == 150
 
 
-@patch("guidescanpy.flask.core.genome.get_chromosome_interval_trees")
-@patch("guidescanpy.flask.core.parser.create_region_query")
+@patch("guidescanpy.flask.core.genome.get_exon_index")
+@patch("guidescanpy.flask.core.parser.create_region_queries")
 @patch("guidescanpy.flask.core.genome.get_chromosome_names")
 def test_genome_structure_query_CNE1(
     patched_fn1,
@@ -82,9 +85,11 @@ def test_genome_structure_query_CNE1(
     sacCer3_region_CNE1,
 ):
     patched_fn1.return_value = sacCer3_chromosome_names
-    patched_fn2.return_value = sacCer3_region_CNE1
-    patched_fn3.return_value = pickle.load(
-        open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+    patched_fn2.return_value = {"CNE1": sacCer3_region_CNE1}
+    patched_fn3.return_value = ExonIndex.from_interval_trees(
+        pickle.load(
+            open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+        )
     )
     genome_structure = get_genome_structure(organism="sacCer3", bam_filepath=bam_file)
     region = genome_structure.parse_regions("CNE1")[0]
@@ -108,14 +113,16 @@ def test_genome_structure_query_CNE1(
     assert_equal_offtargets(old_results, results)
 
 
-@patch("guidescanpy.flask.core.genome.get_chromosome_interval_trees")
+@patch("guidescanpy.flask.core.genome.get_exon_index")
 @patch("guidescanpy.flask.core.genome.get_chromosome_names")
 def test_genome_structure_query_manual_filter_annotated(
     patched_fn1, patched_fn2, data_folder, bam_file, sacCer3_chromosome_names
 ):
     patched_fn1.return_value = sacCer3_chromosome_names
-    patched_fn2.return_value = pickle.load(
-        open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+    patched_fn2.return_value = ExonIndex.from_interval_trees(
+        pickle.load(
+            open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+        )
     )
     genome_structure = get_genome_structure(organism="sacCer3", bam_filepath=bam_file)
     region = genome_structure.parse_regions("chrII:5000-10000")[0]
@@ -145,8 +152,8 @@ def test_genome_structure_query_manual_filter_annotated(
     assert_equal_offtargets(old_results, results)
 
 
-@patch("guidescanpy.flask.core.genome.get_chromosome_interval_trees")
-@patch("guidescanpy.flask.core.parser.create_region_query")
+@patch("guidescanpy.flask.core.genome.get_exon_index")
+@patch("guidescanpy.flask.core.parser.create_region_queries")
 @patch("guidescanpy.flask.core.genome.get_chromosome_names")
 def test_genome_structure_query_CNE1_min_specificity(
     patched_fn1,
@@ -158,9 +165,11 @@ def test_genome_structure_query_CNE1_min_specificity(
     sacCer3_region_CNE1,
 ):
     patched_fn1.return_value = sacCer3_chromosome_names
-    patched_fn2.return_value = sacCer3_region_CNE1
-    patched_fn3.return_value = pickle.load(
-        open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+    patched_fn2.return_value = {"CNE1": sacCer3_region_CNE1}
+    patched_fn3.return_value = ExonIndex.from_interval_trees(
+        pickle.load(
+            open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+        )
     )
     genome_structure = get_genome_structure(organism="sacCer3", bam_filepath=bam_file)
     region = genome_structure.parse_regions("CNE1")[0]
@@ -187,8 +196,8 @@ def test_genome_structure_query_CNE1_min_specificity(
     assert_equal_offtargets(old_results, results)
 
 
-@patch("guidescanpy.flask.core.genome.get_chromosome_interval_trees")
-@patch("guidescanpy.flask.core.parser.create_region_query")
+@patch("guidescanpy.flask.core.genome.get_exon_index")
+@patch("guidescanpy.flask.core.parser.create_region_queries")
 @patch("guidescanpy.flask.core.genome.get_chromosome_names")
 def test_genome_structure_query_CNE1_min_cutting_efficiency(
     patched_fn1,
@@ -200,9 +209,11 @@ def test_genome_structure_query_CNE1_min_cutting_efficiency(
     sacCer3_region_CNE1,
 ):
     patched_fn1.return_value = sacCer3_chromosome_names
-    patched_fn2.return_value = sacCer3_region_CNE1
-    patched_fn3.return_value = pickle.load(
-        open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+    patched_fn2.return_value = {"CNE1": sacCer3_region_CNE1}
+    patched_fn3.return_value = ExonIndex.from_interval_trees(
+        pickle.load(
+            open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+        )
     )
     genome_structure = get_genome_structure(organism="sacCer3", bam_filepath=bam_file)
     region = genome_structure.parse_regions("CNE1")[0]
@@ -232,8 +243,8 @@ def test_genome_structure_query_CNE1_min_cutting_efficiency(
     assert_equal_offtargets(old_results, results)
 
 
-@patch("guidescanpy.flask.core.genome.get_chromosome_interval_trees")
-@patch("guidescanpy.flask.core.parser.create_region_query")
+@patch("guidescanpy.flask.core.genome.get_exon_index")
+@patch("guidescanpy.flask.core.parser.create_region_queries")
 @patch("guidescanpy.flask.core.genome.get_chromosome_names")
 def test_genome_structure_query_CNE1_min_gc_content(
     patched_fn1,
@@ -245,9 +256,11 @@ def test_genome_structure_query_CNE1_min_gc_content(
     sacCer3_region_CNE1,
 ):
     patched_fn1.return_value = sacCer3_chromosome_names
-    patched_fn2.return_value = sacCer3_region_CNE1
-    patched_fn3.return_value = pickle.load(
-        open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+    patched_fn2.return_value = {"CNE1": sacCer3_region_CNE1}
+    patched_fn3.return_value = ExonIndex.from_interval_trees(
+        pickle.load(
+            open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+        )
     )
     genome_structure = get_genome_structure(organism="sacCer3", bam_filepath=bam_file)
     region = genome_structure.parse_regions("CNE1")[0]
@@ -277,8 +290,8 @@ def test_genome_structure_query_CNE1_min_gc_content(
     assert_equal_offtargets(old_results, results)
 
 
-@patch("guidescanpy.flask.core.genome.get_chromosome_interval_trees")
-@patch("guidescanpy.flask.core.parser.create_region_query")
+@patch("guidescanpy.flask.core.genome.get_exon_index")
+@patch("guidescanpy.flask.core.parser.create_region_queries")
 @patch("guidescanpy.flask.core.genome.get_chromosome_names")
 def test_genome_structure_query_CNE1_filter_pattern(
     patched_fn1,
@@ -290,9 +303,11 @@ def test_genome_structure_query_CNE1_filter_pattern(
     sacCer3_region_CNE1,
 ):
     patched_fn1.return_value = sacCer3_chromosome_names
-    patched_fn2.return_value = sacCer3_region_CNE1
-    patched_fn3.return_value = pickle.load(
-        open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+    patched_fn2.return_value = {"CNE1": sacCer3_region_CNE1}
+    patched_fn3.return_value = ExonIndex.from_interval_trees(
+        pickle.load(
+            open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+        )
     )
     genome_structure = get_genome_structure(organism="sacCer3", bam_filepath=bam_file)
     region = genome_structure.parse_regions("CNE1")[0]
@@ -307,8 +322,8 @@ def test_genome_structure_query_CNE1_filter_pattern(
     assert len(results) == 48
 
 
-@patch("guidescanpy.flask.core.genome.get_chromosome_interval_trees")
-@patch("guidescanpy.flask.core.parser.create_region_query")
+@patch("guidescanpy.flask.core.genome.get_exon_index")
+@patch("guidescanpy.flask.core.parser.create_region_queries")
 @patch("guidescanpy.flask.core.genome.get_chromosome_names")
 def test_genome_structure_query_offtarget_on_scaffold(
     patched_fn1,
@@ -320,9 +335,11 @@ def test_genome_structure_query_offtarget_on_scaffold(
     sacCer3_region_CNE1,
 ):
     patched_fn1.return_value = sacCer3_chromosome_names
-    patched_fn2.return_value = sacCer3_region_CNE1
-    patched_fn3.return_value = pickle.load(
-        open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+    patched_fn2.return_value = {"CNE1": sacCer3_region_CNE1}
+    patched_fn3.return_value = ExonIndex.from_interval_trees(
+        pickle.load(
+            open(os.path.join(data_folder, "sacCer3_chrI_II_IX_itrees.pkl"), "rb")
+        )
     )
     genome_structure = get_genome_structure(organism="sacCer3", bam_filepath=bam_file)
     region = genome_structure.parse_regions("chrIX:202231-202253")[0]
@@ -1,4 +1,36 @@
-from guidescanpy.core.guidescan import cmd_enumerate
+import sys
+import textwrap
+import pytest
+from guidescanpy.core.guidescan import cmd_enumerate, iter_enumerate, EnumerateError
+
+# A stand-in for `guidescan enumerate` that reports an exact match for every kmer, and
+# waits for the file $GO (if set) to exist after the first one
+FAKE_GUIDESCAN = """
+    import os, sys, time
+    args = sys.argv[1:]
+    input_path, output_path = args[args.index("-f") + 1], args[args.index("-o") + 1]
+    with open(input_path) as f:
+        rows = [line.strip().split(",") for line in f][1:]
+    with open(output_path, "w") as f:
+        f.write("id,sequence,match_chrm,match_position,match_strand,match_distance,"
+                "match_sequence,rna_bulges,dna_bulges,specificity\\n")
+        for i, (id, kmer, pam, *_) in enumerate(rows):
+            if kmer == "FAIL":
+                sys.exit(1)
+            f.write(f"{id},{kmer}{pam},chrI,{i},+,0,{kmer}AGG,0,0,1.0\\n")
+            f.flush()
+            while os.environ.get("GO") and not os.path.exists(os.environ["GO"]):
+                time.sleep(0.01)
+"""
+
+
+@pytest.fixture
+def fake_guidescan(tmp_path, monkeypatch):
+    path = tmp_path / "guidescan"
+    path.write_text(f"#!{sys.executable}\n" + textwrap.dedent(FAKE_GUIDESCAN))
+    path.chmod(0o755)
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_BIN", str(path))
+    return path
 
 
 def test_enumerate_cas9_exact(index_prefix):
@@ -104,3 +136,36 @@ def test_enumerate_arbitrary(index_prefix):
         & (results.match_distance == 0)
     ]
     assert len(kmer1_exact_matches) == 0
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_enumerate_stream(fake_guidescan, stream):
+    results = cmd_enumerate(
+        kmers=["AAAA", "CCCC"], pam="NGG", index_filepath_prefix="index", stream=stream
+    )
+    assert results["id"].tolist() == ["id_00000000", "id_00000001"]
+    assert results["match_position"].dtype == "Int64"
+    assert results.iloc[1]["match_sequence"] == "CCCCAGG"
+
+    with pytest.raises(EnumerateError):
+        cmd_enumerate(
+            kmers=["AAAA", "FAIL"],
+            pam="NGG",
+            index_filepath_prefix="index",
+            stream=stream,
+        )
+
+
+def test_iter_enumerate(fake_guidescan, tmp_path, monkeypatch):
+    go = tmp_path / "go"
+    monkeypatch.setenv("GO", str(go))
+    chunks = iter_enumerate(
+        kmers=["AAAA", "CCCC", "GGGG"],
+        pam="NGG",
+        index_filepath_prefix="index",
+        chunk_size=1,
+    )
+    # The first result is parsed while the process is still running
+    assert next(chunks)["sequence"].tolist() == ["AAAANGG"]
+    go.touch()
+    assert [s for chunk in chunks for s in chunk["sequence"]] == ["CCCCNGG", "GGGGNGG"]
@@ -0,0 +1,179 @@
+import json
+import numpy as np
+from guidescanpy.flask.core.hits import (
+    Hits,
+    TopN,
+    argsort,
+    decode_query_result,
+    descending,
+    specificity_keys,
+)
+
+
+def make_hits():
+    columns = {
+        "id": ["a", "b", "c"],
+        "query-sequence": ["AAA", "CCC", "GGG"],
+        "gc-content": [0.0, 1.0, 1.0],
+        "reference-name": ["NC_001133.9"] * 3,
+        "offtargets-by-distance": [[1, 0, 0, 0], [1, 0, 1, 1], [1, 0, 0, 1]],
+        "coordinate": ["chrI:1-23:+", "chrI:2-24:-", "chrI:3-25:+"],
+        "sequence": ["AAA", "CCC", "GGG"],
+        "start": [1, 2, 3],
+        "end": [23, 24, 25],
+        "direction": ["+", "-", "+"],
+        "cutting-efficiency": [0.5, None, 0.7],
+        "specificity": [0.1, 0.9, None],
+        "off-target-summary": ["2:0|3:0", "2:1|3:1", "2:0|3:1"],
+        "n-off-targets": [0, 2, 1],
+        "annotations": ["", "Exon 1 of foo", ""],
+        "region-string": ["chrI:1-100"] * 3,
+    }
+    off_targets = {
+        "position": [1022, 500, 2000],
+        "chromosome": ["II", "III", "IV"],
+        "direction": ["+", "-", "+"],
+        "distance": [2, 3, 3],
+        "accession": ["NC_001134.8", "NC_001135.5", "NC_001136.10"],
+    }
+    return Hits.from_lists(columns, off_targets, [0, 0, 2, 3])
+
+
+def test_hits_json_roundtrip():
+    hits = make_hits()
+    other = Hits.from_json(hits.to_json())
+    assert len(other) == 3
+    # NaNs (missing values) compare equal here
+    np.testing.assert_equal(other.to_json(), hits.to_json())
+
+
+def test_hits_missing_scores():
+    hits = make_hits()
+    assert np.isnan(hits.columns["cutting-efficiency"][1])
+    records = hits.to_records()
+    assert records[1]["cutting-efficiency"] is None
+    assert records[2]["specificity"] is None
+    # Valid JSON (without NaN)
+    json.dumps(records, allow_nan=False)
+    json.dumps(hits.to_json(), allow_nan=False)
+
+
+def test_decode_query_result():
+    hits = make_hits()
+    for stored in (
+        hits.to_json(),
+        # Results of earlier versions have lists of hit records
+        hits.to_records(),
+    ):
+        result = {"queries": {"chrI:1-100": {"region": "chrI:1-100", "hits": stored}}}
+        result = decode_query_result(json.loads(json.dumps(result)))
+        decoded = result["queries"]["chrI:1-100"]
+        np.testing.assert_equal(decoded["hits"].to_json(), hits.to_json())
+        assert decoded["orders"]["specificity"].tolist() == [0, 1, 2]
+
+
+def test_hits_take():
+    hits = make_hits().take([2, 1])
+    assert hits.columns["id"].tolist() == ["c", "b"]
+    assert hits.off_target_offsets.tolist() == [0, 1, 3]
+    assert hits.off_targets["position"].tolist() == [2000, 1022, 500]
+
+
+def test_hits_to_records():
+    records = make_hits().to_records()
+    assert [r["id"] for r in records] == ["a", "b", "c"]
+    assert records[0]["off-targets"] == []
+    assert records[1]["offtargets-by-distance"][2] == 1
+    assert records[1]["off-targets"] == [
+        {
+            "position": 1022,
+            "chromosome": "II",
+            "direction": "+",
+            "distance": 2,
+            "accession": "NC_001134.8",
+            "region-string": "chrII:1001-1023",
+        },
+        {
+            "position": 500,
+            "chromosome": "III",
+            "direction": "-",
+            "distance": 3,
+            "accession": "NC_001135.5",
+            "region-string": "chrIII:501-523",
+        },
+    ]
+
+
+def test_hits_order():
+    hits = make_hits()
+    # Missing values are placed last regardless of sort direction
+    assert hits.order("specificity").tolist() == [0, 1, 2]
+    assert hits.order("specificity", ascending=False).tolist() == [1, 0, 2]
+    assert hits.order("sequence", ascending=False).tolist() == [2, 1, 0]
+    # Unsortable columns leave the hits in their current order
+    assert hits.order("off-targets").tolist() == [0, 1, 2]
+
+
+def test_argsort_stable():
+    values = np.array([1.0, np.nan, 2.0, 1.0, 2.0])
+    assert argsort(values).tolist() == [0, 3, 2, 4, 1]
+    assert argsort(values, ascending=False).tolist() == [2, 4, 0, 3, 1]
+
+
+def test_top_n():
+    keys = [3, 1, 2, 2, 5, 1, 2, 0]
+    top = TopN(4)
+    for i, key in enumerate(keys):
+        top.add(key, i)
+    # Items tying with the 4th smallest key are retained, in the order they were added
+    assert top.items() == [1, 2, 3, 5, 6, 7]
+
+    top = TopN(2)
+    for i, key in enumerate(keys):
+        top.add(key, i)
+    assert top.items() == [1, 5, 7]
+
+
+def test_top_n_tiebreak():
+    keys = [3, 1, 2, 2, 5, 1, 2, 0]
+    tiebreaks = [0, 2, 1, 0, 0, 1, 0, 0]
+    top = TopN(4, tiebreak=lambda i: tiebreaks[i])
+    for i, key in enumerate(keys):
+        top.add(key, i)
+    # Ties on the 4th smallest key are resolved by the tiebreak, retaining exact duplicates
+    assert top.items() == [1, 3, 5, 6, 7]
+
+
+def test_top_n_missing_specificity():
+    # All specificities are missing for cpf1 guides, so that all their keys tie
+    n_off_targets = np.random.default_rng(0).permutation(10000)
+    top = TopN(5, tiebreak=lambda i: n_off_targets[i])
+    for i, key in enumerate(specificity_keys(np.full(10000, np.nan)).tolist()):
+        top.add(key, i)
+        assert len(top) <= 5
+    assert top.items() == sorted(np.argsort(n_off_targets)[:5].tolist())
+
+
+def test_descending():
+    rng = np.random.default_rng(0)
+    for values in (
+        rng.integers(0, 5, 100),
+        np.where(rng.random(100) < 0.2, np.nan, rng.integers(0, 5, 100)),
+        np.array(["b", None, "a", "b", "c", None, "a"], dtype=object),
+        np.array([], dtype=float),
+    ):
+        np.testing.assert_array_equal(
+            descending(values, argsort(values)), argsort(values, ascending=False)
+        )
+
+
+def test_hits_orders():
+    hits = make_hits()
+    orders = hits.orders()
+    assert orders["specificity"].tolist() == [0, 1, 2]
+    for by in ("specificity", "cutting-efficiency", "sequence", "n-off-targets"):
+        for ascending in (True, False):
+            np.testing.assert_array_equal(
+                hits.order(by, ascending=ascending, orders=orders),
+                hits.order(by, ascending=ascending),
+            )
@@ -0,0 +1,104 @@
+import gzip
+from unittest.mock import patch
+import pytest
+from test_hits import make_hits
+from guidescanpy.flask.blueprints import job_query
+from guidescanpy.flask.core.results import store_result, is_handle
+from guidescanpy.flask.blueprints.job_query import (
+    blocks,
+    csv_lines,
+    _csv_lines,
+    bed_lines,
+    stream_response,
+)
+
+
+def test_csv_lines_blocks():
+    hits = make_hits()
+    for offtarget in (False, True):
+        lines = list(csv_lines([("chrI:1-100", hits)], offtarget=offtarget))
+        # Hits are ranked within their region, across blocks
+        assert lines[1:] == [
+            line
+            for first, block in blocks(hits, block_size=2)
+            for line in _csv_lines(block, first, offtarget=offtarget)
+        ]
+    assert [line.split(",")[1] for line in lines[1:]] == [
+        "chrI:1-100.1",
+        "chrI:1-100.2",
+        "chrI:1-100.2",
+        "chrI:1-100.3",
+    ]
+    # Missing scores are written as None
+    lines = list(csv_lines([("chrI:1-100", hits)]))
+    assert lines[2].split(",")[5:7] == ["None", "0.9"]
+
+
+def test_stream_response(app, monkeypatch):
+    monkeypatch.setattr(job_query, "LINES_PER_CHUNK", 2)
+    lines = list(bed_lines([("chrI:1-100", make_hits())]))
+    expected = "\n".join(lines)
+
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        response = stream_response(iter(lines), mimetype="text/plain")
+        assert response.is_streamed
+        assert "Content-Encoding" not in response.headers
+        assert response.get_data(as_text=True) == expected
+
+        monkeypatch.setenv("GUIDESCAN_GUIDESCAN_EXPORT_GZIP", "true")
+        response = stream_response(iter(lines), mimetype="text/plain")
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(response.get_data()).decode() == expected
+
+    # Clients that do not accept gzip are sent uncompressed responses
+    with app.test_request_context():
+        response = stream_response(iter(lines), mimetype="text/plain")
+        assert response.get_data(as_text=True) == expected
+
+
+@pytest.mark.parametrize("in_result_store", [False, True])
+def test_result_pages(app, monkeypatch, tmp_path, in_result_store):
+    hits = make_hits()
+    stored = {
+        "organism": "sacCer3",
+        "enzyme": "cas9",
+        "queries": {
+            "chrI:1-100": {
+                "region": "chrI:1-100",
+                "total_hits": len(hits),
+                "hits": hits.to_json(),
+            }
+        },
+    }
+    if in_result_store:
+        monkeypatch.setenv("GUIDESCAN_GUIDESCAN_RESULT_STORE_PATH", str(tmp_path))
+        monkeypatch.setenv("GUIDESCAN_GUIDESCAN_RESULT_STORE_THRESHOLD", "0")
+        stored = store_result(stored)
+        assert is_handle(stored)
+    result_cache = job_query.TTLCache(
+        maxsize=2, maxbytes=10**6, sizeof=job_query.decoded_result_nbytes
+    )
+    monkeypatch.setattr(job_query, "result_cache", result_cache)
+    with patch("guidescanpy.flask.blueprints.job_query.tasks_app") as tasks_app:
+        tasks_app.AsyncResult.return_value.result = stored
+        client = app.test_client()
+        pages = [
+            client.get(
+                "/py/job/query/result/dt/J",
+                query_string={
+                    "region": "chrI:1-100",
+                    "order[0][column]": "1",
+                    "columns[1][data]": "specificity",
+                    "order[0][dir]": "desc",
+                    "page": page,
+                    "per_page": 2,
+                },
+            ).json
+            for page in (1, 2)
+        ]
+        # The result is only fetched from the result backend once
+        tasks_app.AsyncResult.assert_called_once_with("J")
+        assert 0 < result_cache.stats()["bytes"] < 10**6
+
+    assert [hit["id"] for page in pages for hit in page["data"]] == ["b", "a", "c"]
+    assert pages[0]["recordsTotal"] == 3
@@ -70,3 +70,31 @@ def test_library_single_pool_structure(
     assert result["results"][0]["pool_number"] == 0
     assert result["results"][0]["controls"] == []
     assert result["results"][0]["essential_genes"] == {}
+
+
+@patch("guidescanpy.flask.blueprints.library.get_control_guides")
+@patch("guidescanpy.flask.blueprints.library.get_essential_genes")
+@patch("guidescanpy.flask.blueprints.library.get_library_info_by_gene")
+def test_library_essential_genes(mock_library_info, mock_essential, mock_controls):
+    mock_library_info.side_effect = mock_library_side_effect
+    mock_essential.return_value = ["CNE1", "RAD51"]
+    mock_controls.return_value = []
+
+    result = library(
+        organism="sacCer3",
+        genes="CNE1\nZWF1",
+        n_pools=2,
+        n_guides=6,
+        frac_essential=1.0,
+    )
+
+    # Guides for all genes are looked up at once
+    mock_library_info.assert_called_once_with(
+        "sacCer3", ["CNE1", "ZWF1", "CNE1", "RAD51", "CNE1", "RAD51"], 6
+    )
+    for pool in result["results"]:
+        assert pool["essential_genes"] == {
+            "CNE1": [{"grna": MOCK_GRNA}],
+            "RAD51": [{"grna": MOCK_GRNA}],
+        }
+    assert result["results"][0]["library"][0][0]["adapter_name"] == "F1-R1"
@@ -0,0 +1,36 @@
+from guidescanpy.flask.core.lru import TTLCache, MISSING
+
+
+def test_ttl_cache_lru():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", None)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # evicts "b", the least recently used entry
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 3, "misses": 1}
+
+
+def test_ttl_cache_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("guidescanpy.flask.core.lru.time.monotonic", lambda: now[0])
+    cache = TTLCache(ttl=60)
+    cache.set("a", 1)
+    now[0] += 59
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is MISSING
+    assert len(cache) == 0
+
+
+def test_ttl_cache_maxbytes():
+    cache = TTLCache(maxsize=10, maxbytes=10, sizeof=len)
+    cache.set("a", "aaaa")
+    cache.set("b", "bbbb")
+    cache.set("c", "cccc")  # evicts "a", to keep the cache within 10 bytes
+    assert cache.get("a") is MISSING
+    cache.set("d", "d" * 11)  # larger than the cache, so not cached
+    assert cache.get("d") is MISSING and cache.get("b") == "bbbb"
+    cache.set("b", "b")
+    assert cache.stats()["bytes"] == 5 and len(cache) == 2
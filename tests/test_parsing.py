@@ -88,3 +88,71 @@ def test_parse_unknown_and_real_genes():
         ("RAD51", "chrV", 349980, 351182),
         ("chrII:5000-8000", "chrII", 5000, 8000),
     ]
+
+
+@pytest.fixture
+def gene_db(empty_db):
+    from guidescanpy.flask import db
+
+    db.insert_chromosome_query(accession="NC_001137.3", name="V", organism="sacCer3")
+    db.insert_chromosome_query(accession="NC_001146.8", name="XIV", organism="sacCer3")
+    for entrez_id, gene_symbol, chromosome, start_pos, end_pos in (
+        (851357, "RAD51", "NC_001137.3", 349980, 351182),
+        (855480, "ZWF1", "NC_001146.8", 196426, 197943),
+        (855480, "MET19", "NC_001146.8", 196426, 197943),
+    ):
+        db.insert_gene_query(
+            entrez_id=entrez_id,
+            gene_symbol=gene_symbol,
+            chromosome=chromosome,
+            sense=True,
+            start_pos=start_pos,
+            end_pos=end_pos,
+        )
+    yield db
+
+
+def test_parse_txt_bulk(gene_db):
+    text = "RAD51\n\nMET19\nUNKNOWNGENE\n851357\nchrII:5,000-8,000\nRAD51\n42"
+    regions = list(region_parser(text, organism="sacCer3"))
+    assert regions == [
+        ("RAD51", "chrV", 349980, 351182),
+        ("MET19", "chrXIV", 196426, 197943),
+        ("RAD51", "chrV", 349980, 351182),
+        ("chrII:5000-8000", "chrII", 5000, 8000),
+        ("RAD51", "chrV", 349980, 351182),
+    ]
+    # Regions resolved in bulk are the same as those resolved one line at a time
+    parser = region_parser(text, organism="sacCer3")
+    assert [
+        region
+        for region in map(parser.parse_line, text.split("\n"))
+        if region is not None
+    ] == regions
+
+
+def test_create_region_queries_chunks(gene_db):
+    regions = ["ZWF1", "855480", "RAD51", "NOPE", "ZWF1"]
+    results = gene_db.create_region_queries("sacCer3", regions, chunk_size=1)
+    assert list(results) == ["ZWF1", "855480", "RAD51"]
+    assert results["ZWF1"]["chromosome_accession"] == "NC_001146.8"
+    assert results["855480"]["entrez_id"] == 855480
+    assert results["RAD51"]["sense"] is True
+
+
+def test_gene_cache(gene_db, app):
+    assert gene_db.create_region_query("sacCer3", "RAD51")["entrez_id"] == 851357
+    assert gene_db.create_region_query("sacCer3", "NOPE") is None
+    assert list(
+        gene_db.create_region_queries("sacCer3", ["NOPE", "RAD51", "ZWF1"])
+    ) == [
+        "RAD51",
+        "ZWF1",
+    ]
+    stats = app.test_client().get("py/info/stats").json["gene-cache"]["sacCer3"]
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 3, 3)
+
+    # Genes are looked up again once they are updated
+    gene_db.invalidate_genes("sacCer3")
+    gene_db.create_region_query("sacCer3", "RAD51")
+    assert gene_db.gene_cache_stats()["sacCer3"]["misses"] == 1
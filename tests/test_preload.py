@@ -0,0 +1,41 @@
+from unittest.mock import patch
+from guidescanpy.flask.core.preload import preload, preload_targets
+
+
+def test_preload_targets(monkeypatch):
+    assert preload_targets() == []
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_PRELOAD", "hg38:cas9, hg38:cpf1,mm10,")
+    assert preload_targets() == [("hg38", "cas9"), ("hg38", "cpf1"), ("mm10", "cas9")]
+
+
+@patch("guidescanpy.flask.core.preload.region_parser")
+@patch("guidescanpy.flask.core.preload.bam_pool")
+@patch("guidescanpy.flask.core.preload.get_exon_index")
+@patch("guidescanpy.flask.core.preload.get_genome_structure")
+def test_preload(patched_fn1, patched_fn2, patched_pool, patched_parser):
+    patched_fn2.side_effect = RuntimeError("no database")
+    # Failures are logged, but do not prevent other organisms from being preloaded
+    preload("hg38:cas9,hg38:cpf1,mm10:cas9")
+    assert [c.args for c in patched_fn1.call_args_list] == [("hg38",), ("mm10",)]
+    assert patched_fn2.call_count == 2
+    assert [c.kwargs for c in patched_pool.alignment_file.call_args_list] == [
+        {"organism": "hg38", "enzyme": "cas9"},
+        {"organism": "hg38", "enzyme": "cpf1"},
+        {"organism": "mm10", "enzyme": "cas9"},
+    ]
+    # Example queries are resolved for each organism/enzyme
+    assert [c.kwargs for c in patched_parser.call_args_list] == [
+        {"organism": "hg38"},
+        {"organism": "hg38"},
+        {"organism": "mm10"},
+    ]
+
+
+@patch("guidescanpy.flask.core.preload.preload")
+def test_preload_worker(patched_preload):
+    from celery.signals import worker_init
+    import guidescanpy.tasks  # noqa: F401
+
+    # However the celery worker is started, data is preloaded before the pool is forked
+    worker_init.send(sender=None)
+    patched_preload.assert_called_once_with()
@@ -1,4 +1,5 @@
 import os
+from unittest.mock import patch
 from flask import json
 from urllib.parse import quote
 
@@ -116,3 +117,62 @@ def test_region_exceed_limit(app):
         os.environ["GUIDESCAN_CELERY_EAGER"] = eager
     if limit is not None:
         os.environ["GUIDESCAN_GUIDESCAN_REGION_SIZE_LIMIT"] = limit
+
+
+class FakeGenomeStructure:
+    def query(self, region, **kwargs):
+        return f"{region['region-name']}:{kwargs['topn']}"
+
+
+def test_query_regions_parallel(monkeypatch):
+    from guidescanpy.flask.blueprints import query
+
+    regions = [
+        {"region-name": f"region{i}", "coords": ("chrI", 1, 1 + 100 * (i % 7))}
+        for i in range(50)
+    ]
+    shards = query.shards(regions, n_shards=8)
+    assert 1 < len(shards) <= 8
+    assert [r for shard in shards for r in shard] == regions
+
+    monkeypatch.setattr(
+        query, "get_genome_structure", lambda organism: FakeGenomeStructure()
+    )
+    sequential = query.query_regions("sacCer3", regions, topn=3)
+    assert sequential == [f"region{i}:3" for i in range(50)]
+
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_QUERY_PARALLELISM", "2")
+    # Regions are queried serially until the pool is started
+    with patch.object(query, "ProcessPoolExecutor") as executor:
+        assert query.query_regions("sacCer3", regions, topn=3) == sequential
+    executor.assert_not_called()
+    query.start_executor()
+    try:
+        assert query._executor is not None
+        assert query.query_regions("sacCer3", regions, topn=3) == sequential
+    finally:
+        query.stop_executor()
+
+
+def test_start_executor_error(monkeypatch, caplog):
+    from guidescanpy.flask.blueprints import query
+
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_QUERY_PARALLELISM", "2")
+    monkeypatch.setattr(
+        query, "get_genome_structure", lambda organism: FakeGenomeStructure()
+    )
+    regions = [{"region-name": f"region{i}"} for i in range(3)]
+    with patch.object(
+        query,
+        "ProcessPoolExecutor",
+        side_effect=AssertionError(
+            "daemonic processes are not allowed to have children"
+        ),
+    ):
+        query.start_executor()
+        # The failure is logged when the pool is started, and regions are queried serially
+        assert query.query_regions("sacCer3", regions, topn=3) == [
+            f"region{i}:3" for i in range(3)
+        ]
+    assert query._executor is None
+    assert caplog.text.count("Unable to query regions in parallel") == 1
@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import time
+import subprocess
+from unittest.mock import MagicMock
+import pytest
+from guidescanpy.flask.core.results import (
+    store_result,
+    load_result,
+    is_handle,
+    prune_results,
+    result_store_path,
+    JobResult,
+)
+
+
+@pytest.fixture
+def result_store(tmp_path, monkeypatch):
+    monkeypatch.setenv(
+        "GUIDESCAN_GUIDESCAN_RESULT_STORE_PATH", str(tmp_path / "results")
+    )
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_RESULT_STORE_THRESHOLD", "100")
+    return tmp_path
+
+
+def test_store_result(result_store):
+    small = {"organism": "sacCer3", "queries": {}}
+    assert store_result(small) is small
+
+    large = {"organism": "sacCer3", "queries": {"chrI": {"hits": list(range(100))}}}
+    handle = store_result(large)
+    assert is_handle(handle) and handle["size"] > 100
+    assert load_result(handle) == large
+    assert load_result(small) is small
+
+    # Results are stored by content
+    assert store_result(dict(large)) == handle
+    assert (
+        len(os.listdir(os.path.join(result_store_path(), handle["result-store"][:2])))
+        == 1
+    )
+
+    async_result = MagicMock(status="SUCCESS", task_id="J", result=handle)
+    job_result = JobResult(async_result)
+    assert job_result.task_id == "J"
+    assert job_result.result == large
+
+
+def test_prune_results(result_store):
+    handle = store_result({"hits": list(range(100))})
+    prune_results(max_age=60, force=True)
+    assert load_result(handle)["hits"][-1] == 99
+
+    filepath = next(
+        os.path.join(dirpath, filename)
+        for dirpath, _, filenames in os.walk(result_store_path())
+        for filename in filenames
+    )
+    an_hour_ago = time.time() - 3600
+    os.utime(filepath, (an_hour_ago, an_hour_ago))
+    prune_results(max_age=60, force=True)
+    with pytest.raises(FileNotFoundError):
+        load_result(handle)
+
+
+def test_result_store_unconfigured(monkeypatch):
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_RESULT_STORE_PATH", "")
+    monkeypatch.setenv("GUIDESCAN_GUIDESCAN_RESULT_STORE_THRESHOLD", "0")
+    large = {"hits": list(range(100))}
+    assert store_result(large) is large
+
+
+def test_result_store_shared(result_store, tmp_path):
+    # Stored by a (worker) process with a cachedir of its own
+    large = {"hits": list(range(100))}
+    env = dict(os.environ, GUIDESCAN_GUIDESCAN_CACHEDIR=str(tmp_path / "worker"))
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            "-c",
+            "import sys, json; from guidescanpy.flask.core.results import store_result; "
+            "print(json.dumps(store_result(json.loads(sys.argv[1]))))",
+            json.dumps(large),
+        ],
+        env=env,
+    )
+    handle = json.loads(output.decode().strip().splitlines()[-1])
+    assert is_handle(handle)
+    assert load_result(handle) == large
@@ -1,4 +1,6 @@
-from guidescanpy.flask.blueprints.sequence import sequence
+import pandas as pd
+from guidescanpy.core.guidescan import CMD_ENUMERATE_COLUMN_DTYPES
+from guidescanpy.flask.blueprints.sequence import sequence, sequence_matches
 
 
 def test_cas9_sequences_sacCer3():
@@ -132,3 +134,34 @@ def test_arbitrary_sequences_sacCer3():
     assert results["matches"]["id_00000000"]["off-target-summary"] == "0:10 | 1:53"
     assert results["matches"]["id_00000001"]["off-target-summary"] == "0:0 | 1:0"
     print(results)
+
+
+def test_sequence_matches(sacCer3_chromosome_names):
+    acc_to_chr = {k: "chr" + v[3:] for k, v in sacCer3_chromosome_names.items()}
+    # (id, sequence, match_chrm, match_position, match_strand, match_distance, specificity)
+    rows = [
+        ("id_00000001", "ACGTNGG", None, None, None, 0, 1.0),
+        ("id_00000000", "ACGTANGG", "NC_001137.3", 100, "+", 0, 0.5),
+        ("id_00000000", "ACGTANGG", "NC_001143.9", 40, "-", 1, 0.5),
+        ("id_00000000", "ACGTANGG", "scaffold_1", 10, "+", 1, 0.5),
+        ("id_00000000", "ACGTANGG", "NC_001133.9", 20, "+", 1, 0.5),
+        ("id_00000000", "ACGTANGG", "NC_001137.3", 300, "+", 0, 0.5),
+    ]
+    columns = ["id", "sequence", "match_chrm", "match_position", "match_strand"]
+    columns += ["match_distance", "specificity"]
+    data = pd.DataFrame(rows, columns=columns).astype(
+        {c: CMD_ENUMERATE_COLUMN_DTYPES[c] for c in columns}
+    )
+
+    matches = sequence_matches(data, acc_to_chr, mismatches=1)
+    assert list(matches) == ["id_00000000", "id_00000001"]
+    match = matches["id_00000000"]
+    assert match["coordinate"] == "chrV:100-107:+"
+    assert match["off-target-summary"] == "0:2 | 1:2"
+    assert match["num-inexact-matches"] == 2
+    assert [o["coordinate"] for o in match["off-targets"][1]] == [
+        "chrXI:40-47:-",
+        "chrI:20-27:+",
+    ]
+    assert matches["id_00000001"]["coordinate"] == "NA"
+    assert matches["id_00000001"]["off-target-summary"] == "0:0 | 1:0"